@@ -88,7 +88,7 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
@@ -148,21 +148,161 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'myapp.authentication.StatelessJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20
 }
 
-# Channels configuration for WebSocket
-CHANNEL_LAYERS = {
+# API requests authenticate with the JWTs issued at login, validated from
+# their claims alone; request.user is a myapp.authentication.ClaimsUser
+SIMPLE_JWT = {
+    'TOKEN_USER_CLASS': 'myapp.authentication.ClaimsUser',
+}
+
+# Seconds a token's User stays cached for ClaimsUser.account (0 disables)
+JWT_USER_CACHE_TTL = int(os.getenv('JWT_USER_CACHE_TTL', 30))
+
+# Seconds between pulls of newly revoked tokens into each process's denylist
+JWT_DENYLIST_SYNC_SECONDS = int(os.getenv('JWT_DENYLIST_SYNC_SECONDS', 30))
+
+# Caches
+# The transport_search alias backs the bus/train search result cache. It is
+# process-local by default; set TRANSPORT_SEARCH_CACHE_URL to a redis:// URL
+# (requires the redis package) to share entries and invalidations across
+# workers.
+TRANSPORT_SEARCH_CACHE_URL = os.getenv('TRANSPORT_SEARCH_CACHE_URL')
+# The oauth_keys alias holds provider signing keys. Point OAUTH_KEYS_CACHE_URL
+# at redis so only one worker fetches a new key set.
+OAUTH_KEYS_CACHE_URL = os.getenv('OAUTH_KEYS_CACHE_URL')
+
+CACHES = {
     'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'transport_search': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': TRANSPORT_SEARCH_CACHE_URL,
+    } if TRANSPORT_SEARCH_CACHE_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'transport-search',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    'oauth_keys': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': OAUTH_KEYS_CACHE_URL,
+    } if OAUTH_KEYS_CACHE_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'oauth-keys',
+    },
+}
+
+# Seconds a cached bus/train search response stays valid
+TRANSPORT_SEARCH_CACHE_TIMEOUT = int(os.getenv('TRANSPORT_SEARCH_CACHE_TIMEOUT', 60))
+
+# Seconds a property's review summary stays cached. Review writes drop it at
+# once in the writing process's cache, and in every worker's when the default
+# cache is shared, so this only bounds staleness of a per-process cache.
+REVIEW_SUMMARY_CACHE_TIMEOUT = int(os.getenv('REVIEW_SUMMARY_CACHE_TIMEOUT', 300))
+
+# Journey planner (myapp.journeys): each process keeps the bus and train
+# timetable in memory and reloads it from the database after
+# JOURNEY_GRAPH_MAX_AGE seconds. Connections wait between
+# JOURNEY_MIN_CONNECTION_MINUTES (the default; requests may ask for more or
+# less) and JOURNEY_MAX_WAIT_HOURS, and itineraries start within
+# JOURNEY_DEPARTURE_WINDOW_HOURS of the requested time.
+JOURNEY_GRAPH_MAX_AGE = int(os.getenv('JOURNEY_GRAPH_MAX_AGE', 300))
+JOURNEY_MIN_CONNECTION_MINUTES = int(os.getenv('JOURNEY_MIN_CONNECTION_MINUTES', 30))
+JOURNEY_MAX_WAIT_HOURS = int(os.getenv('JOURNEY_MAX_WAIT_HOURS', 12))
+JOURNEY_DEPARTURE_WINDOW_HOURS = int(os.getenv('JOURNEY_DEPARTURE_WINDOW_HOURS', 24))
+JOURNEY_MAX_LEGS = int(os.getenv('JOURNEY_MAX_LEGS', 3))
+
+# Translations: entries kept in each process's LRU in front of the
+# TranslationsCache table, the row budget evict_translations trims the table
+# to, and an optional dotted path to a callable(texts, source, target) that
+# translates cache misses. Without one, untranslated text is served as is.
+TRANSLATIONS_LRU_SIZE = int(os.getenv('TRANSLATIONS_LRU_SIZE', 10000))
+TRANSLATIONS_CACHE_MAX_ROWS = int(os.getenv('TRANSLATIONS_CACHE_MAX_ROWS', 200000))
+TRANSLATION_BACKEND = os.getenv('TRANSLATION_BACKEND')
+
+# AI interaction logging (myapp.ai_logs): rows queue in memory, up to
+# AI_LOG_QUEUE_SIZE, and a background thread writes them in batches of
+# AI_LOG_BATCH_SIZE at least every AI_LOG_FLUSH_SECONDS. A full queue blocks
+# the caller for at most AI_LOG_PUT_TIMEOUT seconds, then drops the entry.
+AI_LOG_QUEUE_SIZE = int(os.getenv('AI_LOG_QUEUE_SIZE', 10000))
+AI_LOG_BATCH_SIZE = int(os.getenv('AI_LOG_BATCH_SIZE', 200))
+AI_LOG_FLUSH_SECONDS = float(os.getenv('AI_LOG_FLUSH_SECONDS', 1.0))
+AI_LOG_PUT_TIMEOUT = float(os.getenv('AI_LOG_PUT_TIMEOUT', 0.01))
+
+# Retention: archive_old_rows moves AILog and Transaction rows older than
+# these many days into gzip'd JSONL under ARCHIVE_ROOT, one file per table
+# per day, keeping a RetentionSummary row for each day
+ARCHIVE_ROOT = Path(os.getenv('ARCHIVE_ROOT', BASE_DIR / 'archive'))
+AI_LOG_RETENTION_DAYS = int(os.getenv('AI_LOG_RETENTION_DAYS', 90))
+TRANSACTION_RETENTION_DAYS = int(os.getenv('TRANSACTION_RETENTION_DAYS', 730))
+
+# Minutes an unpaid bus seat hold lasts before its seats are released
+BUS_SEAT_HOLD_MINUTES = int(os.getenv('BUS_SEAT_HOLD_MINUTES', 10))
+
+# Google sign-in: ID tokens must be issued for this client and signed by a
+# key from GOOGLE_JWKS_URL, or from the JWKS file GOOGLE_JWKS_FILE if set
+GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID', '')
+GOOGLE_JWKS_URL = os.getenv('GOOGLE_JWKS_URL', 'https://www.googleapis.com/oauth2/v3/certs')
+GOOGLE_JWKS_FILE = os.getenv('GOOGLE_JWKS_FILE')
+
+# Channels configuration for WebSocket
+# CHANNEL_LAYER picks the backend. 'memory' only reaches sockets in the same
+# process, so running more than one ASGI worker needs 'redis' (channels_redis),
+# 'postgres' (channels_postgres, LISTEN/NOTIFY) or, on a single machine,
+# 'broker' (myapp.channel_layers, served by `manage.py runchannelbroker`).
+CHANNEL_LAYER = os.getenv('CHANNEL_LAYER', 'memory')
+
+_CHANNEL_LAYER_BACKENDS = {
+    'memory': {
         'BACKEND': 'channels.layers.InMemoryChannelLayer'
-    }
+    },
+    'redis': {
+        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'CONFIG': {
+            'hosts': [os.getenv('CHANNEL_REDIS_URL', 'redis://127.0.0.1:6379/1')],
+        },
+    },
+    'postgres': {
+        'BACKEND': 'channels_postgres.core.PostgresChannelLayer',
+        'CONFIG': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('CHANNEL_POSTGRES_NAME', 'villagestay_channels'),
+            'USER': os.getenv('CHANNEL_POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.getenv('CHANNEL_POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('CHANNEL_POSTGRES_HOST', '127.0.0.1'),
+            'PORT': os.getenv('CHANNEL_POSTGRES_PORT', '5432'),
+        },
+    },
+    'broker': {
+        'BACKEND': 'myapp.channel_layers.BrokerChannelLayer',
+        'CONFIG': {
+            'address': os.getenv('CHANNEL_BROKER_ADDRESS', '127.0.0.1:9736'),
+            'authkey': os.getenv('CHANNEL_BROKER_AUTHKEY', 'villagestay-dev'),
+        },
+    },
+}
+
+CHANNEL_LAYERS = {
+    'default': _CHANNEL_LAYER_BACKENDS[CHANNEL_LAYER]
 }
 
 
 # Razorpay Test Keys
 RAZORPAY_KEY_ID = os.getenv('RAZORPAY_KEY_ID')
 RAZORPAY_KEY_SECRET = os.getenv('RAZORPAY_KEY_SECRET')
+# Signs POST /api/webhooks/razorpay/ callbacks; without it they are refused
+RAZORPAY_WEBHOOK_SECRET = os.getenv('RAZORPAY_WEBHOOK_SECRET')
+
+# Webhook inbox (myapp.webhooks): events are hashed by booking into
+# WEBHOOK_PARTITIONS partitions that process_webhooks workers divide among
+# themselves. A failing event is retried after WEBHOOK_RETRY_BASE_SECONDS,
+# doubling each time, and failed for good after WEBHOOK_MAX_ATTEMPTS tries.
+WEBHOOK_PARTITIONS = int(os.getenv('WEBHOOK_PARTITIONS', 16))
+WEBHOOK_RETRY_BASE_SECONDS = int(os.getenv('WEBHOOK_RETRY_BASE_SECONDS', 30))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 8))
@@ -0,0 +1,207 @@
+import atexit
+import logging
+import math
+import queue
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, OperationalError, close_old_connections, connections, transaction
+from django.utils import timezone
+
+from .models import AILatencyRollup, AILog
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets grow by GAMMA from MIN_TIME seconds, so a reported
+# percentile is within about 1% of the exact one
+MIN_TIME = 0.001
+GAMMA = 1.02
+# Tries per batch before it is dropped as failed
+WRITE_ATTEMPTS = 3
+
+
+def bucket_of(seconds):
+    if seconds <= MIN_TIME:
+        return 0
+    return math.ceil(math.log(seconds / MIN_TIME, GAMMA))
+
+
+def bucket_value(index):
+    """Representative time of a bucket: between its bounds, in relative terms"""
+    if index == 0:
+        return MIN_TIME
+    return MIN_TIME * GAMMA ** index * 2 / (1 + GAMMA)
+
+
+def hour_of(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def record_latencies(entries):
+    """Merge the processing times of written AILog rows into the hourly rollups"""
+    by_hour = defaultdict(list)
+    for entry in entries:
+        by_hour[hour_of(entry.created_at)].append(entry.processing_time)
+    for hour, times in by_hour.items():
+        with transaction.atomic():
+            AILatencyRollup.objects.get_or_create(hour=hour)
+            rollup = AILatencyRollup.objects.select_for_update().get(hour=hour)
+            buckets = Counter({int(index): count for index, count in rollup.buckets.items()})
+            buckets.update(bucket_of(seconds) for seconds in times)
+            rollup.buckets = {str(index): count for index, count in buckets.items()}
+            rollup.count += len(times)
+            rollup.total += sum(times)
+            rollup.max_time = max(rollup.max_time, *times)
+            rollup.save()
+
+
+def latency_report(hours=24, now=None):
+    """p50/p99 of AILog.processing_time over the last ``hours`` hours, from
+    the hourly rollups (whole hours, including the current one)"""
+    now = now or timezone.now()
+    rollups = AILatencyRollup.objects.filter(
+        hour__gt=hour_of(now) - timedelta(hours=hours), hour__lte=now
+    )
+    buckets, count, total, max_time = Counter(), 0, 0.0, 0.0
+    for rollup in rollups:
+        buckets.update({int(index): n for index, n in rollup.buckets.items()})
+        count += rollup.count
+        total += rollup.total
+        max_time = max(max_time, rollup.max_time)
+
+    def percentile(fraction):
+        rank, seen = max(1, math.ceil(fraction * count)), 0
+        for index in sorted(buckets):
+            seen += buckets[index]
+            if seen >= rank:
+                return min(bucket_value(index), max_time)
+
+    return {
+        'hours': hours,
+        'count': count,
+        'mean': total / count if count else None,
+        'p50': percentile(0.5) if count else None,
+        'p99': percentile(0.99) if count else None,
+        'max': max_time if count else None,
+    }
+
+
+class AILogBuffer:
+    """Queues AILog rows in memory for a background writer thread.
+
+    log() returns as soon as the row is queued. The writer bulk_creates
+    batches of ``batch_size``, or whatever has queued after
+    ``flush_interval`` seconds, and folds their processing times into the
+    latency rollups. When the queue is full, log() waits up to
+    ``put_timeout`` for room and then drops the row, counting it.
+    close() writes out what is left; it runs at interpreter exit.
+    """
+
+    def __init__(self, max_size=None, batch_size=None, flush_interval=None, put_timeout=None, autostart=True):
+        self.batch_size = batch_size or settings.AI_LOG_BATCH_SIZE
+        self.flush_interval = settings.AI_LOG_FLUSH_SECONDS if flush_interval is None else flush_interval
+        self.put_timeout = settings.AI_LOG_PUT_TIMEOUT if put_timeout is None else put_timeout
+        self.autostart = autostart
+        self._queue = queue.Queue(max_size or settings.AI_LOG_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._stats = Counter()
+
+    def log(self, **fields):
+        """Queue one AILog row; False if it was dropped"""
+        fields.setdefault('created_at', timezone.now())
+        try:
+            self._queue.put(AILog(**fields), timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self._stats['dropped'] += 1
+            return False
+        with self._lock:
+            self._stats['queued'] += 1
+        if self.autostart:
+            self.start()
+        return True
+
+    def start(self):
+        with self._lock:
+            if self._stopping.is_set() or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run, name='ailog-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stopping.is_set():
+                batch = self._take(self.flush_interval)
+                if batch:
+                    close_old_connections()
+                    self._write(batch)
+        finally:
+            connections.close_all()
+
+    def _take(self, wait):
+        """Up to batch_size rows, waiting at most ``wait`` seconds for them"""
+        deadline = time.monotonic() + wait
+        batch = []
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        key = 'failed'
+        with self._write_lock:
+            for attempt in range(WRITE_ATTEMPTS):
+                try:
+                    with transaction.atomic():
+                        AILog.objects.bulk_create(batch)
+                        record_latencies(batch)
+                except OperationalError:
+                    # Locks and dropped connections; worth another try
+                    if attempt == WRITE_ATTEMPTS - 1:
+                        logger.exception('Dropped %d AI log rows', len(batch))
+                    else:
+                        time.sleep(0.05 * 2 ** attempt)
+                except DatabaseError:
+                    logger.exception('Dropped %d AI log rows', len(batch))
+                    break
+                else:
+                    key = 'written'
+                    break
+        with self._lock:
+            self._stats[key] += len(batch)
+            self._stats['batches'] += 1
+
+    def flush(self):
+        """Write everything queued so far from the calling thread"""
+        while batch := self._take(0):
+            self._write(batch)
+
+    def close(self, timeout=5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            stats = {name: self._stats[name] for name in ('queued', 'written', 'dropped', 'failed', 'batches')}
+        stats['pending'] = self._queue.qsize()
+        return stats
+
+
+ai_log_buffer = AILogBuffer()
+atexit.register(ai_log_buffer.close)
+
+
+def log_ai_interaction(**fields):
+    """Record an AI interaction without waiting for the database"""
+    return ai_log_buffer.log(**fields)
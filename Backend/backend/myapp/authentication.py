@@ -0,0 +1,169 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from rest_framework.permissions import BasePermission
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import RevokedToken, User
+
+# Full rebuilds drop expired entries from the filter
+REBUILD_INTERVAL = 3600
+
+
+def issue_tokens(user):
+    """Access and refresh tokens for a User, carrying the claims requests need"""
+    refresh = RefreshToken.for_user(user)
+    refresh['name'] = user.name or ''
+    refresh['preference'] = user.preference
+    return {'token': str(refresh.access_token), 'refresh': str(refresh)}
+
+
+def user_cache_key(user_id):
+    return f'jwt-user:{user_id}'
+
+
+def cached_user(user_id):
+    """The User for a token, kept for JWT_USER_CACHE_TTL seconds (0 disables)"""
+    ttl = settings.JWT_USER_CACHE_TTL
+    user = cache.get(user_cache_key(user_id)) if ttl else None
+    if user is None:
+        user = User.objects.filter(pk=user_id).first()
+        if user is not None and ttl:
+            cache.set(user_cache_key(user_id), user, ttl)
+    return user
+
+
+class ClaimsUser(TokenUser):
+    """request.user for a JWT: built from its claims, with no query.
+
+    ``account`` loads the full User through the short-lived user cache for
+    the views that need more than the claims.
+    """
+
+    @cached_property
+    def name(self):
+        return self.token.get('name', '')
+
+    @cached_property
+    def preference(self):
+        return self.token.get('preference', '')
+
+    @cached_property
+    def account(self):
+        return cached_user(self.id)
+
+
+class BloomFilter:
+    """Fixed-size set of strings with no false negatives"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.capacity = capacity
+        self.count = 0
+
+    def positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self.positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(value))
+
+
+class TokenDenylist:
+    """Revoked token ids, checked in memory on every request.
+
+    A Bloom filter of the unexpired RevokedToken rows answers "not revoked"
+    without a query; only tokens it flags are confirmed against the table.
+    New rows are pulled in every JWT_DENYLIST_SYNC_SECONDS, so a token
+    revoked in another process stops working within that interval.
+    """
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._filter = BloomFilter(self.capacity)
+        self._last_id = 0
+        self._synced_at = self._rebuilt_at = 0.0
+
+    def is_revoked(self, jti):
+        if not jti:
+            return False
+        self.sync()
+        if jti not in self._filter:
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def sync(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._synced_at < settings.JWT_DENYLIST_SYNC_SECONDS:
+            return
+        with self._lock:
+            if not force and now - self._synced_at < settings.JWT_DENYLIST_SYNC_SECONDS:
+                return  # Another thread synced while we waited
+            rows = RevokedToken.objects.filter(expires_at__gt=datetime.now(timezone.utc))
+            if now - self._rebuilt_at >= REBUILD_INTERVAL or self._filter.count >= self._filter.capacity:
+                entries = list(rows.values_list('id', 'jti'))
+                denylist = BloomFilter(max(self.capacity, 2 * len(entries)))
+                self._rebuilt_at = now
+            else:
+                entries = list(rows.filter(id__gt=self._last_id).values_list('id', 'jti'))
+                denylist = self._filter
+            for row_id, jti in entries:
+                denylist.add(jti)
+                self._last_id = max(self._last_id, row_id)
+            self._filter = denylist
+            self._synced_at = now
+
+    def revoke(self, token):
+        """Deny a validated token until it expires"""
+        expires_at = datetime.fromtimestamp(token['exp'], timezone.utc)
+        RevokedToken.objects.filter(expires_at__lte=datetime.now(timezone.utc)).delete()
+        RevokedToken.objects.get_or_create(jti=token['jti'], defaults={'expires_at': expires_at})
+        with self._lock:
+            self._filter.add(token['jti'])
+
+
+denylist = TokenDenylist()
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    """Bearer JWT authentication from the token's signature and claims.
+
+    Valid tokens cost no query: the user is a ClaimsUser and revocation
+    is checked against the in-memory denylist.
+    """
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if denylist.is_revoked(token.get('jti')):
+            raise InvalidToken('Token has been revoked')
+        return token
+
+
+class IsAccountUser(BasePermission):
+    """Django auth accounts only; bookings reference AUTH_USER_MODEL rows,
+    which a JWT's ClaimsUser does not have"""
+
+    def has_permission(self, request, view):
+        return isinstance(request.user, get_user_model())
@@ -0,0 +1,133 @@
+import hashlib
+import json
+from datetime import date, timedelta
+
+from django.db.models import Count, Max
+from django.http import HttpResponseNotModified, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.exceptions import ValidationError
+
+from .models import PropertyAvailability
+
+DEFAULT_DAYS = 90
+MAX_DAYS = 731
+# Rows fetched per round trip while streaming
+FETCH_SIZE = 2000
+
+
+def parse_calendar_range(start, end):
+    """[start, end) from query params; defaults to the next DEFAULT_DAYS days"""
+    try:
+        start = date.fromisoformat(start) if start else timezone.localdate()
+        end = date.fromisoformat(end) if end else start + timedelta(days=DEFAULT_DAYS)
+    except ValueError:
+        raise ValidationError({'detail': 'Dates must be in YYYY-MM-DD format'})
+    if end <= start:
+        raise ValidationError({'detail': 'end must be after start'})
+    if (end - start).days > MAX_DAYS:
+        raise ValidationError({'detail': f'A calendar spans at most {MAX_DAYS} days'})
+    return start, end
+
+
+def calendar_spans(rows):
+    """Run-length encode (date, is_available, base_price, minimum_stay) rows
+    in date order: consecutive dates with equal values become one span"""
+    span = None
+    for day, available, price, minimum_stay in rows:
+        values = (available, price, minimum_stay)
+        if span is not None and span['values'] == values and day == span['start'] + timedelta(days=span['nights']):
+            span['nights'] += 1
+            continue
+        if span is not None:
+            yield span
+        span = {'start': day, 'nights': 1, 'values': values}
+    if span is not None:
+        yield span
+
+
+def span_json(span):
+    available, price, minimum_stay = span['values']
+    return json.dumps({
+        'start': span['start'].isoformat(),
+        'nights': span['nights'],
+        'available': available,
+        'price': str(price),
+        'minimum_stay': minimum_stay,
+    }, separators=(',', ':'))
+
+
+def calendar_response(request, property_id, start, end):
+    """Streamed, run-length encoded calendar with an ETag.
+
+    The ETag covers the range, its row count and newest updated_at, so
+    edits, inserts and deletes all change it; a matching If-None-Match
+    gets a 304 after one aggregate query.
+    """
+    rows = PropertyAvailability.objects.filter(property_id=property_id, date__gte=start, date__lt=end)
+    version = rows.aggregate(count=Count('pk'), updated=Max('updated_at'))
+    stamp = version['updated'].isoformat() if version['updated'] else ''
+    digest = hashlib.sha1(f"{property_id}:{start}:{end}:{version['count']}:{stamp}".encode()).hexdigest()
+    etag = quote_etag(digest)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    # If-None-Match compares weakly
+    if if_none_match and {etag, '*'} & {tag.removeprefix('W/') for tag in parse_etags(if_none_match)}:
+        return HttpResponseNotModified(headers=headers)
+
+    def body():
+        yield f'{{"property":{property_id},"start":"{start}","end":"{end}","spans":['
+        values = (
+            rows.order_by('date')
+            .values_list('date', 'is_available', 'base_price', 'minimum_stay')
+            .iterator(chunk_size=FETCH_SIZE)
+        )
+        for n, span in enumerate(calendar_spans(values)):
+            yield (',' if n else '') + span_json(span)
+        yield ']}'
+
+    return StreamingHttpResponse(body(), content_type='application/json', headers=headers)
+
+
+def upsert_calendar(property_id, ranges):
+    """Write calendar ranges for one property; later ranges win where they overlap.
+
+    Rows that would not change are skipped, and the rest go out as
+    INSERT ... ON CONFLICT (property, date) DO UPDATE. Runs in the
+    caller's transaction. Returns spans of created and updated nights and
+    the count of nights already as requested.
+    """
+    wanted = {}
+    for span in ranges:
+        values = (span['available'], span['price'], span['minimum_stay'])
+        for n in range((span['end'] - span['start']).days):
+            wanted[span['start'] + timedelta(days=n)] = values
+    existing = {
+        day: (available, price, minimum_stay)
+        for day, available, price, minimum_stay in PropertyAvailability.objects.filter(
+            property_id=property_id, date__gte=min(wanted), date__lte=max(wanted)
+        ).values_list('date', 'is_available', 'base_price', 'minimum_stay')
+    }
+    created = sorted(day for day in wanted if day not in existing)
+    updated = sorted(day for day in wanted if day in existing and existing[day] != wanted[day])
+    PropertyAvailability.objects.bulk_create(
+        [
+            PropertyAvailability(
+                property_id=property_id, date=day, is_available=wanted[day][0],
+                base_price=wanted[day][1], minimum_stay=wanted[day][2],
+            )
+            for day in sorted(created + updated)
+        ],
+        update_conflicts=True,
+        unique_fields=['property', 'date'],
+        update_fields=['is_available', 'base_price', 'minimum_stay', 'updated_at'],
+    )
+
+    def spans(days):
+        return [json.loads(span_json(span)) for span in calendar_spans((day, *wanted[day]) for day in days)]
+
+    return {
+        'created': spans(created),
+        'updated': spans(updated),
+        'unchanged': len(wanted) - len(created) - len(updated),
+    }
@@ -0,0 +1,44 @@
+from django.apps import apps
+
+from .models import PlaceKeyMixin, Train
+
+
+def place_key_models():
+    return [model for model in apps.get_app_config('myapp').get_models() if issubclass(model, PlaceKeyMixin)]
+
+
+def rewrite(queryset, fields, compute, batch_size=500):
+    """Recompute ``fields`` of every row in pk order with compute(row) and
+    write back, with bulk_update, only the rows that change; returns how many"""
+    updated, batch = 0, []
+    for row in queryset.order_by('pk').iterator(chunk_size=batch_size):
+        before = [getattr(row, field) for field in fields]
+        compute(row)
+        if [getattr(row, field) for field in fields] != before:
+            batch.append(row)
+        if len(batch) >= batch_size:
+            updated += queryset.model.objects.bulk_update(batch, fields)
+            batch = []
+    if batch:
+        updated += queryset.model.objects.bulk_update(batch, fields)
+    return updated
+
+
+def backfill_place_keys(batch_size=500):
+    """Fill in the *_key columns of rows written without save(), e.g. by
+    bulk_create or before the columns existed; returns {model name: rows updated}"""
+    updated = {}
+    for model in place_key_models():
+        sources, keys = list(model.place_key_fields), list(model.place_key_fields.values())
+        updated[model.__name__] = rewrite(
+            model.objects.only('pk', *sources, *keys), keys, model.set_place_keys, batch_size
+        )
+    return updated
+
+
+def backfill_running_days(batch_size=500):
+    """Fill in Train.running_days_mask the same way; returns rows updated"""
+    return rewrite(
+        Train.objects.only('pk', 'running_days', 'running_days_mask'), ['running_days_mask'],
+        Train.set_running_days_mask, batch_size,
+    )
@@ -0,0 +1,228 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import deque
+from functools import partial
+from multiprocessing.managers import BaseManager
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+
+class Broker:
+    """Channel and group state shared by every worker using BrokerChannelLayer.
+
+    Lives in the broker process; workers call it through a multiprocessing
+    manager proxy. Messages are queued per non-local channel name, so one
+    long-poll per worker drains every socket channel of that worker.
+    """
+
+    def __init__(self, expiry=60, group_expiry=86400, capacity=100):
+        self.expiry = expiry
+        self.group_expiry = group_expiry
+        self.capacity = capacity
+        self._ready = threading.Condition()
+        self._queues = {}  # non-local name -> deque of (expires, channel, message)
+        self._depth = {}  # channel -> queued message count
+        self._groups = {}  # group -> {channel: joined at}
+
+    @staticmethod
+    def non_local_name(channel):
+        return channel[:channel.index('!') + 1] if '!' in channel else channel
+
+    def send(self, channel, message):
+        with self._ready:
+            return self._send(channel, message)
+
+    def _send(self, channel, message):
+        if self._depth.get(channel, 0) >= self.capacity:
+            return False
+        queue = self._queues.setdefault(self.non_local_name(channel), deque())
+        queue.append((time.time() + self.expiry, channel, message))
+        self._depth[channel] = self._depth.get(channel, 0) + 1
+        self._ready.notify_all()
+        return True
+
+    def receive(self, name, timeout, limit=100):
+        """Wait up to timeout for messages on name; returns [(channel, message)]"""
+        deadline = time.time() + timeout
+        with self._ready:
+            while True:
+                queue = self._queues.get(name)
+                now = time.time()
+                while queue and queue[0][0] < now:
+                    _, channel, _ = queue.popleft()
+                    self._dequeued(channel)
+                if queue:
+                    batch = []
+                    while queue and len(batch) < limit:
+                        _, channel, message = queue.popleft()
+                        self._dequeued(channel)
+                        batch.append((channel, message))
+                    return batch
+                if now >= deadline:
+                    return []
+                self._ready.wait(deadline - now)
+
+    def _dequeued(self, channel):
+        self._depth[channel] -= 1
+        if not self._depth[channel]:
+            del self._depth[channel]
+
+    def group_add(self, group, channel):
+        with self._ready:
+            self._groups.setdefault(group, {})[channel] = time.time()
+
+    def group_discard(self, group, channel):
+        with self._ready:
+            members = self._groups.get(group)
+            if members is not None:
+                members.pop(channel, None)
+                if not members:
+                    del self._groups[group]
+
+    def group_send(self, group, message):
+        with self._ready:
+            members = self._groups.get(group, {})
+            cutoff = time.time() - self.group_expiry
+            for channel, joined in list(members.items()):
+                if joined < cutoff:
+                    del members[channel]
+                else:
+                    # Full channels drop group messages, as in other layers
+                    self._send(channel, message)
+
+    def flush(self):
+        with self._ready:
+            self._queues.clear()
+            self._depth.clear()
+            self._groups.clear()
+
+
+_broker = None
+
+
+def _shared_broker():
+    global _broker
+    if _broker is None:
+        _broker = Broker()
+    return _broker
+
+
+class BrokerManager(BaseManager):
+    pass
+
+
+BrokerManager.register('broker', callable=_shared_broker)
+
+
+def parse_address(address):
+    if isinstance(address, str):
+        host, _, port = address.rpartition(':')
+        return host or '127.0.0.1', int(port)
+    return tuple(address)
+
+
+def start_broker(address='127.0.0.1:0', authkey='villagestay-dev'):
+    """Start a broker in a child process; returns the running manager"""
+    manager = BrokerManager(address=parse_address(address), authkey=authkey.encode())
+    manager.start()
+    return manager
+
+
+def serve_broker(address='127.0.0.1:9736', authkey='villagestay-dev'):
+    """Run a broker in the current process until interrupted"""
+    manager = BrokerManager(address=parse_address(address), authkey=authkey.encode())
+    manager.get_server().serve_forever()
+
+
+class BrokerChannelLayer(BaseChannelLayer):
+    """Cross-process channel layer backed by a local Broker process.
+
+    A dependency-free stand-in for Redis when running several ASGI workers on
+    one machine (development, the multi-worker harness). Not meant for
+    multi-host production use.
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, address='127.0.0.1:9736', authkey='villagestay-dev',
+                 expiry=60, capacity=100, channel_capacity=None, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.address = parse_address(address)
+        self.authkey = authkey.encode()
+        self.client_prefix = f'specific.{uuid.uuid4().hex[:12]}!'
+        self._broker = None
+        self._connect_lock = threading.Lock()
+        self._local_queues = {}
+        self._receiver = None
+
+    @property
+    def broker(self):
+        with self._connect_lock:
+            if self._broker is None:
+                manager = BrokerManager(address=self.address, authkey=self.authkey)
+                manager.connect()
+                self._broker = manager.broker()
+            return self._broker
+
+    async def _call(self, method, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(getattr(self.broker, method), *args))
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        if not await self._call('send', channel, message):
+            raise ChannelFull(channel)
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel)
+        if '!' not in channel:
+            while True:
+                batch = await self._call('receive', channel, 1.0, 1)
+                if batch:
+                    return batch[0][1]
+
+        if self._receiver is None or self._receiver.done():
+            self._receiver = asyncio.ensure_future(self._receive_loop())
+        queue = self._local_queues.setdefault(channel, asyncio.Queue())
+        try:
+            return await queue.get()
+        finally:
+            if queue.empty() and self._local_queues.get(channel) is queue:
+                del self._local_queues[channel]
+
+    async def _receive_loop(self):
+        """Drain every specific channel of this process with one long-poll"""
+        while True:
+            batch = await self._call('receive', self.client_prefix, 1.0, 100)
+            for channel, message in batch:
+                self._local_queues.setdefault(channel, asyncio.Queue()).put_nowait(message)
+
+    async def new_channel(self, prefix='specific.'):
+        return f'{self.client_prefix}{uuid.uuid4().hex}'
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        await self._call('group_add', group, channel)
+
+    async def group_discard(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        await self._call('group_discard', group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        assert self.valid_group_name(group), 'Group name not valid'
+        await self._call('group_send', group, message)
+
+    async def flush(self):
+        await self._call('flush')
+
+    async def close(self):
+        if self._receiver is not None:
+            self._receiver.cancel()
+            self._receiver = None
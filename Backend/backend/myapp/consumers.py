@@ -1,21 +1,34 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import Property, Bus, Train, Homestay
-from .serializers import PropertySerializer, BusSerializer, TrainSerializer, HomestaySerializer
+from .realtime import SUBSCRIPTIONS, InvalidFilters, diff_message, local_diffs, registry
 
 class RealTimeDataConsumer(AsyncWebsocketConsumer):
+    """Streams filtered listings over a WebSocket.
+
+    A subscribe message joins the group named by the hash of its normalized
+    filters and answers with a snapshot tagged with the group's version.
+    After that the socket only receives diffs (added, changed and removed
+    rows) published from model signals. A client that sees a gap in the
+    version numbers sends ``resync`` to get a fresh snapshot.
+
+    Model writes arrive once per worker on the kind's changes group, whose
+    only local member is the oldest socket subscribed to that kind. That
+    leader computes the diffs for all of this worker's filter groups.
+    """
+
     async def connect(self):
+        self.subscriptions = {}  # kind -> (group, normalized filters)
         await self.accept()
-        await self.channel_layer.group_add("real_time_updates", self.channel_name)
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard("real_time_updates", self.channel_name)
+        for kind in list(getattr(self, 'subscriptions', {})):
+            await self.unsubscribe(kind)
 
     async def receive(self, text_data):
         data = json.loads(text_data)
         message_type = data.get('type')
-        
+
         if message_type == 'subscribe_properties':
             await self.subscribe_to_properties(data)
         elif message_type == 'subscribe_buses':
@@ -24,102 +37,110 @@ class RealTimeDataConsumer(AsyncWebsocketConsumer):
             await self.subscribe_to_trains(data)
         elif message_type == 'subscribe_homestays':
             await self.subscribe_to_homestays(data)
+        elif message_type == 'unsubscribe' and data.get('kind') in self.subscriptions:
+            await self.unsubscribe(data['kind'])
+            await self.send(text_data=json.dumps({'type': 'unsubscribed', 'kind': data['kind']}))
+        elif message_type == 'resync' and data.get('kind') in self.subscriptions:
+            await self.send_snapshot(data['kind'])
 
     async def subscribe_to_properties(self, data):
-        filters = data.get('filters', {})
-        properties = await self.get_properties(filters)
-        await self.send(text_data=json.dumps({
-            'type': 'properties_update',
-            'data': properties
-        }))
+        await self.subscribe('properties', data.get('filters', {}))
 
     async def subscribe_to_buses(self, data):
-        filters = data.get('filters', {})
-        buses = await self.get_buses(filters)
-        await self.send(text_data=json.dumps({
-            'type': 'buses_update',
-            'data': buses
-        }))
+        await self.subscribe('buses', data.get('filters', {}))
 
     async def subscribe_to_trains(self, data):
-        filters = data.get('filters', {})
-        trains = await self.get_trains(filters)
-        await self.send(text_data=json.dumps({
-            'type': 'trains_update',
-            'data': trains
-        }))
+        await self.subscribe('trains', data.get('filters', {}))
 
     async def subscribe_to_homestays(self, data):
-        filters = data.get('filters', {})
-        homestays = await self.get_homestays(filters)
+        await self.subscribe('homestays', data.get('filters', {}))
+
+    async def subscribe(self, kind, filters):
+        try:
+            normalized = SUBSCRIPTIONS[kind].normalize(filters)
+        except InvalidFilters as e:
+            await self.send(text_data=json.dumps({'type': 'error', 'kind': kind, 'error': str(e)}))
+            return
+
+        # One live subscription per kind: a new filter set replaces the old one
+        if kind in self.subscriptions:
+            await self.unsubscribe(kind)
+        group, leader = registry.add(kind, normalized, self.channel_name)
+        self.subscriptions[kind] = (group, normalized)
+        await self.channel_layer.group_add(group, self.channel_name)
+        if leader:
+            await self.channel_layer.group_add(SUBSCRIPTIONS[kind].changes_group, self.channel_name)
+        await self.send_snapshot(kind)
+
+    async def unsubscribe(self, kind):
+        group, _ = self.subscriptions.pop(kind)
+        await self.channel_layer.group_discard(group, self.channel_name)
+        was_leader, successor = registry.discard(kind, group, self.channel_name)
+        if was_leader:
+            changes_group = SUBSCRIPTIONS[kind].changes_group
+            # Hand over before leaving so no change announcement is dropped
+            if successor:
+                await self.channel_layer.group_add(changes_group, successor)
+            await self.channel_layer.group_discard(changes_group, self.channel_name)
+
+    async def send_snapshot(self, kind):
+        group, normalized = self.subscriptions[kind]
+        # Read the version first: a diff racing the snapshot query is then
+        # re-applied by the client rather than lost
+        version = registry.version(group)
+        rows = await self.get_snapshot(kind, normalized)
         await self.send(text_data=json.dumps({
-            'type': 'homestays_update',
-            'data': homestays
+            'type': f'{kind}_update',
+            'version': version,
+            'data': rows
         }))
 
+    @database_sync_to_async
+    def get_snapshot(self, kind, normalized):
+        return SUBSCRIPTIONS[kind].snapshot(normalized)
+
     @database_sync_to_async
     def get_properties(self, filters):
-        queryset = Property.objects.filter(is_active=True)
-        
-        if filters.get('city'):
-            queryset = queryset.filter(city__icontains=filters['city'])
-        if filters.get('state'):
-            queryset = queryset.filter(state__icontains=filters['state'])
-        if filters.get('type'):
-            queryset = queryset.filter(type=filters['type'])
-        if filters.get('min_price'):
-            queryset = queryset.filter(price_per_night__gte=filters['min_price'])
-        if filters.get('max_price'):
-            queryset = queryset.filter(price_per_night__lte=filters['max_price'])
-        
-        serializer = PropertySerializer(queryset[:50], many=True)
-        return serializer.data
+        subscription = SUBSCRIPTIONS['properties']
+        return subscription.snapshot(subscription.normalize(filters))
 
     @database_sync_to_async
     def get_buses(self, filters):
-        queryset = Bus.objects.all()
-        
-        if filters.get('from_city'):
-            queryset = queryset.filter(from_city__icontains=filters['from_city'])
-        if filters.get('to_city'):
-            queryset = queryset.filter(to_city__icontains=filters['to_city'])
-        if filters.get('seat_type'):
-            queryset = queryset.filter(seat_type=filters['seat_type'])
-        
-        serializer = BusSerializer(queryset[:50], many=True)
-        return serializer.data
+        subscription = SUBSCRIPTIONS['buses']
+        return subscription.snapshot(subscription.normalize(filters))
 
     @database_sync_to_async
     def get_trains(self, filters):
-        queryset = Train.objects.all()
-        
-        if filters.get('from_station'):
-            queryset = queryset.filter(from_station__icontains=filters['from_station'])
-        if filters.get('to_station'):
-            queryset = queryset.filter(to_station__icontains=filters['to_station'])
-        
-        serializer = TrainSerializer(queryset[:50], many=True)
-        return serializer.data
+        subscription = SUBSCRIPTIONS['trains']
+        return subscription.snapshot(subscription.normalize(filters))
 
     @database_sync_to_async
     def get_homestays(self, filters):
-        queryset = Homestay.objects.filter(is_active=True)
-        
-        if filters.get('city'):
-            queryset = queryset.filter(city__icontains=filters['city'])
-        if filters.get('country'):
-            queryset = queryset.filter(country__icontains=filters['country'])
-        if filters.get('min_price'):
-            queryset = queryset.filter(price_per_night__gte=filters['min_price'])
-        if filters.get('max_price'):
-            queryset = queryset.filter(price_per_night__lte=filters['max_price'])
-        
-        serializer = HomestaySerializer(queryset[:50], many=True)
-        return serializer.data
-
-    async def data_update(self, event):
-        """Send data updates to WebSocket"""
+        subscription = SUBSCRIPTIONS['homestays']
+        return subscription.snapshot(subscription.normalize(filters))
+
+    async def realtime_change(self, event):
+        """As this worker's leader, turn a model write into local group diffs"""
+        subscription = SUBSCRIPTIONS[event['kind']]
+        diffs = local_diffs(subscription, event['before'], event['after'])
+        if not diffs:
+            return
+        row = None
+        if any(change != 'removed' for _, change in diffs):
+            row = await database_sync_to_async(subscription.serialize_row)(event['pk'])
+        for group, change in diffs:
+            version = registry.next_version(group)
+            if version is not None:
+                await self.channel_layer.group_send(
+                    group, diff_message(subscription.kind, version, change, event['pk'], row)
+                )
+
+    async def subscription_diff(self, event):
+        """Forward a published diff for one of this socket's groups"""
         await self.send(text_data=json.dumps({
-            'type': event['data_type'],
-            'data': event['data']
-        })) 
\ No newline at end of file
+            'type': f"{event['kind']}_diff",
+            'version': event['version'],
+            'added': event['added'],
+            'changed': event['changed'],
+            'removed': event['removed'],
+        }))
@@ -0,0 +1,169 @@
+import json
+import re
+import threading
+import time
+
+import httpx
+import jwt
+from django.conf import settings
+from django.core.cache import caches
+
+GOOGLE_ISSUERS = ['accounts.google.com', 'https://accounts.google.com']
+# Used when the key endpoint sends no max-age, and for keys read from a file
+DEFAULT_MAX_AGE = 3600
+# Refresh in the background once this fraction of max-age has passed
+REFRESH_AFTER = 0.8
+# Minimum seconds between refetches triggered by an unknown key id
+UNKNOWN_KID_INTERVAL = 60
+# How long other workers wait for the one that is fetching
+FETCH_WAIT = 5.0
+
+MAX_AGE_RE = re.compile(r'(?:^|,)\s*max-age\s*=\s*(\d+)', re.IGNORECASE)
+
+
+def parse_max_age(cache_control):
+    match = MAX_AGE_RE.search(cache_control or '')
+    return int(match.group(1)) if match else DEFAULT_MAX_AGE
+
+
+class JWKSCache:
+    """Signing keys from a JWKS endpoint, kept in memory between logins.
+
+    Keys live until the endpoint's Cache-Control max-age runs out. Past
+    REFRESH_AFTER of that, a background thread refetches while logins keep
+    using the current keys. The key document is also published to a shared
+    cache, and a lock there lets one worker fetch while the others wait for
+    its result. With ``path`` set, keys are read from a local JWKS file.
+    """
+
+    def __init__(self, url, path=None, cache_alias='oauth_keys'):
+        self.url = url
+        self.path = path
+        self.cache_alias = cache_alias
+        self.cache_key = f'jwks:{path or url}'
+        self._lock = threading.Lock()
+        self._document = None
+        self._keys = {}
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._refreshing = False
+        self._last_unknown_kid = 0.0
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias]
+
+    @staticmethod
+    def is_fresh(document):
+        return document['fetched_at'] + document['max_age'] * REFRESH_AFTER > time.time()
+
+    def get_key(self, kid):
+        now = time.time()
+        if now >= self._expires_at:
+            self.load(self.is_fresh)
+        elif now >= self._refresh_at:
+            self.refresh_in_background()
+        key = self._keys.get(kid)
+        if key is None and now - self._last_unknown_kid >= UNKNOWN_KID_INTERVAL:
+            # Keys rotate before our copy expires; look once for the new one
+            self._last_unknown_kid = now
+            seen = self._document['fetched_at']
+            self.load(lambda document: document['fetched_at'] > seen)
+            key = self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError('Unknown signing key')
+        return key
+
+    def load(self, acceptable):
+        """Install the shared key document, fetching one if it is not acceptable"""
+        with self._lock:
+            if self._document is not None and acceptable(self._document):
+                return  # Another thread got here first
+            document = self.shared.get(self.cache_key)
+            if document is None or not acceptable(document):
+                document = self.fetch_once(acceptable)
+            self.install(document)
+
+    def install(self, document):
+        self._keys = {
+            jwk['kid']: jwt.PyJWK(jwk).key
+            for jwk in document['keys'] if jwk.get('kid') and jwk.get('use', 'sig') == 'sig'
+        }
+        self._document = document
+        self._expires_at = document['fetched_at'] + document['max_age']
+        self._refresh_at = document['fetched_at'] + document['max_age'] * REFRESH_AFTER
+
+    def fetch_once(self, acceptable):
+        lock_key = f'{self.cache_key}:lock'
+        if self.shared.add(lock_key, 1, timeout=FETCH_WAIT * 2):
+            try:
+                document = self.fetch()
+                self.shared.set(self.cache_key, document, timeout=document['max_age'])
+                return document
+            finally:
+                self.shared.delete(lock_key)
+        deadline = time.time() + FETCH_WAIT
+        while time.time() < deadline:
+            time.sleep(0.05)
+            document = self.shared.get(self.cache_key)
+            if document is not None and acceptable(document):
+                return document
+        # The fetching worker died or is stuck: go without the lock
+        return self.fetch()
+
+    def fetch(self):
+        fetched_at = time.time()
+        if self.path:
+            with open(self.path) as f:
+                return {'keys': json.load(f)['keys'], 'max_age': DEFAULT_MAX_AGE, 'fetched_at': fetched_at}
+        response = httpx.get(self.url, timeout=5.0)
+        response.raise_for_status()
+        return {
+            'keys': response.json()['keys'],
+            'max_age': parse_max_age(response.headers.get('Cache-Control')),
+            'fetched_at': fetched_at,
+        }
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, daemon=True).start()
+
+    def _refresh(self):
+        try:
+            self.load(self.is_fresh)
+        except Exception:
+            # Keep serving the current keys; the next login past expiry retries
+            pass
+        finally:
+            self._refreshing = False
+
+
+_key_sets = {}
+_key_sets_lock = threading.Lock()
+
+
+def google_key_set():
+    """The process-wide JWKSCache for the configured Google key source"""
+    source = (settings.GOOGLE_JWKS_URL, settings.GOOGLE_JWKS_FILE)
+    with _key_sets_lock:
+        if source not in _key_sets:
+            _key_sets[source] = JWKSCache(*source)
+        return _key_sets[source]
+
+
+def verify_google_id_token(credential):
+    """Decoded claims of a Google ID token; raises jwt.InvalidTokenError"""
+    header = jwt.get_unverified_header(credential)
+    key = google_key_set().get_key(header.get('kid'))
+    claims = jwt.decode(
+        credential, key, algorithms=['RS256'],
+        audience=settings.GOOGLE_CLIENT_ID, issuer=GOOGLE_ISSUERS,
+        options={'require': ['exp', 'iat', 'sub']},
+    )
+    # Only a verified address may be matched against existing accounts
+    if not claims.get('email_verified'):
+        claims.pop('email', None)
+    return claims
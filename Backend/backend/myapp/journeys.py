@@ -0,0 +1,365 @@
+import heapq
+import itertools
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from datetime import time as day_time
+from datetime import timezone as dt_timezone
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Bus, Train, normalize_place
+
+DAY = 86400
+SORTS = ('arrival', 'fare')
+
+
+@lru_cache(maxsize=1024)
+def day_start_ts(day):
+    return timezone.make_aware(datetime.combine(day, day_time.min)).timestamp()
+
+
+def local_date(ts):
+    return timezone.localtime(datetime.fromtimestamp(ts, tz=dt_timezone.utc)).date()
+
+
+def train_travel_seconds(departure, arrival, duration):
+    """Seconds from departure to arrival; ``duration`` ("HH:mm") supplies
+    the whole days a time-of-day difference cannot show"""
+    travel = (
+        (arrival.hour - departure.hour) * 3600 + (arrival.minute - departure.minute) * 60
+        + arrival.second - departure.second
+    ) % DAY
+    try:
+        hours, minutes = (int(part) for part in duration.split(':'))
+    except (AttributeError, ValueError):
+        return travel
+    return travel + DAY * max(0, round((hours * 3600 + minutes * 60 - travel) / DAY))
+
+
+class Leg:
+    """One bus run, or one train's daily service pattern.
+
+    Bus legs depart at a timestamp; train legs at seconds after local
+    midnight, on the weekdays in ``mask``.
+    """
+
+    __slots__ = (
+        'mode', 'pk', 'number', 'name', 'origin', 'destination',
+        'origin_name', 'destination_name', 'departs', 'travel', 'mask', 'fare',
+    )
+
+    def __init__(self, mode, pk, number, name, origin_name, destination_name, departs, travel, fare, mask=None):
+        self.mode = mode
+        self.pk = pk
+        self.number = number
+        self.name = name
+        self.origin_name = origin_name
+        self.destination_name = destination_name
+        self.origin = normalize_place(origin_name)
+        self.destination = normalize_place(destination_name)
+        self.departs = departs
+        self.travel = travel
+        self.fare = fare
+        self.mask = mask
+
+    @classmethod
+    def from_bus(cls, bus):
+        departs = bus.departure_time.timestamp()
+        return cls(
+            'bus', bus.pk, bus.bus_number, bus.bus_type, bus.from_city, bus.to_city,
+            departs, bus.arrival_time.timestamp() - departs, bus.base_fare,
+        )
+
+    @classmethod
+    def from_train(cls, train):
+        departure = train.departure_time
+        return cls(
+            'train', train.pk, train.number, train.name, train.from_station, train.to_station,
+            departure.hour * 3600 + departure.minute * 60 + departure.second,
+            train_travel_seconds(departure, train.arrival_time, train.duration),
+            train.base_fare, train.running_days_mask,
+        )
+
+    @property
+    def key(self):
+        return (self.mode, self.pk)
+
+
+class Timetable:
+    """Time-expanded bus and train network.
+
+    Departures are indexed per place in time order: bus runs by timestamp
+    and train patterns by time of day, expanded onto dates as a search
+    reaches them. ``links`` counts legs between each pair of places, from
+    which a search learns how many legs any place is from its destination.
+
+    One thread may put() and discard() while others search: a change
+    never edits a place's lists, it replaces them with updated copies, so
+    a search sees each place as it was before or after the change.
+    """
+
+    def __init__(self):
+        self.legs = {}
+        # (mode, place) -> (departure times, legs), in time order
+        self.departures = {}
+        self.links = {}
+
+    @classmethod
+    def build(cls, legs):
+        """A timetable of legs, each place sorted once instead of per put()"""
+        timetable = cls()
+        for leg in legs:
+            timetable.legs[leg.key] = leg
+        departures, links = defaultdict(list), defaultdict(Counter)
+        for leg in timetable.legs.values():
+            departures[(leg.mode, leg.origin)].append(leg)
+            links[leg.destination][leg.origin] += 1
+        for place, legs in departures.items():
+            # Stable, so equal times keep their order as put() would
+            legs.sort(key=lambda leg: leg.departs)
+            timetable.departures[place] = ([leg.departs for leg in legs], legs)
+        timetable.links = dict(links)
+        return timetable
+
+    def put(self, leg):
+        self.discard(leg.key)
+        self.legs[leg.key] = leg
+        place = (leg.mode, leg.origin)
+        times, legs = self.departures.get(place, ([], []))
+        index = bisect_right(times, leg.departs)
+        self.departures[place] = (
+            times[:index] + [leg.departs] + times[index:], legs[:index] + [leg] + legs[index:]
+        )
+        links = Counter(self.links.get(leg.destination, ()))
+        links[leg.origin] += 1
+        self.links[leg.destination] = links
+
+    def discard(self, key):
+        leg = self.legs.pop(key, None)
+        if leg is None:
+            return
+        place = (leg.mode, leg.origin)
+        times, legs = self.departures[place]
+        index = bisect_left(times, leg.departs)
+        while legs[index] is not leg:
+            index += 1
+        if len(legs) > 1:
+            self.departures[place] = (times[:index] + times[index + 1:], legs[:index] + legs[index + 1:])
+        else:
+            del self.departures[place]
+        links = Counter(self.links[leg.destination])
+        links[leg.origin] -= 1
+        if not links[leg.origin]:
+            del links[leg.origin]
+        self.links[leg.destination] = links
+
+    def trips(self, place, earliest, latest):
+        """(departs, arrives, leg) for every departure from place in [earliest, latest]"""
+        trips = []
+        times, legs = self.departures.get(('bus', place), ((), ()))
+        for leg in legs[bisect_left(times, earliest):bisect_right(times, latest)]:
+            trips.append((leg.departs, leg.departs + leg.travel, leg))
+        times, legs = self.departures.get(('train', place), ((), ()))
+        if times:
+            day = local_date(earliest)
+            while (base := day_start_ts(day)) <= latest:
+                bit = 1 << day.weekday()
+                for leg in legs[bisect_left(times, earliest - base):bisect_right(times, latest - base)]:
+                    if leg.mask & bit:
+                        trips.append((base + leg.departs, base + leg.departs + leg.travel, leg))
+                day += timedelta(days=1)
+        return trips
+
+    def hops_to(self, destination, max_legs):
+        """Fewest legs from each place that can reach destination in max_legs"""
+        hops, frontier = {destination: 0}, [destination]
+        for depth in range(1, max_legs + 1):
+            reached = []
+            for place in frontier:
+                for origin in self.links.get(place, ()):
+                    if origin not in hops:
+                        hops[origin] = depth
+                        reached.append(origin)
+            frontier = reached
+        return hops
+
+    def plan(self, origin, destination, start, k, sort, min_connection, max_wait, window, max_legs):
+        """The k best itineraries by arrival time or total fare.
+
+        A best-first search over boarded trips: the first leg departs from
+        origin within ``window`` seconds of ``start``, and each connection
+        waits between min_connection and max_wait seconds. No place is
+        visited twice, and only trips from which the destination is still
+        reachable in the remaining legs are queued. Each trip is expanded
+        at most k times, the most any of the k best itineraries can use it.
+        """
+        hops = self.hops_to(destination, max_legs)
+        if origin not in hops or origin == destination:
+            return []
+        queue, order, settled, found = [], itertools.count(), Counter(), []
+
+        def push(trip, parent, fare, legs):
+            key = (trip[1], fare) if sort == 'arrival' else (fare, trip[1])
+            heapq.heappush(queue, (key, legs, next(order), trip, parent, fare))
+
+        for trip in self.trips(origin, start, start + window):
+            if hops.get(trip[2].destination, max_legs) < max_legs:
+                push(trip, None, trip[2].fare, 1)
+        while queue and len(found) < k:
+            _, legs, _, trip, parent, fare = heapq.heappop(queue)
+            node = (trip[2].key, trip[0])
+            if settled[node] >= k:
+                continue
+            settled[node] += 1
+            path = (trip, parent)
+            place = trip[2].destination
+            if place == destination:
+                found.append(path)
+                continue
+            visited = {place}
+            step = path
+            while step is not None:
+                visited.add(step[0][2].origin)
+                step = step[1]
+            remaining = max_legs - legs - 1
+            for onward in self.trips(place, trip[1] + min_connection, trip[1] + max_wait):
+                if onward[2].destination not in visited and hops.get(onward[2].destination, max_legs) <= remaining:
+                    push(onward, path, fare + onward[2].fare, legs + 1)
+        return [itinerary(path) for path in found]
+
+
+def as_datetime(ts):
+    return timezone.localtime(datetime.fromtimestamp(ts, tz=dt_timezone.utc))
+
+
+def itinerary(path):
+    trips = []
+    while path is not None:
+        trips.append(path[0])
+        path = path[1]
+    trips.reverse()
+    departs, arrives = trips[0][0], trips[-1][1]
+    return {
+        'departure': as_datetime(departs),
+        'arrival': as_datetime(arrives),
+        'duration_minutes': round((arrives - departs) / 60),
+        'fare': str(sum(leg.fare for _, _, leg in trips)),
+        'transfers': len(trips) - 1,
+        'legs': [
+            {
+                'mode': leg.mode, 'id': leg.pk, 'number': leg.number, 'name': leg.name,
+                'from': leg.origin_name, 'to': leg.destination_name,
+                'departure': as_datetime(leg_departs), 'arrival': as_datetime(leg_arrives),
+                'fare': str(leg.fare),
+            }
+            for leg_departs, leg_arrives, leg in trips
+        ],
+    }
+
+
+class JourneyGraph:
+    """This process's Timetable: loaded on first use, then kept current by
+    the Bus/Train signal handlers.
+
+    Other processes' writes reach it when it is reloaded, after
+    JOURNEY_GRAPH_MAX_AGE seconds. A reload reads buses from a day ago
+    on, so finished runs drop out. Changes committed while a reload
+    reads are replayed onto the new timetable.
+
+    put() and discard() change the timetable under the lock; searches
+    take a reference to it under the lock and run without it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._timetable = None
+            self._loaded_at = None
+            self._replay = None
+
+    @staticmethod
+    def read_legs(now=None):
+        since = (now or timezone.now()) - timedelta(days=1)
+        buses = Bus.objects.filter(departure_time__gte=since).only(
+            'bus_number', 'bus_type', 'from_city', 'to_city', 'departure_time', 'arrival_time', 'base_fare'
+        )
+        trains = Train.objects.only(
+            'number', 'name', 'from_station', 'to_station', 'departure_time', 'arrival_time',
+            'duration', 'running_days_mask', 'base_fare',
+        )
+        return itertools.chain(
+            (Leg.from_bus(bus) for bus in buses.iterator(chunk_size=2000)),
+            (Leg.from_train(train) for train in trains.iterator(chunk_size=2000)),
+        )
+
+    def load(self, legs=None):
+        """Build a new timetable from the database (or the given legs) and swap it in"""
+        with self._load_lock:
+            self._load(legs)
+
+    def _load(self, legs=None):
+        with self._lock:
+            self._replay = []
+        timetable = Timetable.build(self.read_legs() if legs is None else legs)
+        with self._lock:
+            for change in self._replay:
+                change(timetable)
+            self._timetable, self._loaded_at, self._replay = timetable, time.monotonic(), None
+
+    def is_stale(self):
+        with self._lock:
+            loaded_at = self._loaded_at
+        return loaded_at is None or time.monotonic() - loaded_at > settings.JOURNEY_GRAPH_MAX_AGE
+
+    def ensure_fresh(self):
+        if self.is_stale():
+            with self._load_lock:
+                # Another thread may have reloaded while this one waited
+                if self.is_stale():
+                    self._load()
+
+    def _change(self, change):
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append(change)
+            if self._timetable is not None:
+                change(self._timetable)
+
+    def put(self, leg):
+        self._change(lambda timetable: timetable.put(leg))
+
+    def discard(self, mode, pk):
+        self._change(lambda timetable: timetable.discard((mode, pk)))
+
+    def plan(self, origin, destination, departs_after, k=3, sort='arrival', min_connection=None, max_legs=None):
+        self.ensure_fresh()
+        if min_connection is None:
+            min_connection = settings.JOURNEY_MIN_CONNECTION_MINUTES
+        with self._lock:
+            timetable = self._timetable
+        return timetable.plan(
+            normalize_place(origin), normalize_place(destination), departs_after.timestamp(),
+            k, sort, min_connection * 60, settings.JOURNEY_MAX_WAIT_HOURS * 3600,
+            settings.JOURNEY_DEPARTURE_WINDOW_HOURS * 3600, max_legs or settings.JOURNEY_MAX_LEGS,
+        )
+
+    def stats(self):
+        with self._lock:
+            timetable = self._timetable
+            return {
+                'loaded': timetable is not None,
+                'legs': len(timetable.legs) if timetable else 0,
+                'places': len({leg.origin for leg in timetable.legs.values()}) if timetable else 0,
+            }
+
+
+journey_graph = JourneyGraph()
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.ai_logs import latency_report
+
+
+class Command(BaseCommand):
+    help = 'Report AI processing time percentiles from the hourly latency rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24)
+
+    def handle(self, *args, **options):
+        if options['hours'] < 1:
+            raise CommandError('--hours must be positive')
+        report = latency_report(options['hours'])
+        if not report['count']:
+            self.stdout.write(f"No AI interactions in the last {report['hours']}h")
+            return
+        self.stdout.write(
+            f"{report['count']} interactions in the last {report['hours']}h: "
+            f"p50 {report['p50'] * 1000:.0f}ms p99 {report['p99'] * 1000:.0f}ms "
+            f"mean {report['mean'] * 1000:.0f}ms max {report['max'] * 1000:.0f}ms"
+        )
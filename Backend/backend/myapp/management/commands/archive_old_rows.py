@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.retention import POLICIES
+
+
+class Command(BaseCommand):
+    help = (
+        'Move AILog/Transaction rows past their retention period into gzip JSONL archives, '
+        'in chunks. Safe to interrupt: the next run resumes where this one stopped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('policies', nargs='*', metavar='policy',
+                            help=f"Any of {', '.join(POLICIES)} (default: all)")
+        parser.add_argument('--days', type=int, help='Override the configured retention period')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows per write and DELETE')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between chunks')
+        parser.add_argument('--max-chunks', type=int, help='Stop after this many chunks per policy')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1 or (options['days'] is not None and options['days'] < 0):
+            raise CommandError('--chunk-size must be positive and --days not negative')
+        unknown = set(options['policies']) - set(POLICIES)
+        if unknown:
+            raise CommandError(f"Unknown policy: {', '.join(sorted(unknown))}")
+        for name in options['policies'] or POLICIES:
+            result = POLICIES[name].archive(
+                days=options['days'], chunk_size=options['chunk_size'],
+                pause=options['pause'], max_chunks=options['max_chunks'],
+            )
+            self.stdout.write(
+                f"{name}: archived {result['rows']} row(s) in {result['chunks']} chunk(s), "
+                f"{result['days']} day(s) completed"
+            )
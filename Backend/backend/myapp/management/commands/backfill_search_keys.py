@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from myapp.backfill import backfill_place_keys, backfill_running_days
+from myapp.journeys import journey_graph
+from myapp.search_cache import bus_search_cache, train_search_cache
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill in normalized place keys and train running day masks of rows written without save(), '
+        'e.g. by bulk_create or an older schema'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per UPDATE batch')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        with transaction.atomic():
+            updated = backfill_place_keys(options['batch_size'])
+            running_days = backfill_running_days(options['batch_size'])
+        bus_search_cache.invalidate()
+        train_search_cache.invalidate()
+        journey_graph.clear()
+        for model, count in updated.items():
+            self.stdout.write(f'{model}: {count} row(s) backfilled')
+        self.stdout.write(f'Train running days: {running_days} row(s) backfilled')
@@ -0,0 +1,88 @@
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from myapp.journeys import JourneyGraph, Leg
+from myapp.models import EVERY_DAY
+
+
+def synthetic_legs(places, trains, buses, days, seed=0):
+    """A rail network between random places plus local bus runs between
+    neighbouring places on a ring, over ``days`` days from today"""
+    rng = random.Random(seed)
+    names = [f'Bench Town {n}' for n in range(places)]
+    start = timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time())).timestamp()
+    legs = []
+    for pk in range(1, trains + 1):
+        origin, destination = rng.sample(names, 2)
+        legs.append(Leg(
+            'train', pk, str(10000 + pk), f'Express {pk}', origin, destination,
+            rng.randrange(0, 86400, 300), rng.randrange(2, 14) * 3600,
+            Decimal(rng.randrange(300, 2500)), EVERY_DAY if rng.random() < 0.5 else rng.randrange(1, EVERY_DAY),
+        ))
+    for pk in range(1, buses + 1):
+        n = rng.randrange(places)
+        hop = rng.choice([-3, -2, -1, 1, 2, 3])
+        departs = start + rng.randrange(0, days * 86400, 600)
+        legs.append(Leg(
+            'bus', pk, f'BN {pk}', 'Seater', names[n], names[(n + hop) % places],
+            departs, abs(hop) * rng.randrange(1, 3) * 3600, Decimal(rng.randrange(100, 900)),
+        ))
+    return names, legs
+
+
+class Command(BaseCommand):
+    help = 'Time journey graph builds, updates and k-best queries on a synthetic bus and train network'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--places', type=int, default=500)
+        parser.add_argument('--trains', type=int, default=3000)
+        parser.add_argument('--buses', type=int, default=40000)
+        parser.add_argument('--days', type=int, default=7, help='Days of bus runs')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--k', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['places'] < 2 or options['queries'] < 1:
+            raise CommandError('--places must be at least 2 and --queries positive')
+        names, legs = synthetic_legs(
+            options['places'], options['trains'], options['buses'], options['days'], options['seed']
+        )
+        graph = JourneyGraph()
+        began = time.perf_counter()
+        graph.load(legs)
+        build_ms = (time.perf_counter() - began) * 1000
+        self.stdout.write(
+            f"{len(legs)} legs between {options['places']} places: built in {build_ms:.0f} ms"
+        )
+
+        rng = random.Random(options['seed'])
+        began = time.perf_counter()
+        for leg in rng.sample(legs, min(1000, len(legs))):
+            graph.put(Leg(
+                leg.mode, leg.pk, leg.number, leg.name, leg.origin_name, leg.destination_name,
+                leg.departs + 600, leg.travel, leg.fare, leg.mask,
+            ))
+        update_us = (time.perf_counter() - began) * 1e6 / min(1000, len(legs))
+        self.stdout.write(f'update: {update_us:.0f} us per leg')
+
+        departs_after = timezone.now() + timedelta(days=1)
+        for sort in ('arrival', 'fare'):
+            timings, found = [], 0
+            for _ in range(options['queries']):
+                origin, destination = rng.sample(names, 2)
+                began = time.perf_counter()
+                found += bool(graph.plan(origin, destination, departs_after, k=options['k'], sort=sort))
+                timings.append((time.perf_counter() - began) * 1000)
+            timings.sort()
+            self.stdout.write(
+                f"{sort}: p50 {statistics.median(timings):.2f} ms "
+                f"p95 {timings[int(len(timings) * 0.95) - 1]:.2f} ms max {timings[-1]:.2f} ms, "
+                f"{found}/{options['queries']} pairs connected"
+            )
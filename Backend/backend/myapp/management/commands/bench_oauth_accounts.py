@@ -0,0 +1,160 @@
+import statistics
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
+
+from myapp.models import OAuthProfile, User
+from myapp.oauth_accounts import get_or_create_user_from_oauth, import_oauth_users
+
+BENCH_PREFIX = 'acct-bench-'
+TRANSACTION_STATEMENTS = {'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE'}
+
+
+def bench_record(n, email=True):
+    return {
+        'id': f'{BENCH_PREFIX}{n}',
+        'email': f'{BENCH_PREFIX}{n}@example.com' if email else None,
+        'name': f'Bench {n}',
+        'picture': '',
+    }
+
+
+def delete_bench_accounts():
+    User.objects.filter(oauth_profile__provider_user_id__startswith=BENCH_PREFIX).delete()
+    User.objects.filter(email__startswith=BENCH_PREFIX).delete()
+
+
+def time_logins(records):
+    """Median/p99 ms and statements per call of sequential logins"""
+    timings, queries = [], []
+    for record in records:
+        with CaptureQueriesContext(connection) as ctx:
+            began = time.perf_counter()
+            get_or_create_user_from_oauth('google', record)
+            timings.append((time.perf_counter() - began) * 1000)
+        queries.append(sum(
+            1 for query in ctx.captured_queries
+            if query['sql'].split(' ', 1)[0] not in TRANSACTION_STATEMENTS
+        ))
+    timings.sort()
+    return {
+        'p50_ms': statistics.median(timings),
+        'p99_ms': timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+        'queries': max(queries),
+    }
+
+
+def run_duplicate_logins(accounts, threads, email=True, max_retries=20):
+    """First logins for each account from several threads at once"""
+    outcomes = Counter()
+    lock = threading.Lock()
+    users = {n: set() for n in range(accounts)}
+
+    def worker(start):
+        try:
+            for n in range(accounts):
+                start.wait()
+                for retry in range(max_retries + 1):
+                    try:
+                        user, _ = get_or_create_user_from_oauth('google', bench_record(n, email))
+                    except OperationalError:
+                        # SQLite reports lock contention instead of waiting
+                        with lock:
+                            outcomes['retries'] += 1
+                        time.sleep(0.001 * (retry + 1))
+                        continue
+                    except Exception as e:
+                        with lock:
+                            outcomes[type(e).__name__] += 1
+                        break
+                    with lock:
+                        users[n].add(user.pk)
+                        outcomes['ok'] += 1
+                    break
+        finally:
+            connection.close()
+
+    start = threading.Barrier(threads)
+    pool = [threading.Thread(target=worker, args=(start,)) for _ in range(threads)]
+    began = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    ids = [f'{BENCH_PREFIX}{n}' for n in range(accounts)]
+    profiles = Counter(
+        OAuthProfile.objects.filter(provider='google', provider_user_id__in=ids).values_list('provider_user_id', flat=True)
+    )
+    return {
+        'seconds': elapsed,
+        'outcomes': dict(outcomes),
+        'split_accounts': sum(1 for pks in users.values() if len(pks) != 1),
+        'missing_profiles': sum(1 for account in ids if profiles[account] != 1),
+        'orphan_users': User.objects.filter(
+            name__startswith='Bench ', oauth_profile__isnull=True
+        ).count(),
+    }
+
+
+def run_benchmark(logins=200, accounts=50, threads=4, import_size=2000):
+    delete_bench_accounts()
+    try:
+        cold = time_logins([bench_record(n) for n in range(logins)])
+        warm = time_logins([bench_record(n) for n in range(logins)])
+        delete_bench_accounts()
+
+        duplicates = run_duplicate_logins(accounts, threads)
+        delete_bench_accounts()
+        anonymous_duplicates = run_duplicate_logins(accounts, threads, email=False)
+        delete_bench_accounts()
+
+        began = time.perf_counter()
+        counts = import_oauth_users('google', [
+            bench_record(n, email=n % 5 != 0) for n in range(import_size)
+        ])
+        imported = {'seconds': time.perf_counter() - began, **counts}
+    finally:
+        delete_bench_accounts()
+    return {
+        'cold': cold, 'warm': warm, 'duplicates': duplicates,
+        'anonymous_duplicates': anonymous_duplicates, 'import': imported,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark OAuth cold/warm login lookups, concurrent duplicate first logins and bulk import'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--accounts', type=int, default=50, help='Accounts raced by duplicate logins')
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--import-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        report = run_benchmark(
+            options['logins'], options['accounts'], options['threads'], options['import_size']
+        )
+        for name in ('cold', 'warm'):
+            result = report[name]
+            self.stdout.write(
+                f"{name} login: p50 {result['p50_ms']:.2f}ms p99 {result['p99_ms']:.2f}ms, "
+                f"{result['queries']} statements"
+            )
+        for name in ('duplicates', 'anonymous_duplicates'):
+            result = report[name]
+            self.stdout.write(
+                f"{name.replace('_', ' ')}: {result['outcomes']} in {result['seconds']:.2f}s, "
+                f"{result['split_accounts']} split accounts, {result['missing_profiles']} bad profiles, "
+                f"{result['orphan_users']} orphan users"
+            )
+        imported = report['import']
+        self.stdout.write(
+            f"import: {imported['created']} users in {imported['seconds']:.2f}s "
+            f"({imported['created'] / imported['seconds']:.0f}/s)"
+        )
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient
+from django.test.utils import override_settings
+
+from myapp import oauth_client
+from myapp.models import User
+from myapp.oauth_views import OAUTH_CONFIG
+
+BENCH_PREFIX = 'bench-'
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+        fields = dict(pair.split('=', 1) for pair in body.split('&') if '=' in pair)
+        self.respond({'access_token': fields.get('code', '').replace('code-', 'token-', 1)})
+
+    def do_GET(self):
+        token = self.headers.get('Authorization', '').removeprefix('Bearer ')
+        user_id = token.removeprefix('token-')
+        self.respond({
+            'id': f'{BENCH_PREFIX}{user_id}',
+            'email': f'{BENCH_PREFIX}{user_id}@example.com',
+            'name': f'Bench User {user_id}',
+            'avatar_url': '',
+        })
+
+    def respond(self, payload):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            fail = server.failures > 0
+            if fail:
+                server.failures -= 1
+        time.sleep(server.latency)
+        status, payload = (503, {'error': 'unavailable'}) if fail else (200, payload)
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeProvider(ThreadingHTTPServer):
+    """Local token + userinfo endpoint with a fixed delay per request.
+
+    Counts accepted connections, so keep-alive reuse is visible, and can
+    answer the next ``failures`` requests with 503 to exercise retries.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.02, failures=0):
+        super().__init__(('127.0.0.1', 0), FakeProviderHandler)
+        self.latency = latency
+        self.failures = failures
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def get_request(self):
+        request = super().get_request()
+        with self.lock:
+            self.connections += 1
+        return request
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+def fake_provider_config(provider):
+    return {
+        **OAUTH_CONFIG['github'],
+        'token_url': f'{provider.url}/token',
+        'userinfo_url': f'{provider.url}/user',
+    }
+
+
+def delete_bench_users():
+    User.objects.filter(oauth_profile__provider_user_id__startswith=BENCH_PREFIX).delete()
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+def run_login_benchmark(logins=200, concurrency=20, latency=0.02, keepalive=True):
+    """Drive concurrent oauth_callback logins against a local fake provider"""
+    latencies = []
+    statuses = Counter()
+
+    async def login(client, semaphore, n):
+        async with semaphore:
+            began = time.perf_counter()
+            response = await client.post('/api/auth/oauth/callback/', {
+                'provider': 'github', 'code': f'code-{n}', 'redirect_uri': 'http://localhost/callback',
+            }, content_type='application/json')
+            latencies.append((time.perf_counter() - began) * 1000)
+            statuses[response.status_code] += 1
+
+    async def run():
+        client, semaphore = AsyncClient(), asyncio.Semaphore(concurrency)
+        try:
+            await asyncio.gather(*(login(client, semaphore, n) for n in range(logins)))
+        finally:
+            await oauth_client.close_client()
+
+    limits = oauth_client.LIMITS
+    original = OAUTH_CONFIG['github']
+    with FakeProvider(latency) as provider:
+        OAUTH_CONFIG['github'] = fake_provider_config(provider)
+        if not keepalive:
+            oauth_client.LIMITS = httpx.Limits(max_keepalive_connections=0)
+        try:
+            began = time.perf_counter()
+            async_to_sync(run)()
+            elapsed = time.perf_counter() - began
+        finally:
+            OAUTH_CONFIG['github'] = original
+            oauth_client.LIMITS = limits
+
+    return {
+        'logins': logins,
+        'succeeded': statuses[200],
+        'statuses': dict(statuses),
+        'seconds': elapsed,
+        'logins_per_second': logins / elapsed if elapsed else 0.0,
+        'p50_ms': statistics.median(latencies),
+        'p99_ms': sorted(latencies)[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        'provider_requests': provider.requests,
+        'provider_connections': provider.connections,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Measure OAuth login throughput under concurrency against a local fake provider'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--latency', type=float, default=0.02, help='Provider delay per request in seconds')
+
+    def handle(self, *args, **options):
+        if options['logins'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--logins and --concurrency must be positive')
+        try:
+            for keepalive in (True, False):
+                delete_bench_users()
+                report = run_login_benchmark(
+                    options['logins'], options['concurrency'], options['latency'], keepalive
+                )
+                self.stdout.write(
+                    f"{'pooled' if keepalive else 'no keep-alive':>13}: "
+                    f"{report['succeeded']}/{report['logins']} logins in {report['seconds']:.2f}s "
+                    f"({report['logins_per_second']:.0f}/s), p50 {report['p50_ms']:.1f}ms "
+                    f"p99 {report['p99_ms']:.1f}ms, {report['provider_requests']} provider requests "
+                    f"over {report['provider_connections']} connections"
+                )
+        finally:
+            delete_bench_users()
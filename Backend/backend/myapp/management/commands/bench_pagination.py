@@ -0,0 +1,122 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIRequestFactory
+
+from myapp.models import Property
+from myapp.pagination import KeysetPagination
+from myapp.views import PropertyViewSet
+
+BENCH_CITY = 'Pagination Bench'
+
+
+class Rollback(Exception):
+    pass
+
+
+def create_bench_properties(count):
+    host, _ = get_user_model().objects.get_or_create(username='pagination-bench')
+    # Few distinct prices so the id tie-break is exercised on every page
+    Property.objects.bulk_create([
+        Property(
+            host=host, name=f'Bench {n}', type='cabin', location=BENCH_CITY, state='Bench',
+            city=BENCH_CITY, state_key='bench', city_key='pagination bench', description='',
+            max_guests=2, bedrooms=1, bathrooms=1, price_per_night=Decimal(1000 + n % 50),
+            rating=(n % 10) / 2,
+        )
+        for n in range(count)
+    ], batch_size=1000)
+
+
+# Requests are built in-process, so the host only has to pass validation
+@override_settings(ALLOWED_HOSTS=['localhost'])
+def time_request(view, params, repeat):
+    """Median milliseconds and query count of a list request"""
+    factory = APIRequestFactory()
+    timings = []
+    for _ in range(repeat):
+        request = factory.get('/api/properties/', params, SERVER_NAME='localhost')
+        with CaptureQueriesContext(connection) as queries:
+            began = time.perf_counter()
+            response = view(request)
+            timings.append((time.perf_counter() - began) * 1000)
+        if response.status_code != 200:
+            raise CommandError(f'{params} returned {response.status_code}: {response.data}')
+    return statistics.median(timings), len(queries)
+
+
+def keyset_cursor(ordering, position):
+    """The cursor a client would hold after reading `position` rows"""
+    paginator = KeysetPagination()
+    descending = ordering.startswith('-')
+    paginator.field = Property._meta.get_field(ordering.lstrip('-'))
+    direction = '-' if descending else ''
+    row = Property.objects.filter(is_active=True).order_by(
+        f'{direction}{paginator.field.name}', f'{direction}pk'
+    )[position - 1]
+    return paginator.cursor_token(row)
+
+
+def run_benchmark(rows, pages, ordering='-price_per_night', repeat=5):
+    """Compare page-number and keyset latency at the given page numbers"""
+    view = PropertyViewSet.as_view({'get': 'list'})
+    page_size = KeysetPagination.page_size
+    results = []
+    for page in pages:
+        if (page - 1) * page_size >= rows:
+            continue
+        offset_ms, offset_queries = time_request(view, {'ordering': ordering, 'page': page}, repeat)
+        params = {'ordering': ordering, 'paginate': 'cursor'}
+        if page > 1:
+            params['cursor'] = keyset_cursor(ordering, (page - 1) * page_size)
+        keyset_ms, keyset_queries = time_request(view, params, repeat)
+        results.append({
+            'page': page,
+            'page_number_ms': offset_ms,
+            'page_number_queries': offset_queries,
+            'keyset_ms': keyset_ms,
+            'keyset_queries': keyset_queries,
+        })
+    return results
+
+
+class Command(BaseCommand):
+    help = 'Compare deep-page latency of page-number and keyset pagination on /api/properties/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000, help='Synthetic properties to create')
+        parser.add_argument('--pages', default='1,10,100,1000,2500', help='Comma separated page numbers')
+        parser.add_argument('--ordering', default='-price_per_night')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic properties afterwards')
+
+    def handle(self, *args, **options):
+        try:
+            pages = sorted({int(page) for page in options['pages'].split(',')})
+        except ValueError:
+            raise CommandError('--pages must be comma separated integers')
+        if options['ordering'].lstrip('-') not in PropertyViewSet.keyset_ordering_fields:
+            raise CommandError(f'--ordering must be one of {PropertyViewSet.keyset_ordering_fields}')
+
+        try:
+            with transaction.atomic():
+                create_bench_properties(options['rows'])
+                results = run_benchmark(options['rows'], pages, options['ordering'], options['repeat'])
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(f"{options['rows']} properties, ordering={options['ordering']}")
+        self.stdout.write(f"{'page':>6}  {'page number':>18}  {'keyset':>18}")
+        for result in results:
+            self.stdout.write(
+                f"{result['page']:>6}  "
+                f"{result['page_number_ms']:>9.2f} ms ({result['page_number_queries']}q)  "
+                f"{result['keyset_ms']:>9.2f} ms ({result['keyset_queries']}q)"
+            )
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.channel_layers import start_broker
+
+BENCH_CITY = 'Bench City'
+AUTHKEY = 'realtime-bench'
+
+
+def _setup_django(env):
+    os.environ.update(env)
+    import django
+    django.setup()
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def _open_socket(application):
+    from asgiref.testing import ApplicationCommunicator
+
+    socket = ApplicationCommunicator(application, {
+        'type': 'websocket',
+        'path': '/ws/realtime/',
+        'headers': [],
+        'query_string': b'',
+        'subprotocols': [],
+    })
+    await socket.send_input({'type': 'websocket.connect'})
+    accepted = await socket.receive_output(timeout=10)
+    assert accepted['type'] == 'websocket.accept', accepted
+    await socket.send_input({
+        'type': 'websocket.receive',
+        'text': json.dumps({'type': 'subscribe_properties', 'filters': {'city': BENCH_CITY}}),
+    })
+    snapshot = json.loads((await socket.receive_output(timeout=10))['text'])
+    assert snapshot['type'] == 'properties_update', snapshot
+    return socket
+
+
+async def _collect(socket, expected, timeout):
+    """Receive expected diffs; returns (receive time, send time) pairs"""
+    stamps = []
+    while len(stamps) < expected:
+        try:
+            message = await socket.receive_output(timeout=timeout)
+        except asyncio.TimeoutError:
+            break
+        received = time.time()
+        diff = json.loads(message['text'])
+        for row in diff['changed'] + diff['added']:
+            stamps.append((received, float(row['description'])))
+    await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+    return stamps
+
+
+def worker_process(env, sockets, expected, timeout, ready, results):
+    """One ASGI worker: sockets subscribed to the bench city, all on one app"""
+    _setup_django(env)
+    from backend.asgi import application
+
+    async def run():
+        opened = [await _open_socket(application) for _ in range(sockets)]
+        ready.put(True)
+        return await asyncio.gather(*(_collect(socket, expected, timeout) for socket in opened))
+
+    stamps = [stamp for socket_stamps in asyncio.run(run()) for stamp in socket_stamps]
+    results.put(stamps)
+
+
+def prepare_database(env):
+    _setup_django(env)
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+    from myapp.models import Property
+
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    host = get_user_model().objects.create(username='bench-host')
+    Property.objects.create(
+        host=host, name='Bench Cabin', type='cabin', location=BENCH_CITY, state='Bench',
+        city=BENCH_CITY, description='0', max_guests=2, bedrooms=1, bathrooms=1,
+        price_per_night=1000,
+    )
+
+
+def publisher_process(env, messages, interval, go):
+    """Writes the bench property; every save fans out to every worker's sockets"""
+    _setup_django(env)
+    from myapp.models import Property
+
+    prop = Property.objects.get(city=BENCH_CITY)
+    go.wait()
+    for _ in range(messages):
+        # The send time rides along in the row so receivers can measure latency
+        prop.description = repr(time.time())
+        prop.save(update_fields=['description'])
+        if interval:
+            time.sleep(interval)
+
+
+def run_harness(workers=4, sockets=25, messages=200, interval=0.0, timeout=10.0):
+    """Start a broker, workers and a publisher; returns the delivery report"""
+    context = multiprocessing.get_context('spawn')
+    broker = start_broker('127.0.0.1:0', AUTHKEY)
+    with tempfile.TemporaryDirectory() as tmp:
+        host, port = broker.address
+        env = {
+            'DJANGO_SETTINGS_MODULE': 'backend.settings',
+            'SQLITE_PATH': os.path.join(tmp, 'bench.sqlite3'),
+            'CHANNEL_LAYER': 'broker',
+            'CHANNEL_BROKER_ADDRESS': f'{host}:{port}',
+            'CHANNEL_BROKER_AUTHKEY': AUTHKEY,
+        }
+        try:
+            setup = context.Process(target=prepare_database, args=(env,))
+            setup.start()
+            setup.join()
+            if setup.exitcode:
+                raise RuntimeError('Could not prepare the bench database')
+
+            ready, results, go = context.Queue(), context.Queue(), context.Event()
+            processes = [
+                context.Process(target=worker_process, args=(env, sockets, messages, timeout, ready, results))
+                for _ in range(workers)
+            ]
+            publisher = context.Process(target=publisher_process, args=(env, messages, interval, go))
+            for process in processes + [publisher]:
+                process.start()
+            for _ in range(workers):
+                ready.get(timeout=60)
+            go.set()
+            stamps = [stamp for _ in range(workers) for stamp in results.get(timeout=timeout + 60)]
+            for process in processes + [publisher]:
+                process.join()
+        finally:
+            broker.shutdown()
+
+    expected = workers * sockets * messages
+    latencies = [(received - sent) * 1000 for received, sent in stamps]
+    span = (max(r for r, _ in stamps) - min(s for _, s in stamps)) if stamps else 0.0
+    return {
+        'workers': workers,
+        'sockets': workers * sockets,
+        'expected': expected,
+        'delivered': len(stamps),
+        'seconds': span,
+        'messages_per_second': len(stamps) / span if span else 0.0,
+        'latency_ms': {
+            'p50': statistics.median(latencies),
+            'p95': _percentile(latencies, 0.95),
+            'p99': _percentile(latencies, 0.99),
+            'max': max(latencies),
+        } if latencies else {},
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Start several backend.asgi.application workers on a local channel broker and '
+        'measure cross-worker diff delivery latency and throughput'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--sockets', type=int, default=25, help='Subscribed sockets per worker')
+        parser.add_argument('--messages', type=int, default=200, help='Writes made by the publisher')
+        parser.add_argument('--interval', type=float, default=0.0, help='Seconds between writes')
+        parser.add_argument('--timeout', type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['sockets'] < 1 or options['messages'] < 1:
+            raise CommandError('--workers, --sockets and --messages must be positive')
+        report = run_harness(
+            options['workers'], options['sockets'], options['messages'],
+            options['interval'], options['timeout'],
+        )
+        self.stdout.write(
+            f"{report['delivered']}/{report['expected']} diffs delivered to {report['sockets']} sockets "
+            f"on {report['workers']} workers in {report['seconds']:.2f}s "
+            f"({report['messages_per_second']:.0f} msg/s)"
+        )
+        if report['latency_ms']:
+            latency = report['latency_ms']
+            self.stdout.write(
+                f"latency ms: p50 {latency['p50']:.1f}  p95 {latency['p95']:.1f}  "
+                f"p99 {latency['p99']:.1f}  max {latency['max']:.1f}"
+            )
+        if report['delivered'] != report['expected']:
+            raise CommandError('Some diffs were not delivered')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from myapp.stays import end_homestay_stays
+
+
+class Command(BaseCommand):
+    help = 'Complete homestay bookings past their check_out; unpaid ones are cancelled'
+
+    def handle(self, *args, **options):
+        ended = end_homestay_stays()
+        self.stdout.write(f'Ended {ended} homestay stay(s)')
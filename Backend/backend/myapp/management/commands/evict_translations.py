@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.translations import evict_translations, translation_store
+
+
+class Command(BaseCommand):
+    help = 'Trim the translations cache to a row budget, least recently and least often used first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-rows', type=int, default=settings.TRANSLATIONS_CACHE_MAX_ROWS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['max_rows'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--max-rows must be >= 0 and --batch-size positive')
+        translation_store.flush_usage()
+        deleted = evict_translations(options['max_rows'], options['batch_size'])
+        self.stdout.write(f'Evicted {deleted} cached translation(s)')
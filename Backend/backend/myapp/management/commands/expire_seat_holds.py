@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from myapp.reservations import expire_holds
+
+
+class Command(BaseCommand):
+    help = 'Release bus seats held by unpaid bookings whose hold has expired'
+
+    def handle(self, *args, **options):
+        released = expire_holds()
+        self.stdout.write(f'Released {released} expired seat hold(s)')
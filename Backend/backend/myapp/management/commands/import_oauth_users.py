@@ -0,0 +1,33 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.models import OAuthProfile
+from myapp.oauth_accounts import import_oauth_users
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk import users from another provider. Reads JSON lines with id, email, '
+        'name and picture; accounts that already exist are left alone.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('provider', choices=[choice for choice, _ in OAuthProfile.PROVIDER_CHOICES])
+        parser.add_argument('path', help='JSON lines file, one user per line')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path']) as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read {options["path"]}: {e}')
+        if any('id' not in record for record in records):
+            raise CommandError('Every record needs an id')
+
+        counts = import_oauth_users(options['provider'], records, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{counts['created']} created, {counts['linked']} linked by email, "
+            f"{counts['existing']} already imported"
+        ))
@@ -0,0 +1,146 @@
+import random
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+
+from myapp.models import Property, PropertyAvailability, PropertyBooking
+from myapp.stays import ACTIVE_STATUSES, StayUnavailable, book_property, stay_nights
+
+
+def create_load_test_property(nights):
+    """A property whose calendar is open for ``nights`` nights from a week ahead"""
+    host, _ = get_user_model().objects.get_or_create(username='loadtest-host')
+    property = Property.objects.create(
+        host=host, name='Load Test Cabin', type='cabin', location='Load Test Valley',
+        state='Load Test State', city='Load Test City', description='Synthetic property',
+        max_guests=4, bedrooms=2, bathrooms=1, price_per_night=Decimal('2000.00'),
+    )
+    start = timezone.localdate() + timedelta(days=7)
+    PropertyAvailability.objects.bulk_create([
+        PropertyAvailability(property=property, date=day, base_price=Decimal(2000 + 100 * (n % 3)))
+        for n, day in enumerate(stay_nights(start, start + timedelta(days=nights)))
+    ])
+    return property
+
+
+def check_consistency(property):
+    """Returns a list of invariant violations; empty means no double booking"""
+    problems = []
+    active = list(
+        PropertyBooking.objects.filter(property=property, status__in=ACTIVE_STATUSES)
+        .values_list('check_in', 'check_out', 'total_price')
+    )
+    held = Counter(day for check_in, check_out, _ in active for day in stay_nights(check_in, check_out))
+    double = sorted(str(day) for day, count in held.items() if count > 1)
+    if double:
+        problems.append(f'nights held by more than one booking: {", ".join(double)}')
+
+    calendar = dict(PropertyAvailability.objects.filter(property=property).values_list('date', 'is_available'))
+    closed = {day for day, available in calendar.items() if not available}
+    if closed != set(held):
+        problems.append('calendar availability disagrees with active bookings')
+    prices = dict(PropertyAvailability.objects.filter(property=property).values_list('date', 'base_price'))
+    if any(total != sum(prices[day] for day in stay_nights(check_in, check_out)) for check_in, check_out, total in active):
+        problems.append('a booking total does not match its nightly prices')
+    return problems
+
+
+def run_load_test(property, workers, attempts, max_nights, seed=None, max_retries=20):
+    """Hammer property with concurrent book_property calls for random,
+    mostly overlapping stays from several threads"""
+    User = get_user_model()
+    users = [
+        User.objects.get_or_create(username=f'loadtest-{n}')[0] for n in range(workers)
+    ]
+    days = sorted(PropertyAvailability.objects.filter(property=property).values_list('date', flat=True))
+    outcomes = Counter()
+    lock = threading.Lock()
+    start = threading.Barrier(workers)
+
+    def worker(user, rng):
+        start.wait()
+        try:
+            for _ in range(attempts):
+                nights = rng.randint(1, max_nights)
+                check_in = rng.choice(days[:len(days) - nights + 1])
+                for retry in range(max_retries + 1):
+                    try:
+                        book_property(property, user, check_in, check_in + timedelta(days=nights), 2)
+                        outcome = 'booked'
+                    except StayUnavailable:
+                        outcome = 'conflict'
+                    except OperationalError:
+                        # SQLite reports lock contention instead of waiting; back off and retry
+                        outcome = 'busy'
+                        time.sleep(rng.uniform(0.001, 0.002 * (retry + 1)))
+                        with lock:
+                            outcomes['retries'] += 1
+                        continue
+                    break
+                with lock:
+                    outcomes[outcome] += 1
+        finally:
+            connection.close()
+
+    rng = random.Random(seed)
+    threads = [
+        threading.Thread(target=worker, args=(user, random.Random(rng.random())))
+        for user in users
+    ]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    total = outcomes['booked'] + outcomes['conflict'] + outcomes['busy']
+    return {
+        'attempts': total,
+        'booked': outcomes['booked'],
+        'conflicts': outcomes['conflict'],
+        'busy': outcomes['busy'],
+        'retries': outcomes['retries'],
+        'seconds': elapsed,
+        'throughput': total / elapsed if elapsed else 0.0,
+        'problems': check_consistency(property),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Concurrent property booking load test: checks for overlapping stays and reports throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--attempts', type=int, default=50, help='Bookings tried per worker')
+        parser.add_argument('--nights', type=int, default=30, help='Open nights on the synthetic calendar')
+        parser.add_argument('--max-stay', type=int, default=4, help='Longest stay requested, in nights')
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic property afterwards')
+
+    def handle(self, *args, **options):
+        if not 0 < options['max_stay'] <= options['nights']:
+            raise CommandError('Need 0 < --max-stay <= --nights')
+        property = create_load_test_property(options['nights'])
+        try:
+            report = run_load_test(property, options['workers'], options['attempts'], options['max_stay'])
+        finally:
+            if not options['keep']:
+                with transaction.atomic():
+                    property.delete()
+
+        self.stdout.write(
+            f"{report['attempts']} attempts in {report['seconds']:.2f}s "
+            f"({report['throughput']:.1f}/s): {report['booked']} booked, "
+            f"{report['conflicts']} conflicts, {report['busy']} gave up on lock contention "
+            f"after {report['retries']} retries"
+        )
+        if report['problems']:
+            raise CommandError('; '.join(report['problems']))
+        self.stdout.write(self.style.SUCCESS('No overlapping bookings detected'))
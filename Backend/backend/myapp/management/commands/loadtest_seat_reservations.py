@@ -0,0 +1,151 @@
+import random
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+
+from myapp.models import Bus, BusBooking, BusOperator, BusSeat
+from myapp.reservations import SeatUnavailable, reserve_seats
+
+
+def create_load_test_bus(seat_count):
+    operator, _ = BusOperator.objects.get_or_create(
+        name='Load Test Travels', defaults={'description': 'Synthetic operator'}
+    )
+    departure = timezone.now() + timedelta(days=7)
+    bus = Bus.objects.create(
+        operator=operator, bus_number='LOAD-TEST', bus_type='Seater (2+2)',
+        from_city='Load Test Origin', to_city='Load Test Destination',
+        departure_time=departure, arrival_time=departure + timedelta(hours=8),
+        duration='08:00', seat_type='seater', total_seats=seat_count,
+        available_seats=seat_count, window_seats=seat_count // 2, base_fare=Decimal('500.00'),
+    )
+    BusSeat.objects.bulk_create([
+        BusSeat(bus=bus, seat_number=str(n), is_window=n % 2 == 0, price=Decimal('500.00'))
+        for n in range(1, seat_count + 1)
+    ])
+    return bus
+
+
+def check_consistency(bus):
+    """Returns a list of invariant violations; empty means no double booking"""
+    problems = []
+    active = BusBooking.objects.filter(bus=bus, status__in=['pending', 'confirmed'])
+    held = Counter(active.exclude(seats=None).values_list('seats__seat_number', flat=True))
+    double = sorted(seat for seat, count in held.items() if count > 1)
+    if double:
+        problems.append(f'seats held by more than one booking: {", ".join(double)}')
+
+    seats = BusSeat.objects.filter(bus=bus)
+    taken = set(seats.exclude(status='available').values_list('seat_number', flat=True))
+    if taken != set(held):
+        problems.append('seat statuses disagree with active bookings')
+    bus.refresh_from_db()
+    available = seats.filter(status='available').count()
+    if bus.available_seats != available:
+        problems.append(f'available_seats is {bus.available_seats} but {available} seats are free')
+    return problems
+
+
+def run_load_test(bus, workers, attempts, seats_per_booking, hot_seats, seed=None, max_retries=20):
+    """Hammer bus with concurrent reserve_seats calls from several threads"""
+    User = get_user_model()
+    users = [
+        User.objects.get_or_create(username=f'loadtest-{n}')[0] for n in range(workers)
+    ]
+    seat_numbers = list(BusSeat.objects.filter(bus=bus).values_list('seat_number', flat=True))
+    hot = seat_numbers[:hot_seats]
+    outcomes = Counter()
+    lock = threading.Lock()
+    start = threading.Barrier(workers)
+
+    def worker(user, rng):
+        start.wait()
+        try:
+            for _ in range(attempts):
+                wanted = rng.sample(hot, seats_per_booking)
+                for retry in range(max_retries + 1):
+                    try:
+                        reserve_seats(bus, wanted, user)
+                        outcome = 'reserved'
+                    except SeatUnavailable:
+                        outcome = 'conflict'
+                    except OperationalError:
+                        # SQLite reports lock contention instead of waiting; back off and retry
+                        outcome = 'busy'
+                        time.sleep(rng.uniform(0.001, 0.002 * (retry + 1)))
+                        with lock:
+                            outcomes['retries'] += 1
+                        continue
+                    break
+                with lock:
+                    outcomes[outcome] += 1
+        finally:
+            connection.close()
+
+    rng = random.Random(seed)
+    threads = [
+        threading.Thread(target=worker, args=(user, random.Random(rng.random())))
+        for user in users
+    ]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    total = outcomes['reserved'] + outcomes['conflict'] + outcomes['busy']
+    return {
+        'attempts': total,
+        'reserved': outcomes['reserved'],
+        'conflicts': outcomes['conflict'],
+        'busy': outcomes['busy'],
+        'retries': outcomes['retries'],
+        'seconds': elapsed,
+        'throughput': total / elapsed if elapsed else 0.0,
+        'problems': check_consistency(bus),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Concurrent seat reservation load test: checks for double booking and reports throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--attempts', type=int, default=50, help='Reservations tried per worker')
+        parser.add_argument('--seats', type=int, default=40, help='Seats on the synthetic bus')
+        parser.add_argument('--hot-seats', type=int, default=10, help='Seats every worker competes for')
+        parser.add_argument('--seats-per-booking', type=int, default=2)
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic bus afterwards')
+
+    def handle(self, *args, **options):
+        if not 0 < options['seats_per_booking'] <= options['hot_seats'] <= options['seats']:
+            raise CommandError('Need 0 < --seats-per-booking <= --hot-seats <= --seats')
+        bus = create_load_test_bus(options['seats'])
+        try:
+            report = run_load_test(
+                bus, options['workers'], options['attempts'],
+                options['seats_per_booking'], options['hot_seats'],
+            )
+        finally:
+            if not options['keep']:
+                with transaction.atomic():
+                    BusBooking.objects.filter(bus=bus).delete()
+                    bus.delete()
+
+        self.stdout.write(
+            f"{report['attempts']} attempts in {report['seconds']:.2f}s "
+            f"({report['throughput']:.1f}/s): {report['reserved']} reserved, "
+            f"{report['conflicts']} conflicts, {report['busy']} gave up on lock contention "
+            f"after {report['retries']} retries"
+        )
+        if report['problems']:
+            raise CommandError('; '.join(report['problems']))
+        self.stdout.write(self.style.SUCCESS('No double booking detected'))
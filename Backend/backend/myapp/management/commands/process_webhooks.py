@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.webhooks import WebhookWorkerPool
+
+
+class Command(BaseCommand):
+    help = (
+        'Apply queued payment provider webhooks with a pool of worker threads. '
+        'Run one at a time: events of a booking are kept in order within the pool.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=100, help='Events per worker query')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds an idle worker sleeps')
+        parser.add_argument('--drain', action='store_true', help='Exit once no event is due')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers and --batch-size must be positive')
+        pool = WebhookWorkerPool(options['workers'], options['batch_size'], options['poll'])
+        tried = pool.run(drain=options['drain'])
+        self.stdout.write(f'Processed {tried} webhook event(s)')
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from myapp.search_index import indexed_models, search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search indexes, e.g. after bulk_create or a raw import'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        for model in indexed_models():
+            index = search_index(model, options['database'])
+            if index is None:
+                raise CommandError('This database has no full-text search backend')
+            with transaction.atomic(using=options['database']):
+                index.rebuild()
+            self.stdout.write(f'Rebuilt {index.table}')
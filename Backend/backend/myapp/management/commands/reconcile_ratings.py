@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from myapp.ratings import reconcile_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute rating aggregates from reviews (and operator ratings from buses) after bulk writes'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = reconcile_ratings()
+        for model, count in updated.items():
+            self.stdout.write(f'{model}: {count} row(s) reconciled')
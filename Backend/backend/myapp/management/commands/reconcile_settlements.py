@@ -0,0 +1,46 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.reconciliation import FORMATS, reconcile_settlements
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconcile a provider settlement export (CSV or JSONL with entity_id, type, amount, '
+        'currency and settlement_id) against Payment and Transaction rows. Safe to re-run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='Default: from the file extension')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Lines matched per round trip')
+        parser.add_argument('--subunits', action='store_true', help='Amounts are in paise/cents')
+        parser.add_argument('--show', type=int, default=20, help='Mismatches to list')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        try:
+            with open(path, newline='', encoding='utf-8') as stream:
+                run = reconcile_settlements(
+                    stream, format, source=path, chunk_size=options['chunk_size'], subunits=options['subunits']
+                )
+        except OSError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            f'Run {run.pk}: {run.lines} line(s), {run.matched} matched, {run.updated} payment(s) updated, '
+            f'{run.skipped} skipped, {run.mismatched} mismatched'
+        )
+        mismatches = run.mismatches.order_by('line')
+        kinds = Counter(mismatches.values_list('kind', flat=True))
+        for kind, count in sorted(kinds.items()):
+            self.stdout.write(f'  {kind}: {count}')
+        for mismatch in mismatches[:options['show']]:
+            self.stdout.write(
+                f"  line {mismatch.line}{' ' + mismatch.entity_id if mismatch.entity_id else ''}: {mismatch.kind} "
+                f'(ours {mismatch.ours or "-"}, theirs {mismatch.theirs or "-"})'
+            )
@@ -0,0 +1,17 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from myapp.channel_layers import serve_broker
+
+
+class Command(BaseCommand):
+    help = 'Serve the local channel broker used when CHANNEL_LAYER=broker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--address', default=os.getenv('CHANNEL_BROKER_ADDRESS', '127.0.0.1:9736'))
+        parser.add_argument('--authkey', default=os.getenv('CHANNEL_BROKER_AUTHKEY', 'villagestay-dev'))
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Channel broker listening on {options['address']}")
+        serve_broker(options['address'], options['authkey'])
@@ -1,25 +1,111 @@
-from django.db import models
+import hashlib
+
+from django.db import models, transaction
 from django.conf import settings
+from django.utils import timezone
 from typing import cast
 
-class Homestay(models.Model):
+
+def normalize_place(value):
+    """Case-folded, whitespace-collapsed form of a city or station name"""
+    return ' '.join((value or '').casefold().split())
+
+
+WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+EVERY_DAY = (1 << len(WEEKDAYS)) - 1
+
+
+def running_days_mask(value):
+    """Bitmask of a "Mon,Tue,Wed" running days string; bit n is date.weekday() n"""
+    mask = 0
+    for day in (value or '').replace(',', ' ').split():
+        day = day.casefold()
+        if day == 'daily':
+            return EVERY_DAY
+        if day[:3] in WEEKDAYS:
+            mask |= 1 << WEEKDAYS.index(day[:3])
+    return mask
+
+
+def translation_key(text, source_language, target_language):
+    """Fixed-size lookup key for a text in one language direction"""
+    payload = f'{source_language}\0{target_language}\0{text}'.encode()
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+class PlaceKeyMixin:
+    """Keeps normalized *_key columns in sync with their display columns"""
+
+    place_key_fields = {}
+
+    def set_place_keys(self):
+        for field, key_field in self.place_key_fields.items():
+            setattr(self, key_field, normalize_place(getattr(self, field)))
+
+    def save(self, *args, **kwargs):
+        self.set_place_keys()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            update_fields.update(
+                key_field for field, key_field in self.place_key_fields.items()
+                if field in update_fields
+            )
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
+class RatingSourceMixin:
+    """A row counted in the rating aggregate of its ``rating_target`` FK.
+
+    Signal handlers in signals.py move the row's contribution with F()
+    updates whenever it is saved or deleted; save() runs them in one
+    transaction with the write. ``rating_aggregates`` are the grouped
+    expressions reconcile_ratings recomputes the same sums from.
+    """
+
+    rating_target = None
+    rating_aggregates = {'rating_sum': models.Sum('rating'), 'total_ratings': models.Count('pk')}
+
+    def rating_deltas(self):
+        return {'rating_sum': float(self.rating), 'total_ratings': 1}
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+class Homestay(PlaceKeyMixin, models.Model):
     host = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='hosted_homestays')
     name = models.CharField(max_length=200)
     description = models.TextField()
     address = models.TextField()
     city = models.CharField(max_length=100)
     country = models.CharField(max_length=100)
+    city_key = models.CharField(max_length=100, editable=False, default='')
+    country_key = models.CharField(max_length=100, editable=False, default='')
+    place_key_fields = {'city': 'city_key', 'country': 'country_key'}
+    # Full-text indexed columns and their weights (see search_index.py)
+    search_index_fields = {'name': 'A', 'address': 'B', 'description': 'C'}
     price_per_night = models.DecimalField(max_digits=10, decimal_places=2)
     total_rooms = models.IntegerField()
     available_rooms = models.IntegerField()
     amenities = models.JSONField(default=list)
     house_rules = models.JSONField(default=list)
     photos = models.JSONField(default=list)  # Store photo URLs
+    # rating = rating_sum / total_ratings over reviews (see RatingSourceMixin)
     rating = models.FloatField(default=0.0) # pyright: ignore[reportArgumentType]
+    rating_sum = models.FloatField(default=0.0, editable=False) # pyright: ignore[reportArgumentType]
+    total_ratings = models.IntegerField(default=0, editable=False) # pyright: ignore[reportArgumentType]
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True) # pyright: ignore[reportArgumentType]
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['city_key', 'country_key']),
+            models.Index(fields=['price_per_night']),
+            models.Index(fields=['rating']),
+        ]
+
     def _str_(self):
         return f"{self.name} - {self.city}"
 
@@ -42,10 +128,18 @@ class Booking(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     special_requests = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Room checks count one homestay's stays by date range
+            models.Index(fields=['homestay', 'check_in', 'check_out']),
+        ]
+
     def _str_(self):
         return f"{self.user.username} - {self.homestay.name} ({self.check_in} to {self.check_out})"
 
-class Review(models.Model):
+class Review(RatingSourceMixin, models.Model):
+    rating_target = 'homestay'
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reviews')
     homestay = models.ForeignKey(Homestay, on_delete=models.CASCADE, related_name='reviews')
     booking = models.OneToOneField(Booking, on_delete=models.CASCADE, related_name='review')
@@ -93,14 +187,18 @@ class Transaction(models.Model):
     transaction_type = models.CharField(max_length=20, choices=TYPE_CHOICES)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.CharField(max_length=3, default='USD')
-    provider_transaction_id = models.CharField(max_length=100)
-    created_at = models.DateTimeField(auto_now_add=True)
+    provider_transaction_id = models.CharField(max_length=100, db_index=True)
+    # Provider settlement this transaction was reconciled in (see reconciliation.py)
+    settlement_id = models.CharField(max_length=100, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     metadata = models.JSONField(default=dict)  # Store additional transaction details
 
     def _str_(self):
         return f"{self.transaction_type} - {self.amount} {self.currency}"
 
 class TranslationsCache(models.Model):
+    # translation_key() of the text and languages; unique in place of the text itself
+    key = models.CharField(max_length=32, unique=True, editable=False)
     source_text = models.TextField()
     source_language = models.CharField(max_length=10)
     target_language = models.CharField(max_length=10)
@@ -110,7 +208,13 @@ class TranslationsCache(models.Model):
     use_count = models.IntegerField(default=1)
 
     class Meta:
-        unique_together = ('source_text', 'source_language', 'target_language')
+        indexes = [
+            models.Index(fields=['last_used', 'use_count']),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.key = translation_key(self.source_text, self.source_language, self.target_language)
+        super().save(*args, **kwargs)
 
     def _str_(self):
         return f"Translation from {self.source_language} to {self.target_language}"
@@ -150,10 +254,114 @@ class AILog(models.Model):
     query = models.TextField()
     response = models.TextField()
     context = models.JSONField(default=dict)  # Store conversation context
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when the interaction is logged, not when the buffered row is written
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
     feedback = models.IntegerField(null=True, blank=True)  # User feedback score
     processing_time = models.FloatField()  # Time taken to process the request
 
+class RetentionSummary(models.Model):
+    """Per-day totals of rows a retention policy archived (see retention.py)"""
+    policy = models.CharField(max_length=50)
+    day = models.DateField()
+    row_count = models.IntegerField(default=0) # pyright: ignore[reportArgumentType]
+    data = models.JSONField(default=dict)
+
+    class Meta:
+        unique_together = ['policy', 'day']
+
+    def __str__(self):
+        return f"{self.policy} {self.day}: {self.row_count} rows"
+
+class RetentionCursor(models.Model):
+    """Where an interrupted archive run resumes: the day in progress, the
+    last row id written to its archive file and the file's committed size"""
+    policy = models.CharField(max_length=50, unique=True)
+    day = models.DateField()
+    last_id = models.BigIntegerField(default=0) # pyright: ignore[reportArgumentType]
+    archive_offset = models.BigIntegerField(default=0) # pyright: ignore[reportArgumentType]
+
+    def __str__(self):
+        return f"{self.policy} at {self.day} #{self.last_id}"
+
+class ReconciliationRun(models.Model):
+    """One pass of a provider settlement export (see reconciliation.py)"""
+    source = models.CharField(max_length=255)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    lines = models.IntegerField(default=0) # pyright: ignore[reportArgumentType]
+    matched = models.IntegerField(default=0) # pyright: ignore[reportArgumentType]
+    updated = models.IntegerField(default=0) # pyright: ignore[reportArgumentType]
+    skipped = models.IntegerField(default=0) # pyright: ignore[reportArgumentType]
+    mismatched = models.IntegerField(default=0) # pyright: ignore[reportArgumentType]
+
+    def __str__(self):
+        return f"{self.source}: {self.matched}/{self.lines} matched"
+
+class ReconciliationMismatch(models.Model):
+    """A settlement line that could not be reconciled, with our value and the provider's"""
+    KIND_CHOICES = [
+        ('missing', 'No matching payment or transaction'),
+        ('amount', 'Amount differs'),
+        ('currency', 'Currency differs'),
+        ('status', 'Status cannot change'),
+        ('duplicate', 'Repeated in the export'),
+        ('invalid', 'Unreadable line'),
+    ]
+
+    run = models.ForeignKey(ReconciliationRun, on_delete=models.CASCADE, related_name='mismatches')
+    line = models.IntegerField()
+    entity_id = models.CharField(max_length=100, blank=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    ours = models.CharField(max_length=100, blank=True)
+    theirs = models.CharField(max_length=100, blank=True)
+
+    def __str__(self):
+        return f"{self.entity_id or 'line ' + str(self.line)}: {self.kind}"
+
+class WebhookEvent(models.Model):
+    """A verified payment provider callback, stored as received (see webhooks.py).
+
+    Events with the same ordering_key (their booking, else their payment)
+    are applied in id order; partition spreads keys over worker threads.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('review', 'Needs refund or review'),
+        ('failed', 'Failed'),
+    ]
+
+    event_id = models.CharField(max_length=100, unique=True)
+    event_type = models.CharField(max_length=100)
+    body = models.TextField()
+    ordering_key = models.CharField(max_length=100, db_index=True)
+    partition = models.PositiveSmallIntegerField() # pyright: ignore[reportArgumentType]
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0) # pyright: ignore[reportArgumentType]
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'partition', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} {self.event_id} ({self.status})"
+
+class AILatencyRollup(models.Model):
+    """Histogram of AILog.processing_time for one hour (see ai_logs.py)"""
+    hour = models.DateTimeField(unique=True)
+    count = models.IntegerField(default=0) # pyright: ignore[reportArgumentType]
+    total = models.FloatField(default=0.0) # pyright: ignore[reportArgumentType]
+    max_time = models.FloatField(default=0.0) # pyright: ignore[reportArgumentType]
+    buckets = models.JSONField(default=dict)  # Log-scale bucket index -> count
+
+    def __str__(self):
+        return f"AI latency {self.hour:%Y-%m-%d %H:00} ({self.count})"
+
 class User(models.Model):
     PREFERENCE_CHOICES = [
         ('traveller', 'Traveller'),
@@ -183,7 +391,7 @@ class User(models.Model):
     def __str__(self):
         return self.phone or self.email or "Unnamed User"
     
-class Train(models.Model):
+class Train(PlaceKeyMixin, models.Model):
     TRAIN_CLASSES = [
         ('ALL', 'All Classes'),
         ('SL', 'Sleeper (SL)'),
@@ -197,11 +405,16 @@ class Train(models.Model):
     name = models.CharField(max_length=100)
     from_station = models.CharField(max_length=100)
     to_station = models.CharField(max_length=100)
+    from_station_key = models.CharField(max_length=100, editable=False, default='')
+    to_station_key = models.CharField(max_length=100, editable=False, default='')
+    place_key_fields = {'from_station': 'from_station_key', 'to_station': 'to_station_key'}
     departure_time = models.TimeField()
     arrival_time = models.TimeField()
     duration = models.CharField(max_length=20)  # Store as "HH:mm" format
     distance = models.IntegerField(help_text="Distance in kilometers")
     running_days = models.CharField(max_length=100)  # Store as "Mon,Tue,Wed" etc
+    # running_days as a weekday bitmask, kept in sync by save()
+    running_days_mask = models.PositiveSmallIntegerField(default=0, editable=False) # pyright: ignore[reportArgumentType]
     classes_available = models.CharField(
         max_length=20,
         choices=TRAIN_CLASSES,
@@ -214,13 +427,24 @@ class Train(models.Model):
     class Meta:
         ordering = ['departure_time']
         indexes = [
-            models.Index(fields=['from_station', 'to_station']),
+            models.Index(fields=['from_station_key', 'to_station_key']),
+            models.Index(fields=['to_station_key']),
             models.Index(fields=['departure_time']),
         ]
 
     def __str__(self):
         return f"{self.number} - {self.name}"
 
+    def set_running_days_mask(self):
+        self.running_days_mask = running_days_mask(self.running_days)
+
+    def save(self, *args, **kwargs):
+        self.set_running_days_mask()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'running_days' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'running_days_mask'}
+        super().save(*args, **kwargs)
+
 class TrainClass(models.Model):
     train = models.ForeignKey(Train, related_name='class_details', on_delete=models.CASCADE)
     class_type = models.CharField(max_length=3, choices=Train.TRAIN_CLASSES)
@@ -243,15 +467,23 @@ class BusOperator(models.Model):
     name = models.CharField(max_length=200)  # e.g. "UPSRTC", "Laxmi holidays"
     logo = models.URLField(blank=True)
     description = models.TextField()  # e.g. "Uttar Pradesh State Road Transport Corporation"
+    # Mean of the operator's bus ratings, weighted by each bus's total_ratings
     rating = models.FloatField(default=0.0) # pyright: ignore[reportArgumentType]
+    rating_sum = models.FloatField(default=0.0, editable=False) # pyright: ignore[reportArgumentType]
+    total_ratings = models.IntegerField(default=0, editable=False) # pyright: ignore[reportArgumentType]
     total_buses = models.IntegerField(default=0) # pyright: ignore[reportArgumentType]
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['rating']),
+        ]
+
     def __str__(self):
         return self.name
 
-class Bus(models.Model):
+class Bus(RatingSourceMixin, PlaceKeyMixin, models.Model):
     SEAT_TYPE_CHOICES = [
         ('seater', 'Seater'),
         ('sleeper', 'Sleeper'),
@@ -264,6 +496,16 @@ class Bus(models.Model):
     bus_type = models.CharField(max_length=100)  # e.g. "Bharat Benz A/C Seater / Sleeper (2+1)"
     from_city = models.CharField(max_length=100)
     to_city = models.CharField(max_length=100)
+    from_city_key = models.CharField(max_length=100, editable=False, default='')
+    to_city_key = models.CharField(max_length=100, editable=False, default='')
+    place_key_fields = {'from_city': 'from_city_key', 'to_city': 'to_city_key'}
+    # Buses feed their operator's rating, weighted by their own rating counts
+    rating_target = 'operator'
+    rating_aggregates = {
+        'rating_sum': models.Sum(models.F('rating') * models.F('total_ratings')),
+        'total_ratings': models.Sum('total_ratings'),
+        'total_buses': models.Count('pk'),
+    }
     departure_time = models.DateTimeField()
     arrival_time = models.DateTimeField()
     duration = models.CharField(max_length=20)  # Store as "HH:mm" format
@@ -281,13 +523,21 @@ class Bus(models.Model):
 
     class Meta:
         indexes = [
-            models.Index(fields=['from_city', 'to_city']),
+            models.Index(fields=['from_city_key', 'to_city_key']),
+            models.Index(fields=['to_city_key']),
             models.Index(fields=['departure_time']),
         ]
 
     def __str__(self):
         return f"{self.operator.name} - {self.bus_type} ({self.from_city} to {self.to_city})"
 
+    def rating_deltas(self):
+        return {
+            'rating_sum': self.rating * self.total_ratings,
+            'total_ratings': self.total_ratings,
+            'total_buses': 1,
+        }
+
 class BusSeat(models.Model):
     SEAT_STATUS_CHOICES = [
         ('available', 'Available'),
@@ -306,6 +556,9 @@ class BusSeat(models.Model):
 
     class Meta:
         unique_together = ['bus', 'seat_number']
+        indexes = [
+            models.Index(fields=['bus', 'status']),
+        ]
 
     def __str__(self):
         return f"{self.bus.bus_number} - Seat {self.seat_number}"
@@ -326,13 +579,49 @@ class BusBooking(models.Model):
     total_fare = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     cancellation_allowed = models.BooleanField(default=True)
+    hold_expires_at = models.DateTimeField(null=True, blank=True)  # Unpaid seat holds lapse after this
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'hold_expires_at']),
+        ]
+
     def __str__(self):
         return f"Booking {self.id} - {self.user.username} ({self.bus.bus_number})"
     
-class Property(models.Model):
+class PropertyQuerySet(models.QuerySet):
+    def with_listing_data(self):
+        """Join the host so listings serialize in one query"""
+        # Reviews are counted incrementally into total_ratings
+        return self.select_related('host').annotate(rating_count=models.F('total_ratings'))
+
+    def available_between(self, check_in, check_out, guests=None):
+        """Properties bookable for every night in [check_in, check_out)"""
+        nights = (check_out - check_in).days
+        # Group the calendar rows per property: every night must be open and
+        # the stay must satisfy the longest minimum_stay among those nights
+        open_calendars = (
+            PropertyAvailability.objects
+            .filter(date__gte=check_in, date__lt=check_out, is_available=True)
+            .values('property')
+            .annotate(open_nights=models.Count('id'), longest_minimum_stay=models.Max('minimum_stay'))
+            .filter(open_nights=nights, longest_minimum_stay__lte=nights)
+            .values('property')
+        )
+        overlapping = PropertyBooking.objects.filter(
+            property=models.OuterRef('pk'),
+            status='confirmed',
+            check_in__lt=check_out,
+            check_out__gt=check_in,
+        )
+        queryset = self.filter(pk__in=open_calendars).exclude(models.Exists(overlapping))
+        if guests:
+            queryset = queryset.filter(max_guests__gte=guests)
+        return queryset
+
+class Property(PlaceKeyMixin, models.Model):
     PROPERTY_TYPE_CHOICES = [
         ('cabin', 'Mountain Cabin'),
         ('houseboat', 'Houseboat'),
@@ -349,12 +638,18 @@ class Property(models.Model):
     location = models.CharField(max_length=200)  # e.g. "Himachal Pradesh, India"
     state = models.CharField(max_length=100)
     city = models.CharField(max_length=100)
+    state_key = models.CharField(max_length=100, editable=False, default='')
+    city_key = models.CharField(max_length=100, editable=False, default='')
+    place_key_fields = {'state': 'state_key', 'city': 'city_key'}
+    search_index_fields = {'name': 'A', 'location': 'B', 'description': 'C'}
     description = models.TextField()
     max_guests = models.IntegerField()
     bedrooms = models.IntegerField()
     bathrooms = models.IntegerField()
     price_per_night = models.DecimalField(max_digits=10, decimal_places=2)
+    # rating = rating_sum / total_ratings over reviews (see RatingSourceMixin)
     rating = models.FloatField(default=0.0)  # pyright: ignore[reportArgumentType]
+    rating_sum = models.FloatField(default=0.0, editable=False)  # pyright: ignore[reportArgumentType]
     total_ratings = models.IntegerField(default=0)  # pyright: ignore[reportArgumentType]
     instant_book = models.BooleanField(default=False)   # pyright: ignore[reportArgumentType]
     verified_host = models.BooleanField(default=False)  # pyright: ignore[reportArgumentType]
@@ -366,11 +661,14 @@ class Property(models.Model):
     photos = models.JSONField(default=list)  # List of photo URLs
     photo_count = models.IntegerField(default=0)   # pyright: ignore[reportArgumentType]
     is_active = models.BooleanField(default=True)  # pyright: ignore[reportArgumentType]
+
+    objects = PropertyQuerySet.as_manager()
     
     class Meta:
         verbose_name_plural = 'Properties'
         indexes = [
             models.Index(fields=['city', 'state']),
+            models.Index(fields=['city_key', 'state_key']),
             models.Index(fields=['price_per_night']),
             models.Index(fields=['rating']),
         ]
@@ -390,11 +688,16 @@ class PropertyAvailability(models.Model):
     class Meta:
         unique_together = ['property', 'date']
         verbose_name_plural = 'Property Availabilities'
+        indexes = [
+            models.Index(fields=['date', 'is_available']),
+        ]
 
     def __str__(self):
         return f"{self.property.name} - {self.date}"
 
-class PropertyReview(models.Model):
+class PropertyReview(RatingSourceMixin, models.Model):
+    rating_target = 'property'
+
     property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='reviews')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     rating = models.FloatField()
@@ -409,10 +712,13 @@ class PropertyReview(models.Model):
 
     class Meta:
         unique_together = ['property', 'user']
-        indexes = [models.Index(fields=['rating'])]
+        indexes = [
+            models.Index(fields=['rating']),
+            models.Index(fields=['property', '-created_at']),
+        ]
 
     def __str__(self):
-        return f"Review for {self.property.name} by {self.user.username}"
+        return f"Review for {self.property.name} by {self.user.get_username()}"
 
 class PropertyBooking(models.Model):
     STATUS_CHOICES = [
@@ -438,7 +744,8 @@ class PropertyBooking(models.Model):
 
     class Meta:
         indexes = [
-            models.Index(fields=['check_in', 'check_out']),
+            # Overlap checks filter one property's stays by date range
+            models.Index(fields=['property', 'check_in', 'check_out']),
             models.Index(fields=['status']),
         ]
 
@@ -454,7 +761,8 @@ class OAuthProfile(models.Model):
 
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='oauth_profile')
     provider = models.CharField(max_length=20, choices=PROVIDER_CHOICES)
-    provider_user_id = models.CharField(max_length=255, unique=True)
+    # Unique per provider (see Meta), not across providers
+    provider_user_id = models.CharField(max_length=255)
     access_token = models.TextField(blank=True, null=True)
     refresh_token = models.TextField(blank=True, null=True)
     token_expires_at = models.DateTimeField(blank=True, null=True)
@@ -468,6 +776,16 @@ class OAuthProfile(models.Model):
 
     def __str__(self):
         return f"{self.user.name} - {self.provider}"
+
+
+class RevokedToken(models.Model):
+    """A JWT revoked before it expired, by its jti claim"""
+    jti = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.jti
     
 
 
@@ -484,7 +802,7 @@ class Cab(models.Model):
         ('mini_van', 'Mini Van'),
     ]
 
-    operator = models.ForeignKey(BusOperator, on_delete=models.CASCADE, related_name='buses')
+    operator = models.ForeignKey(BusOperator, on_delete=models.CASCADE, related_name='cabs')
     car_number = models.CharField(max_length=20)
     car_type = models.CharField(max_length=100)  # e.g. "Bharat Benz A/C Seater / Sleeper (2+1)"
     from_city = models.CharField(max_length=100)
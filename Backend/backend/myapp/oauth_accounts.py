@@ -0,0 +1,138 @@
+from django.db import transaction
+from django.db.models import Q
+
+from .models import OAuthProfile, User
+
+
+class AccountConflict(Exception):
+    """The email belongs to a user already signed in with another OAuth account"""
+
+
+def new_oauth_user(user_data):
+    return User(
+        email=user_data.get('email') or None,
+        name=user_data.get('name', ''),
+        preference='traveller',  # Default preference
+        is_verified=True  # OAuth users are considered verified
+    )
+
+
+def new_oauth_profile(user, provider, user_data):
+    return OAuthProfile(
+        user=user,
+        provider=provider,
+        provider_user_id=str(user_data['id']),
+        profile_picture=user_data.get('picture', '')
+    )
+
+
+def upsert_users_by_email(users):
+    """INSERT ... ON CONFLICT (email) for users with an email; sets each pk"""
+    # Updating email to itself is a no-op that still returns the existing pk
+    return User.objects.bulk_create(
+        users, update_conflicts=True, unique_fields=['email'], update_fields=['email']
+    )
+
+
+def get_or_create_user_from_oauth(provider, user_data):
+    """Get or create user from OAuth data.
+
+    One joined query finds the user by OAuth profile or email. A first
+    login then upserts the user on its email and inserts the profile with
+    ON CONFLICT DO NOTHING, so simultaneous first logins for one account
+    end up on the same user instead of failing on the unique constraints.
+    ``is_new`` is True when no account existed before this login.
+
+    A user has one OAuth profile, so an email whose user is already tied
+    to another provider account raises AccountConflict instead of
+    returning a user without a profile for this one.
+    """
+    provider_user_id = str(user_data['id'])
+    email = user_data.get('email') or None
+
+    match = Q(oauth_profile__provider=provider, oauth_profile__provider_user_id=provider_user_id)
+    if email:
+        match |= Q(email=email)
+    candidates = list(User.objects.filter(match).select_related('oauth_profile')[:2])
+    for user in candidates:
+        profile = getattr(user, 'oauth_profile', None)
+        if profile is not None and (profile.provider, profile.provider_user_id) == (provider, provider_user_id):
+            return user, False  # False = existing user
+
+    if candidates and getattr(candidates[0], 'oauth_profile', None) is not None:
+        raise AccountConflict(
+            f'{email} is already signed in with {candidates[0].oauth_profile.get_provider_display()}'
+        )
+
+    with transaction.atomic():
+        if candidates:
+            # User exists by email but has no profile for this account
+            user, is_new = candidates[0], False
+        elif email:
+            user, is_new = upsert_users_by_email([new_oauth_user(user_data)])[0], True
+        else:
+            user, is_new = new_oauth_user(user_data), True
+            user.save()
+
+        OAuthProfile.objects.bulk_create(
+            [new_oauth_profile(user, provider, user_data)], ignore_conflicts=True
+        )
+        profiles = OAuthProfile.objects.filter(provider=provider, provider_user_id=provider_user_id)
+        if not is_new and not profiles.filter(user=user).exists():
+            # Another account was linked to this user since the lookup
+            raise AccountConflict(f'{email} is already signed in with another account')
+        if is_new and not email:
+            # Without an email nothing ties racing first logins to one user:
+            # the profile insert picks the winner and the loser's user goes
+            owner_id = profiles.values_list('user_id', flat=True).first()
+            if owner_id != user.pk:
+                user.delete()
+                user = User.objects.get(pk=owner_id)
+
+    return user, is_new
+
+
+def import_oauth_users(provider, records, batch_size=500):
+    """Bulk version of get_or_create_user_from_oauth for migrations.
+
+    ``records`` are normalized user dicts (id, email, name, picture).
+    Each batch costs a fixed number of queries regardless of its size.
+    Returns counts of created users, existing users linked by email, and
+    records whose account already existed.
+    """
+    counts = {'created': 0, 'linked': 0, 'existing': 0}
+    records = list({str(record['id']): record for record in records}.values())
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        with transaction.atomic():
+            known = set(OAuthProfile.objects.filter(
+                provider=provider, provider_user_id__in=[str(record['id']) for record in batch]
+            ).values_list('provider_user_id', flat=True))
+            pending = [record for record in batch if str(record['id']) not in known]
+            counts['existing'] += len(batch) - len(pending)
+
+            emails = {record['email'] for record in pending if record.get('email')}
+            by_email = {user.email: user for user in User.objects.filter(email__in=emails)}
+            counts['linked'] += sum(1 for record in pending if record.get('email') in by_email)
+
+            with_email = {
+                record['email']: new_oauth_user(record) for record in pending
+                if record.get('email') and record['email'] not in by_email
+            }
+            for user in upsert_users_by_email(list(with_email.values())):
+                by_email[user.email] = user
+            without_email = User.objects.bulk_create([
+                new_oauth_user(record) for record in pending if not record.get('email')
+            ])
+            counts['created'] += len(with_email) + len(without_email)
+
+            anonymous = iter(without_email)
+            profiles = [
+                new_oauth_profile(
+                    by_email[record['email']] if record.get('email') else next(anonymous),
+                    provider, record,
+                )
+                for record in pending
+            ]
+            OAuthProfile.objects.bulk_create(profiles, ignore_conflicts=True)
+    return counts
@@ -0,0 +1,62 @@
+import asyncio
+import random
+import weakref
+
+import httpx
+
+# One pool per event loop: under ASGI that is one pool per worker process,
+# so TLS connections to the providers are reused across logins.
+LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30)
+RETRY_STATUSES = {429, 502, 503, 504}
+# Errors raised before the request reached the provider; safe to retry a POST
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+BACKOFF_BASE = 0.2
+BACKOFF_MAX = 2.0
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    """The shared keep-alive client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = _clients[loop] = httpx.AsyncClient(limits=LIMITS, follow_redirects=False)
+    return client
+
+
+async def close_client():
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def backoff_delay(attempt, response=None):
+    if response is not None:
+        retry_after = response.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            return min(int(retry_after), BACKOFF_MAX)
+    return min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX) + random.uniform(0, BACKOFF_BASE / 2)
+
+
+async def provider_request(config, method, url, **kwargs):
+    """Call an OAuth provider with its timeout, retrying transient failures.
+
+    GETs are retried on any transport error; POSTs (which may redeem a
+    one-time code) only when the connection was never made. Both are
+    retried on 429/502/503/504. Raises httpx errors once retries run out.
+    """
+    retries = config.get('retries', 2)
+    for attempt in range(retries + 1):
+        response = None
+        try:
+            response = await get_client().request(method, url, timeout=config['timeout'], **kwargs)
+        except httpx.TransportError as e:
+            retryable = isinstance(e, CONNECT_ERRORS) or method == 'GET'
+            if not retryable or attempt == retries:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                response.raise_for_status()
+                return response
+        await asyncio.sleep(backoff_delay(attempt, response))
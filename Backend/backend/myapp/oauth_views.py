@@ -1,6 +1,8 @@
-import requests
 import json
 from datetime import datetime, timedelta
+import httpx
+import jwt
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth import authenticate, login
 from django.http import JsonResponse
@@ -10,8 +12,13 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import User, OAuthProfile
+from .authentication import denylist, issue_tokens
+from .id_tokens import verify_google_id_token
+from .models import User
+from .oauth_accounts import AccountConflict, get_or_create_user_from_oauth
+from .oauth_client import provider_request
 from .serializers import UserSerializer
 
 # OAuth Configuration
@@ -21,69 +28,28 @@ OAUTH_CONFIG = {
         'userinfo_url': 'https://www.googleapis.com/oauth2/v2/userinfo',
         'client_id': getattr(settings, 'GOOGLE_CLIENT_ID', ''),
         'client_secret': getattr(settings, 'GOOGLE_CLIENT_SECRET', ''),
+        'timeout': httpx.Timeout(5.0, connect=3.0),
+        'retries': 2,
     },
     'facebook': {
         'token_url': 'https://graph.facebook.com/v12.0/oauth/access_token',
         'userinfo_url': 'https://graph.facebook.com/me',
         'client_id': getattr(settings, 'FACEBOOK_CLIENT_ID', ''),
         'client_secret': getattr(settings, 'FACEBOOK_CLIENT_SECRET', ''),
+        'timeout': httpx.Timeout(8.0, connect=3.0),
+        'retries': 2,
     },
     'github': {
         'token_url': 'https://github.com/login/oauth/access_token',
         'userinfo_url': 'https://api.github.com/user',
         'client_id': getattr(settings, 'GITHUB_CLIENT_ID', ''),
         'client_secret': getattr(settings, 'GITHUB_CLIENT_SECRET', ''),
+        'timeout': httpx.Timeout(10.0, connect=3.0),
+        'retries': 2,
     }
 }
 
-def get_or_create_user_from_oauth(provider, user_data):
-    """Get or create user from OAuth data"""
-    try:
-        # Try to find existing OAuth profile
-        oauth_profile = OAuthProfile.objects.get(
-            provider=provider,
-            provider_user_id=user_data['id']
-        )
-        return oauth_profile.user, False  # False = existing user
-    except OAuthProfile.DoesNotExist:
-        # Create new user and OAuth profile
-        email = user_data.get('email')
-        name = user_data.get('name', '')
-        
-        # Check if user with this email already exists
-        if email:
-            try:
-                user = User.objects.get(email=email)
-                # User exists but no OAuth profile, create one
-                oauth_profile = OAuthProfile.objects.create(
-                    user=user,
-                    provider=provider,
-                    provider_user_id=user_data['id'],
-                    profile_picture=user_data.get('picture', '')
-                )
-                return user, False
-            except User.DoesNotExist:
-                pass
-        
-        # Create new user
-        user = User.objects.create(
-            email=email,
-            name=name,
-            preference='traveller',  # Default preference
-            is_verified=True  # OAuth users are considered verified
-        )
-        
-        # Create OAuth profile
-        oauth_profile = OAuthProfile.objects.create(
-            user=user,
-            provider=provider,
-            provider_user_id=user_data['id'],
-            profile_picture=user_data.get('picture', '')
-        )
-        
-        return user, True  # True = new user
-
-def exchange_code_for_token(provider, code, redirect_uri):
+async def exchange_code_for_token(provider, code, redirect_uri):
     """Exchange authorization code for access token"""
     config = OAUTH_CONFIG.get(provider)
     if not config:
@@ -99,8 +65,7 @@ def exchange_code_for_token(provider, code, redirect_uri):
     
     headers = {'Accept': 'application/json'}
     
-    response = requests.post(config['token_url'], data=token_data, headers=headers)
-    response.raise_for_status()
+    response = await provider_request(config, 'POST', config['token_url'], data=token_data, headers=headers)
     
     token_response = response.json()
     
@@ -109,7 +74,7 @@ def exchange_code_for_token(provider, code, redirect_uri):
     
     return token_response.get('access_token')
 
-def get_user_info(provider, access_token):
+async def get_user_info(provider, access_token):
     """Get user information from OAuth provider"""
     config = OAUTH_CONFIG.get(provider)
     if not config:
@@ -120,8 +85,7 @@ def get_user_info(provider, access_token):
     if provider == 'github':
         headers['Accept'] = 'application/vnd.github.v3+json'
     
-    response = requests.get(config['userinfo_url'], headers=headers)
-    response.raise_for_status()
+    response = await provider_request(config, 'GET', config['userinfo_url'], headers=headers)
     
     user_data = response.json()
     
@@ -135,6 +99,25 @@ def get_user_info(provider, access_token):
     
     return normalized_data
 
+def oauth_login_payload(provider, user_data):
+    """Get or create the user and issue JWT tokens"""
+    user, is_new = get_or_create_user_from_oauth(provider, user_data)
+    return {
+        'user': UserSerializer(user).data,
+        **issue_tokens(user),
+        'is_new_user': is_new
+    }
+
+def read_payload(request):
+    """Request data from a JSON or form encoded body"""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+    return request.POST
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def google_oauth(request):
@@ -144,14 +127,10 @@ def google_oauth(request):
         if not credential:
             return Response({'error': 'Credential is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Verify Google ID token (you should implement proper verification)
-        # For now, we'll decode it to get user info
-        import base64
-        import jwt
-        
         try:
-            # Decode the ID token (without verification for demo)
-            decoded = jwt.decode(credential, options={"verify_signature": False})
+            # Signature, audience, issuer and expiry are checked against
+            # Google's cached signing keys
+            decoded = verify_google_id_token(credential)
             
             user_data = {
                 'id': decoded.get('sub'),
@@ -160,91 +139,68 @@ def google_oauth(request):
                 'picture': decoded.get('picture', '')
             }
             
-            user, is_new = get_or_create_user_from_oauth('google', user_data)
-            
-            # Generate JWT tokens
-            refresh = RefreshToken.for_user(user)
-            
-            return Response({
-                'user': UserSerializer(user).data,
-                'token': str(refresh.access_token),
-                'refresh': str(refresh),
-                'is_new_user': is_new
-            })
+            return Response(oauth_login_payload('google', user_data))
             
         except jwt.InvalidTokenError:
             return Response({'error': 'Invalid credential'}, status=status.HTTP_400_BAD_REQUEST)
             
+    except AccountConflict as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-@api_view(['POST'])
-@permission_classes([AllowAny])
-def facebook_oauth(request):
+@csrf_exempt
+@require_http_methods(['POST'])
+async def facebook_oauth(request):
     """Handle Facebook OAuth"""
     try:
-        access_token = request.data.get('access_token')
+        access_token = read_payload(request).get('access_token')
         if not access_token:
-            return Response({'error': 'Access token is required'}, status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse({'error': 'Access token is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Get user info from Facebook
-        user_data = get_user_info('facebook', access_token)
-        
-        user, is_new = get_or_create_user_from_oauth('facebook', user_data)
-        
-        # Generate JWT tokens
-        refresh = RefreshToken.for_user(user)
+        # Get user info from Facebook without holding a worker thread
+        user_data = await get_user_info('facebook', access_token)
         
-        return Response({
-            'user': UserSerializer(user).data,
-            'token': str(refresh.access_token),
-            'refresh': str(refresh),
-            'is_new_user': is_new
-        })
+        return JsonResponse(await sync_to_async(oauth_login_payload)('facebook', user_data))
         
+    except AccountConflict as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_409_CONFLICT)
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-@api_view(['POST'])
-@permission_classes([AllowAny])
-def oauth_callback(request):
+@csrf_exempt
+@require_http_methods(['POST'])
+async def oauth_callback(request):
     """Handle OAuth callback for providers that use authorization code flow"""
     try:
-        code = request.data.get('code')
-        provider = request.data.get('provider')
-        redirect_uri = request.data.get('redirect_uri')
+        data = read_payload(request)
+        code = data.get('code')
+        provider = data.get('provider')
+        redirect_uri = data.get('redirect_uri')
         
         if not all([code, provider, redirect_uri]):
-            return Response({
+            return JsonResponse({
                 'error': 'Code, provider, and redirect_uri are required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
         if provider not in OAUTH_CONFIG:
-            return Response({
+            return JsonResponse({
                 'error': f'Unsupported provider: {provider}'
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # Exchange code for access token
-        access_token = exchange_code_for_token(provider, code, redirect_uri)
+        access_token = await exchange_code_for_token(provider, code, redirect_uri)
         
         # Get user info
-        user_data = get_user_info(provider, access_token)
-        
-        # Get or create user
-        user, is_new = get_or_create_user_from_oauth(provider, user_data)
-        
-        # Generate JWT tokens
-        refresh = RefreshToken.for_user(user)
+        user_data = await get_user_info(provider, access_token)
         
-        return Response({
-            'user': UserSerializer(user).data,
-            'token': str(refresh.access_token),
-            'refresh': str(refresh),
-            'is_new_user': is_new
-        })
+        # Get or create user and issue tokens in one trip to a sync thread
+        return JsonResponse(await sync_to_async(oauth_login_payload)(provider, user_data))
         
+    except AccountConflict as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_409_CONFLICT)
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -275,12 +231,9 @@ def traditional_login(request):
             }, status=status.HTTP_401_UNAUTHORIZED)
         
         # Generate JWT tokens
-        refresh = RefreshToken.for_user(user)
-        
         return Response({
             'user': UserSerializer(user).data,
-            'token': str(refresh.access_token),
-            'refresh': str(refresh)
+            **issue_tokens(user)
         })
         
     except Exception as e:
@@ -323,14 +276,36 @@ def traditional_register(request):
         user.save()
         
         # Generate JWT tokens
-        refresh = RefreshToken.for_user(user)
-        
         return Response({
             'user': UserSerializer(user).data,
-            'token': str(refresh.access_token),
-            'refresh': str(refresh),
+            **issue_tokens(user),
             'is_new_user': True
         })
         
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR) 
\ No newline at end of file
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def refresh_access_token(request):
+    """New access token for an unrevoked refresh token"""
+    try:
+        refresh = RefreshToken(request.data.get('refresh', ''))
+    except TokenError as e:
+        return Response({'error': str(e)}, status=status.HTTP_401_UNAUTHORIZED)
+    if denylist.is_revoked(refresh.get('jti')):
+        return Response({'error': 'Token has been revoked'}, status=status.HTTP_401_UNAUTHORIZED)
+    return Response({'token': str(refresh.access_token)})
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def logout(request):
+    """Revoke the refresh token, and the access token the request came with"""
+    try:
+        refresh = RefreshToken(request.data.get('refresh', ''))
+    except TokenError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    denylist.revoke(refresh)
+    if request.auth is not None and 'jti' in request.auth:
+        denylist.revoke(request.auth)
+    return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,188 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination that seeks on (ordering field, id).
+
+    A page is fetched as ``WHERE (field, id) > (last field, last id)
+    ORDER BY field, id LIMIT n``. Unlike page numbers there is no COUNT(*)
+    and no OFFSET, so page 500 costs the same as page 1. Only single-field
+    orderings listed in the view's ``keyset_ordering_fields`` are allowed;
+    those fields should be indexed and non-null. Without an ``ordering``
+    param pages are in id order.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    ordering_query_param = api_settings.ORDERING_PARAM
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.field, self.descending = self.get_ordering(request, queryset.model, view)
+        cursor = self.decode_cursor(request)
+        self.reverse = bool(cursor and cursor['reverse'])
+
+        # Walking backwards reads the rows before the cursor in inverted order
+        descending = self.descending != self.reverse
+        direction = '-' if descending else ''
+        queryset = queryset.order_by(f'{direction}{self.field.name}', f'{direction}pk')
+        if cursor:
+            queryset = queryset.filter(self.after(cursor['value'], cursor['pk'], descending))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.page = rows
+        return rows
+
+    def after(self, value, pk, descending):
+        # The leading range condition lets the database seek the field index
+        op, op_or_equal = ('lt', 'lte') if descending else ('gt', 'gte')
+        field = self.field.name
+        return Q(**{f'{field}__{op_or_equal}': value}) & (
+            Q(**{f'{field}__{op}': value}) | Q(**{f'pk__{op}': pk})
+        )
+
+    def get_ordering(self, request, model, view):
+        ordering = request.query_params.get(self.ordering_query_param, '').strip()
+        if not ordering:
+            return model._meta.pk, False
+        name = ordering.lstrip('-')
+        allowed = getattr(view, 'keyset_ordering_fields', [])
+        if name not in allowed or ordering.count('-') > 1:
+            raise ValidationError({
+                self.ordering_query_param: f'Cursor pagination supports ordering by one of: {", ".join(allowed)}'
+            })
+        return model._meta.get_field(name), ordering.startswith('-')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if data['o'] != self.field.name:
+                raise ValueError
+            return {
+                'value': self.field.to_python(data['v']),
+                'pk': int(data['id']),
+                'reverse': bool(data.get('r')),
+            }
+        except (TypeError, ValueError, KeyError, binascii.Error, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def cursor_token(self, row, reverse=False):
+        data = {'o': self.field.name, 'v': self.field.value_to_string(row), 'id': row.pk}
+        if reverse:
+            data['r'] = 1
+        return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode()
+
+    def encode_cursor(self, row, reverse=False):
+        return replace_query_param(self.base_url, self.cursor_query_param, self.cursor_token(row, reverse))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # An empty backwards page: restart from the beginning
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ListingPagination(BasePagination):
+    """Page numbers by default; keyset pages when the client asks.
+
+    ``?paginate=cursor`` (or any request carrying a ``cursor``) switches a
+    request to KeysetPagination, which avoids the COUNT(*) and OFFSET scan
+    of deep page-number pages.
+    """
+
+    mode_query_param = 'paginate'
+
+    def __init__(self):
+        self.page_number = PageNumberPagination()
+        self.keyset = KeysetPagination()
+        self.paginator = self.page_number
+
+    def wants_keyset(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.keyset.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.keyset if self.wants_keyset(request) else self.page_number
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    @property
+    def display_page_controls(self):
+        return self.paginator is self.page_number and self.page_number.display_page_controls
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    def get_results(self, data):
+        return data['results']
+
+    def get_paginated_response_schema(self, schema):
+        return self.page_number.get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return self.page_number.get_schema_operation_parameters(view) + [
+            {
+                'name': self.mode_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Set to "cursor" for keyset pagination.',
+                'schema': {'type': 'string', 'enum': ['cursor']},
+            },
+            {
+                'name': self.keyset.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The keyset pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+        ]
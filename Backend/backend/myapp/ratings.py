@@ -0,0 +1,79 @@
+from django.apps import apps
+from django.db import models
+from django.db.models import F, FloatField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def rating_sources():
+    return [model for model in apps.get_app_config('myapp').get_models()
+            if getattr(model, 'rating_target', None)]
+
+
+def rating_target(source):
+    """(target model, FK attname) a RatingSourceMixin model feeds"""
+    field = source._meta.get_field(source.rating_target)
+    return field.related_model, field.attname
+
+
+def mean(rating_sum, total_ratings):
+    return Coalesce(Cast(rating_sum, FloatField()) / NullIf(total_ratings, 0), Value(0.0))
+
+
+def apply_rating_deltas(model, pk, deltas):
+    """Add deltas to a row's running sums and set its rating in the same UPDATE"""
+    if pk is None or not any(deltas.values()):
+        return
+    updates = {name: F(name) + delta for name, delta in deltas.items()}
+    model.objects.filter(pk=pk).update(
+        rating=mean(updates['rating_sum'], updates['total_ratings']), **updates
+    )
+
+
+def stored_contribution(instance):
+    """(target pk, deltas) of the row as it is in the database, or None"""
+    stored = type(instance).objects.filter(pk=instance.pk).first()
+    if stored is None:
+        return None
+    return getattr(stored, rating_target(type(instance))[1]), stored.rating_deltas()
+
+
+def contribution(instance):
+    return getattr(instance, rating_target(type(instance))[1]), instance.rating_deltas()
+
+
+def move_rating(source, before, after):
+    """Replace one row's contribution ``before`` with ``after`` (either may be None)"""
+    model = rating_target(source)[0]
+    if before is not None and after is not None and before[0] == after[0]:
+        apply_rating_deltas(model, after[0], {
+            name: after[1][name] - before[1][name] for name in after[1]
+        })
+        return
+    if before is not None:
+        apply_rating_deltas(model, before[0], {name: -delta for name, delta in before[1].items()})
+    if after is not None:
+        apply_rating_deltas(model, after[0], after[1])
+
+
+def reconcile_ratings():
+    """Recompute every rating aggregate from its source rows.
+
+    Each target gets one UPDATE whose grouped subqueries rebuild the
+    running sums, then one setting rating from them. Returns
+    {model name: rows updated}.
+    """
+    updated = {}
+    for source in rating_sources():
+        model, attname = rating_target(source)
+        grouped = source.objects.filter(**{attname: OuterRef('pk')}).order_by().values(attname)
+        sums = {}
+        for name, aggregate in source.rating_aggregates.items():
+            output_field = model._meta.get_field(name).__class__()
+            zero = Value(0.0 if isinstance(output_field, models.FloatField) else 0)
+            sums[name] = Coalesce(
+                Subquery(grouped.annotate(value=aggregate).values('value'), output_field=output_field),
+                zero, output_field=output_field,
+            )
+        model.objects.update(**sums)
+        updated[model.__name__] = model.objects.update(rating=mean(F('rating_sum'), F('total_ratings')))
+    return updated
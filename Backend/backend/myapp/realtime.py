@@ -0,0 +1,291 @@
+import hashlib
+import json
+import threading
+import uuid
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+
+from .models import Bus, Homestay, Property, Train, normalize_place
+from .serializers import BusSerializer, HomestaySerializer, PropertySerializer, TrainSerializer
+
+# Rows sent in the initial snapshot for a subscription
+SNAPSHOT_SIZE = 50
+
+# Filter groups are private to one ASGI worker process. Writes are announced
+# once per worker on a shared changes group, and that worker's leader socket
+# turns them into diffs for its local groups, so a group is never fed twice.
+WORKER_ID = uuid.uuid4().hex[:8]
+
+
+class InvalidFilters(ValueError):
+    pass
+
+
+class Subscription:
+    """Filterable view of one model for the real-time socket.
+
+    ``filters`` maps a client filter name to (model field, operator). The
+    same definition builds the snapshot queryset and decides, in Python,
+    whether a saved row belongs to a subscriber's view.
+    """
+
+    def __init__(self, kind, model, serializer_class, filters, base=None, related=()):
+        self.kind = kind
+        self.model = model
+        self.serializer_class = serializer_class
+        self.filters = filters
+        self.base = base or {}
+        self.related = related
+
+    @property
+    def fields(self):
+        return [field for field, _ in self.filters.values()] + list(self.base)
+
+    def normalize(self, filters):
+        """Drop unknown/blank filters and canonicalize the rest"""
+        if not isinstance(filters, dict):
+            raise InvalidFilters('filters must be an object')
+        normalized = {}
+        for name, (_, op) in self.filters.items():
+            value = filters.get(name)
+            if value in (None, ''):
+                continue
+            if op == 'place':
+                value = normalize_place(str(value))
+            elif op in ('gte', 'lte'):
+                try:
+                    value = str(Decimal(str(value)))
+                except InvalidOperation:
+                    raise InvalidFilters(f'{name} must be a number')
+            else:
+                value = str(value)
+            normalized[name] = value
+        return normalized
+
+    def group_name(self, normalized):
+        payload = json.dumps(normalized, sort_keys=True, separators=(',', ':'))
+        return f'rt.{self.kind}.{hashlib.sha1(payload.encode()).hexdigest()[:20]}.{WORKER_ID}'
+
+    @property
+    def changes_group(self):
+        return f'rt.{self.kind}.changes'
+
+    def lookups(self, normalized):
+        lookups = dict(self.base)
+        for name, value in normalized.items():
+            field, op = self.filters[name]
+            lookups[field if op in ('exact', 'place') else f'{field}__{op}'] = value
+        return lookups
+
+    def queryset(self):
+        queryset = self.model.objects.all()
+        if self.model is Property:
+            return queryset.with_listing_data()
+        if self.related:
+            queryset = queryset.select_related(*self.related)
+        return queryset
+
+    def snapshot(self, normalized):
+        rows = self.queryset().filter(**self.lookups(normalized))[:SNAPSHOT_SIZE]
+        return self.serializer_class(rows, many=True).data
+
+    def matches(self, values, normalized):
+        """Whether a row (dict of self.fields) passes the filters"""
+        if values is None:
+            return False
+        for field, expected in self.base.items():
+            if values[field] != expected:
+                return False
+        for name, value in normalized.items():
+            field, op = self.filters[name]
+            actual = values[field]
+            if op == 'gte':
+                if actual is None or Decimal(actual) < Decimal(value):
+                    return False
+            elif op == 'lte':
+                if actual is None or Decimal(actual) > Decimal(value):
+                    return False
+            elif str(actual) != value:
+                return False
+        return True
+
+    def serialize_row(self, pk):
+        row = self.queryset().filter(pk=pk).first()
+        return self.serializer_class(row).data if row is not None else None
+
+
+SUBSCRIPTIONS = {
+    'properties': Subscription(
+        'properties', Property, PropertySerializer,
+        {
+            'city': ('city_key', 'place'),
+            'state': ('state_key', 'place'),
+            'type': ('type', 'exact'),
+            'min_price': ('price_per_night', 'gte'),
+            'max_price': ('price_per_night', 'lte'),
+        },
+        base={'is_active': True},
+    ),
+    'buses': Subscription(
+        'buses', Bus, BusSerializer,
+        {
+            'from_city': ('from_city_key', 'place'),
+            'to_city': ('to_city_key', 'place'),
+            'seat_type': ('seat_type', 'exact'),
+        },
+        related=('operator',),
+    ),
+    'trains': Subscription(
+        'trains', Train, TrainSerializer,
+        {
+            'from_station': ('from_station_key', 'place'),
+            'to_station': ('to_station_key', 'place'),
+        },
+    ),
+    'homestays': Subscription(
+        'homestays', Homestay, HomestaySerializer,
+        {
+            'city': ('city_key', 'place'),
+            'country': ('country_key', 'place'),
+            'min_price': ('price_per_night', 'gte'),
+            'max_price': ('price_per_night', 'lte'),
+        },
+        base={'is_active': True},
+        related=('host',),
+    ),
+}
+
+SUBSCRIPTIONS_BY_MODEL = {sub.model: sub for sub in SUBSCRIPTIONS.values()}
+
+
+class SubscriptionRegistry:
+    """Active filter groups in this process, with member counts and versions.
+
+    Also tracks which local socket leads each kind: the leader is the one
+    member of the kind's changes group for this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._groups = {}
+        self._channels = {}  # kind -> local channel names, oldest first
+
+    def add(self, kind, normalized, channel_name):
+        """Register a socket; returns (group, became_leader)"""
+        group = SUBSCRIPTIONS[kind].group_name(normalized)
+        with self._lock:
+            entry = self._groups.setdefault(
+                group, {'kind': kind, 'filters': normalized, 'members': 0, 'version': 0}
+            )
+            entry['members'] += 1
+            channels = self._channels.setdefault(kind, [])
+            channels.append(channel_name)
+            return group, len(channels) == 1
+
+    def discard(self, kind, group, channel_name):
+        """Unregister a socket; returns (was_leader, new leader or None)"""
+        with self._lock:
+            entry = self._groups.get(group)
+            if entry is not None:
+                entry['members'] -= 1
+                if entry['members'] <= 0:
+                    del self._groups[group]
+            channels = self._channels.get(kind, [])
+            was_leader = bool(channels) and channels[0] == channel_name
+            if channel_name in channels:
+                channels.remove(channel_name)
+            if not channels:
+                self._channels.pop(kind, None)
+            successor = channels[0] if was_leader and channels else None
+            return was_leader, successor
+
+    def groups(self, kind):
+        with self._lock:
+            return [
+                (group, entry['filters'])
+                for group, entry in self._groups.items() if entry['kind'] == kind
+            ]
+
+    def version(self, group):
+        with self._lock:
+            entry = self._groups.get(group)
+            return entry['version'] if entry else 0
+
+    def next_version(self, group):
+        with self._lock:
+            entry = self._groups.get(group)
+            if entry is None:
+                return None
+            entry['version'] += 1
+            return entry['version']
+
+    def clear(self):
+        with self._lock:
+            self._groups.clear()
+            self._channels.clear()
+
+
+registry = SubscriptionRegistry()
+
+
+def _plain(value):
+    # Channel layers serialize messages with msgpack, which has no Decimal
+    return str(value) if isinstance(value, Decimal) else value
+
+
+def row_values(subscription, instance):
+    return {field: _plain(getattr(instance, field)) for field in subscription.fields}
+
+
+def stored_values(subscription, pk):
+    """The matchable fields of a row as currently stored, or None"""
+    if pk is None:
+        return None
+    values = subscription.model.objects.filter(pk=pk).values(*subscription.fields).first()
+    return {field: _plain(value) for field, value in values.items()} if values else None
+
+
+def may_have_subscribers(subscription):
+    """False only when no socket anywhere can be watching this kind"""
+    if isinstance(get_channel_layer(), InMemoryChannelLayer):
+        return bool(registry.groups(subscription.kind))
+    return True
+
+
+def publish_change(subscription, pk, before, after):
+    """Announce a write to the leader socket of every worker"""
+    async_to_sync(get_channel_layer().group_send)(subscription.changes_group, {
+        'type': 'realtime.change',
+        'kind': subscription.kind,
+        'pk': pk,
+        'before': before,
+        'after': after,
+    })
+
+
+def local_diffs(subscription, before, after):
+    """(group, change) for each local group the row entered, stayed in or left"""
+    diffs = []
+    for group, normalized in registry.groups(subscription.kind):
+        was_in = subscription.matches(before, normalized)
+        is_in = subscription.matches(after, normalized)
+        if was_in and is_in:
+            diffs.append((group, 'changed'))
+        elif is_in:
+            diffs.append((group, 'added'))
+        elif was_in:
+            diffs.append((group, 'removed'))
+    return diffs
+
+
+def diff_message(kind, version, change, pk, row):
+    return {
+        'type': 'subscription.diff',
+        'kind': kind,
+        'version': version,
+        'added': [row] if change == 'added' else [],
+        'changed': [row] if change == 'changed' else [],
+        'removed': [pk] if change == 'removed' else [],
+    }
@@ -0,0 +1,186 @@
+import csv
+import json
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .models import Payment, ReconciliationMismatch, ReconciliationRun, Transaction
+
+FORMATS = ('csv', 'jsonl')
+# Settlement line type -> the Payment status it settles to, and the
+# statuses a payment may move to it from; other types are skipped. A
+# refund only settles to 'refunded' once settled refunds cover the payment.
+SETTLED_STATUS = {
+    'payment': ('completed', {'pending', 'failed', 'completed'}),
+    'refund': ('refunded', {'completed', 'refunded'}),
+}
+
+
+class SettlementLine:
+    __slots__ = ('number', 'entity_id', 'type', 'amount', 'currency', 'settlement_id')
+
+    def __init__(self, number, row, subunits=False):
+        """Parse one export row; raises ValueError if it is unreadable"""
+        try:
+            self.entity_id = str(row['entity_id']).strip()
+            self.type = str(row['type']).strip().lower()
+            amount = Decimal(str(row['amount']).strip())
+        except (KeyError, TypeError, InvalidOperation):
+            raise ValueError('entity_id, type and a numeric amount are required')
+        if not self.entity_id:
+            raise ValueError('entity_id is empty')
+        self.number = number
+        self.amount = amount / 100 if subunits else amount
+        self.currency = str(row.get('currency') or '').strip().upper()
+        self.settlement_id = str(row.get('settlement_id') or '').strip()
+
+
+def read_settlements(stream, format='csv'):
+    """(line number, row) pairs from a CSV export with a header row, or
+    JSONL; a row is None where a JSONL line is not an object"""
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, text in enumerate(stream, 1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+class Reconciler:
+    """Matches settlement lines to our rows a chunk at a time.
+
+    Each chunk's entity ids are looked up in two queries, against
+    Payment.transaction_id and Transaction.provider_transaction_id, into
+    in-memory indexes. Matching lines move their payment's status with
+    one UPDATE per target status, which skips rows already there, and
+    matched transactions get the line's settlement_id. Payments with
+    matched refunds are checked in one more query, and only those whose
+    settled refunds (of an earlier export, or matched now) add up to
+    their amount become 'refunded'. Running the same
+    export again changes nothing. Lines that do not match go to
+    ReconciliationMismatch rows of the run.
+    """
+
+    def __init__(self, run, subunits=False):
+        self.run = run
+        self.subunits = subunits
+        self.seen = set()
+
+    def reconcile(self, rows, chunk_size=1000):
+        rows = iter(rows)
+        while chunk := list(islice(rows, chunk_size)):
+            self.reconcile_chunk(chunk)
+        self.run.finished_at = timezone.now()
+        self.run.save(update_fields=['finished_at'])
+        return self.run
+
+    def parse(self, chunk, mismatches):
+        lines = []
+        for number, row in chunk:
+            self.run.lines += 1
+            try:
+                line = SettlementLine(number, row, self.subunits)
+            except ValueError:
+                mismatches.append(self.mismatch(number, 'invalid', entity_id=(row or {}).get('entity_id') or ''))
+                continue
+            if line.type not in SETTLED_STATUS:
+                self.run.skipped += 1
+            elif line.entity_id in self.seen:
+                mismatches.append(self.mismatch(number, 'duplicate', line.entity_id))
+            else:
+                self.seen.add(line.entity_id)
+                lines.append(line)
+        return lines
+
+    def mismatch(self, line, kind, entity_id='', ours='', theirs=''):
+        return ReconciliationMismatch(
+            run=self.run, line=line, entity_id=str(entity_id)[:100], kind=kind, ours=str(ours), theirs=str(theirs)
+        )
+
+    def reconcile_chunk(self, chunk):
+        mismatches = []
+        lines = self.parse(chunk, mismatches)
+        ids = [line.entity_id for line in lines]
+        # entity id -> (pk, amount, currency, payment id, payment status, settlement id)
+        payments = {
+            transaction_id: (pk, amount, currency, pk, status, None)
+            for transaction_id, pk, amount, currency, status in Payment.objects.filter(
+                transaction_id__in=ids
+            ).values_list('transaction_id', 'pk', 'amount', 'currency', 'status')
+        }
+        transactions = {}
+        for row in Transaction.objects.filter(provider_transaction_id__in=ids).values_list(
+            'provider_transaction_id', 'pk', 'amount', 'currency', 'payment_id', 'payment__status', 'settlement_id'
+        ).order_by('pk'):
+            transactions.setdefault(row[0], row[1:])
+
+        statuses, settlements, refunds, refund_rows = {}, defaultdict(list), set(), []
+        for line in lines:
+            row = transactions.get(line.entity_id)
+            settled = (payments.get(line.entity_id) if line.type == 'payment' else None) or row
+            if settled is None:
+                mismatches.append(self.mismatch(line.number, 'missing', line.entity_id, theirs=line.type))
+                continue
+            _, amount, currency, payment_id, status, _ = settled
+            if line.currency and currency.upper() != line.currency:
+                mismatches.append(self.mismatch(line.number, 'currency', line.entity_id, currency, line.currency))
+                continue
+            if amount != line.amount:
+                mismatches.append(self.mismatch(line.number, 'amount', line.entity_id, amount, line.amount))
+                continue
+            current = statuses.get(payment_id, status)
+            target, sources = SETTLED_STATUS[line.type]
+            if current not in sources:
+                mismatches.append(self.mismatch(line.number, 'status', line.entity_id, current, line.type))
+                continue
+            self.run.matched += 1
+            if line.type == 'refund':
+                refunds.add(payment_id)
+                refund_rows.append(row[0])
+            else:
+                statuses[payment_id] = target
+            if row is not None and line.settlement_id and row[5] != line.settlement_id:
+                settlements[line.settlement_id].append(row[0])
+
+        with transaction.atomic():
+            for settlement_id, transaction_ids in settlements.items():
+                Transaction.objects.filter(pk__in=transaction_ids).update(settlement_id=settlement_id)
+            if refunds:
+                # Settled refunds: those of earlier exports and the ones just matched
+                settled = Q(transactions__transaction_type='refund') & (
+                    ~Q(transactions__settlement_id='') | Q(transactions__pk__in=refund_rows)
+                )
+                for payment_id in Payment.objects.filter(pk__in=refunds).annotate(
+                    refunded=Sum('transactions__amount', filter=settled)
+                ).filter(refunded__gte=F('amount')).values_list('pk', flat=True):
+                    statuses[payment_id] = 'refunded'
+
+            by_status = defaultdict(list)
+            for payment_id, status in statuses.items():
+                by_status[status].append(payment_id)
+            for status, payment_ids in by_status.items():
+                self.run.updated += (
+                    Payment.objects.filter(pk__in=payment_ids).exclude(status=status)
+                    .update(status=status, updated_at=timezone.now())
+                )
+            ReconciliationMismatch.objects.bulk_create(mismatches)
+            self.run.mismatched += len(mismatches)
+            self.run.save()
+
+
+def reconcile_settlements(stream, format='csv', source='', chunk_size=1000, subunits=False):
+    """Reconcile a settlement export read from ``stream``; returns the
+    ReconciliationRun. ``subunits`` reads amounts as paise/cents."""
+    run = ReconciliationRun.objects.create(source=source)
+    return Reconciler(run, subunits).reconcile(read_settlements(stream, format), chunk_size)
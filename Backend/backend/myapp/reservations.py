@@ -0,0 +1,152 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Bus, BusBooking, BusSeat
+from .search_cache import bus_search_cache
+
+
+class ReservationError(Exception):
+    pass
+
+
+class SeatUnavailable(ReservationError):
+    def __init__(self, seat_numbers):
+        self.seat_numbers = sorted(seat_numbers)
+        super().__init__(f"Seats not available: {', '.join(self.seat_numbers)}")
+
+
+class HoldExpired(ReservationError):
+    pass
+
+
+class InvalidBookingState(ReservationError):
+    pass
+
+
+def hold_duration():
+    return timedelta(minutes=getattr(settings, 'BUS_SEAT_HOLD_MINUTES', 10))
+
+
+def reserve_seats(bus, seat_numbers, user):
+    """Hold the given seats for user and return a pending BusBooking.
+
+    Seats are claimed with a conditional UPDATE ... WHERE status='available',
+    so of two concurrent requests for the same seat exactly one matches the
+    row. The rows are locked in primary key order first, which keeps
+    overlapping requests from deadlocking on PostgreSQL.
+    """
+    seat_numbers = set(seat_numbers)
+    if not seat_numbers:
+        raise ReservationError('Select at least one seat')
+    expire_holds(bus=bus)
+
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            seats = BusSeat.objects.filter(bus=bus, seat_number__in=seat_numbers)
+            seat_ids = list(seats.select_for_update().order_by('pk').values_list('pk', flat=True))
+            claimed = BusSeat.objects.filter(pk__in=seat_ids, status='available').update(
+                status='reserved', last_updated=now
+            )
+            if claimed != len(seat_numbers):
+                raise SeatUnavailable(())
+
+            Bus.objects.filter(pk=bus.pk).update(available_seats=F('available_seats') - claimed)
+            booking = BusBooking.objects.create(
+                user=user,
+                bus=bus,
+                travel_date=timezone.localdate(bus.departure_time),
+                total_fare=BusSeat.objects.filter(pk__in=seat_ids).aggregate(total=Sum('price'))['total'],
+                status='pending',
+                hold_expires_at=now + hold_duration(),
+            )
+            booking.seats.set(seat_ids)
+            transaction.on_commit(bus_search_cache.invalidate)
+    except SeatUnavailable:
+        available = BusSeat.objects.filter(
+            bus=bus, seat_number__in=seat_numbers, status='available'
+        ).values_list('seat_number', flat=True)
+        raise SeatUnavailable(seat_numbers - set(available))
+    return booking
+
+
+def confirm_booking(booking_id, user):
+    """Turn a pending hold into a confirmed booking with booked seats"""
+    now = timezone.now()
+    with transaction.atomic():
+        booking = BusBooking.objects.select_for_update().get(pk=booking_id, user=user)
+        if booking.status != 'pending':
+            raise InvalidBookingState(f'Booking is {booking.status}')
+        expired = booking.hold_expires_at is not None and booking.hold_expires_at <= now
+        if expired:
+            _release([booking.pk])
+        else:
+            BusSeat.objects.filter(bookings=booking, status='reserved').update(
+                status='booked', last_updated=now
+            )
+            booking.status = 'confirmed'
+            booking.hold_expires_at = None
+            booking.save(update_fields=['status', 'hold_expires_at', 'updated_at'])
+    if expired:
+        raise HoldExpired('Seat hold has expired')
+    return booking
+
+
+def release_booking(booking_id, user):
+    """Give up a pending hold and return its seats to the pool"""
+    with transaction.atomic():
+        booking = BusBooking.objects.select_for_update().get(pk=booking_id, user=user)
+        if booking.status != 'pending':
+            raise InvalidBookingState(f'Booking is {booking.status}')
+        _release([booking.pk])
+    booking.refresh_from_db()
+    return booking
+
+
+def cancel_booking(booking_id):
+    """Cancel a pending or confirmed booking, e.g. once its payment is
+    refunded, and return its seats to the pool"""
+    with transaction.atomic():
+        booking = BusBooking.objects.select_for_update().get(pk=booking_id)
+        if booking.status not in ('pending', 'confirmed'):
+            raise InvalidBookingState(f'Booking is {booking.status}')
+        _release([booking.pk], seat_statuses=('reserved', 'booked'))
+    booking.refresh_from_db()
+    return booking
+
+
+def expire_holds(bus=None, now=None):
+    """Release every pending hold whose expiry has passed; returns the count"""
+    holds = BusBooking.objects.filter(status='pending', hold_expires_at__lte=now or timezone.now())
+    if bus is not None:
+        holds = holds.filter(bus=bus)
+    with transaction.atomic():
+        # skip_locked leaves holds that confirm_booking is working on alone
+        booking_ids = list(holds.select_for_update(skip_locked=True).values_list('pk', flat=True))
+        if booking_ids:
+            _release(booking_ids)
+    return len(booking_ids)
+
+
+def _release(booking_ids, seat_statuses=('reserved',)):
+    """Free the seats of bookings and cancel them; pending bookings hold
+    reserved seats, confirmed ones booked seats.
+
+    Must run inside a transaction that holds the booking rows.
+    """
+    seats = dict(
+        BusSeat.objects.filter(bookings__in=booking_ids, status__in=seat_statuses).values_list('pk', 'bus')
+    )
+    BusSeat.objects.filter(pk__in=seats).update(status='available', last_updated=timezone.now())
+    for bus_id, count in sorted(Counter(seats.values()).items()):
+        Bus.objects.filter(pk=bus_id).update(available_seats=F('available_seats') + count)
+    BusBooking.objects.filter(pk__in=booking_ids).update(
+        status='cancelled', hold_expires_at=None, updated_at=timezone.now()
+    )
+    if seats:
+        transaction.on_commit(bus_search_cache.invalidate)
@@ -0,0 +1,160 @@
+import gzip
+import os
+import time
+from datetime import datetime, timedelta
+from datetime import time as day_time
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core import serializers
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AILog, RetentionCursor, RetentionSummary, Transaction
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, day_time.min))
+
+
+def merge_summary(total, chunk):
+    """Add a chunk's summary to a day's: numbers add, ``*_max`` keys keep
+    the larger, and decimal strings add exactly"""
+    merged = dict(total)
+    for key, value in chunk.items():
+        if key not in merged:
+            merged[key] = value
+        elif key.endswith('_max'):
+            merged[key] = max(merged[key], value)
+        elif isinstance(value, str):
+            merged[key] = str(Decimal(merged[key]) + Decimal(value))
+        else:
+            merged[key] += value
+    return merged
+
+
+def summarize_ai_logs(rows):
+    times = [row.processing_time for row in rows]
+    feedback = [row.feedback for row in rows if row.feedback is not None]
+    return {
+        'processing_time_total': sum(times),
+        'processing_time_max': max(times),
+        'feedback_count': len(feedback),
+        'feedback_total': sum(feedback),
+    }
+
+
+def summarize_transactions(rows):
+    """Count and exact amount per type and currency, e.g. payment_INR_amount"""
+    summary = {}
+    for row in rows:
+        prefix = f'{row.transaction_type}_{row.currency}'
+        summary[f'{prefix}_count'] = summary.get(f'{prefix}_count', 0) + 1
+        summary[f'{prefix}_amount'] = str(Decimal(summary.get(f'{prefix}_amount', '0')) + row.amount)
+    return summary
+
+
+class RetentionPolicy:
+    """Moves a model's rows older than ``days_setting`` days to archive files.
+
+    Whole days go oldest first, in chunks of rows in pk order. Each chunk
+    is appended to ``ARCHIVE_ROOT/<name>/<day>.jsonl.gz`` (a fixture that
+    loaddata can restore), added to the day's RetentionSummary, recorded
+    in the RetentionCursor and only then deleted, one bounded DELETE per
+    chunk. A run interrupted anywhere resumes from the cursor without
+    losing or duplicating rows: the archive file is cut back to the
+    cursor's offset, and rows up to its last_id are deleted unwritten.
+    """
+
+    def __init__(self, name, model, days_setting, summarize):
+        self.name = name
+        self.model = model
+        self.days_setting = days_setting
+        self.summarize = summarize
+
+    def cutoff(self, days=None, now=None):
+        """Start of the oldest day that is kept"""
+        days = getattr(settings, self.days_setting) if days is None else days
+        return day_start(timezone.localdate(now) - timedelta(days=days))
+
+    def archive_path(self, day):
+        return Path(settings.ARCHIVE_ROOT) / self.name / f'{day.isoformat()}.jsonl.gz'
+
+    def day_rows(self, day):
+        return self.model.objects.filter(
+            created_at__gte=day_start(day), created_at__lt=day_start(day + timedelta(days=1))
+        ).order_by('pk')
+
+    def next_day(self, cutoff):
+        oldest = (
+            self.model.objects.filter(created_at__lt=cutoff)
+            .order_by('created_at').values_list('created_at', flat=True).first()
+        )
+        return timezone.localdate(oldest) if oldest else None
+
+    def start_day(self, day):
+        # Append to an existing file: the day may have been archived before
+        path = self.archive_path(day)
+        offset = path.stat().st_size if path.exists() else 0
+        cursor, _ = RetentionCursor.objects.update_or_create(
+            policy=self.name, defaults={'day': day, 'last_id': 0, 'archive_offset': offset}
+        )
+        return cursor
+
+    def archive(self, days=None, chunk_size=500, pause=0.0, max_chunks=None, now=None):
+        """Archive whole days before the cutoff; returns rows and days archived"""
+        cutoff = self.cutoff(days, now)
+        cursor = RetentionCursor.objects.filter(policy=self.name).first()
+        if cursor is not None and day_start(cursor.day) >= cutoff:
+            cursor = None
+        result = {'rows': 0, 'days': 0, 'chunks': 0}
+        while max_chunks is None or result['chunks'] < max_chunks:
+            if cursor is None:
+                day = self.next_day(cutoff)
+                if day is None:
+                    break
+                cursor = self.start_day(day)
+            rows = list(self.day_rows(cursor.day)[:chunk_size])
+            if not rows:
+                cursor, result['days'] = None, result['days'] + 1
+                continue
+            result['rows'] += self.archive_chunk(cursor, rows)
+            result['chunks'] += 1
+            if pause:
+                time.sleep(pause)
+        return result
+
+    def archive_chunk(self, cursor, rows):
+        fresh = [row for row in rows if row.pk > cursor.last_id]
+        if fresh:
+            path = self.archive_path(cursor.day)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'ab') as f:
+                f.truncate(cursor.archive_offset)  # Drop a write the last run never committed
+                with gzip.GzipFile(fileobj=f, mode='wb') as archive:
+                    archive.write(serializers.serialize('jsonl', fresh).encode())
+                f.flush()
+                os.fsync(f.fileno())
+                offset = f.tell()
+            with transaction.atomic():
+                summary, _ = RetentionSummary.objects.select_for_update().get_or_create(
+                    policy=self.name, day=cursor.day
+                )
+                summary.row_count += len(fresh)
+                summary.data = merge_summary(summary.data, self.summarize(fresh))
+                summary.save()
+                cursor.last_id = fresh[-1].pk
+                cursor.archive_offset = offset
+                cursor.save()
+        self.delete_rows([row.pk for row in rows])
+        return len(fresh)
+
+    def delete_rows(self, pks):
+        self.model.objects.filter(pk__in=pks).delete()
+
+
+POLICIES = {
+    'ailog': RetentionPolicy('ailog', AILog, 'AI_LOG_RETENTION_DAYS', summarize_ai_logs),
+    'transaction': RetentionPolicy('transaction', Transaction, 'TRANSACTION_RETENTION_DAYS', summarize_transactions),
+}
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, Q
+from rest_framework.pagination import PageNumberPagination
+
+from .models import PropertyReview
+
+RATING_FIELDS = ['rating', 'cleanliness_rating', 'location_rating', 'value_rating', 'amenities_rating']
+STARS = range(1, 6)
+
+
+def summary_cache_key(property_id):
+    return f'review-summary:{property_id}'
+
+
+def star_filter(field, star):
+    """Ratings that round half up to ``star``; clamped into 1-5 at the ends"""
+    bounds = {}
+    if star > STARS[0]:
+        bounds[f'{field}__gte'] = star - 0.5
+    if star < STARS[-1]:
+        bounds[f'{field}__lt'] = star + 0.5
+    return Q(**bounds)
+
+
+def compute_review_summary(property_id):
+    """Average and star histogram of each rating field, in one aggregate query"""
+    aggregates = {'count': Count('pk')}
+    for field in RATING_FIELDS:
+        aggregates[f'{field}__avg'] = Avg(field)
+        for star in STARS:
+            aggregates[f'{field}__{star}'] = Count('pk', filter=star_filter(field, star))
+    totals = PropertyReview.objects.filter(property_id=property_id).aggregate(**aggregates)
+    summary = {'count': totals['count']}
+    for field in RATING_FIELDS:
+        average = totals[f'{field}__avg']
+        summary[field] = {
+            'average': round(average, 2) if average is not None else None,
+            'histogram': {str(star): totals[f'{field}__{star}'] for star in STARS},
+        }
+    return summary
+
+
+def review_summary(property_id):
+    """The cached summary; signals drop it whenever a review of the property changes"""
+    key = summary_cache_key(property_id)
+    summary = cache.get(key)
+    if summary is None:
+        summary = compute_review_summary(property_id)
+        cache.set(key, summary, settings.REVIEW_SUMMARY_CACHE_TIMEOUT)
+    return summary
+
+
+def forget_review_summary(property_id):
+    cache.delete(summary_cache_key(property_id))
+
+
+class ReviewPagination(PageNumberPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 50
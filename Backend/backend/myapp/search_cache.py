@@ -0,0 +1,114 @@
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from .models import normalize_place
+
+
+class TransportSearchCache:
+    """Caches serialized search responses for one transport namespace.
+
+    Entries are keyed on the normalized query params and a per-namespace
+    generation number. Invalidation bumps the generation, so every cached
+    search for the namespace is dropped at once on any cache backend.
+    """
+
+    def __init__(self, namespace, alias='transport_search'):
+        self.namespace = namespace
+        self.alias = alias
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'TRANSPORT_SEARCH_CACHE_TIMEOUT', 60)
+
+    def _generation_key(self):
+        return f'{self.namespace}:generation'
+
+    def _generation(self):
+        generation = self.backend.get(self._generation_key())
+        if generation is None:
+            # Seed from the clock so an evicted counter never reuses an old value
+            self.backend.add(self._generation_key(), time.time_ns(), None)
+            generation = self.backend.get(self._generation_key())
+        return generation
+
+    # Params matched against normalized *_key columns, so case is irrelevant
+    place_params = {'from_city', 'to_city', 'from_station', 'to_station'}
+
+    def normalize(self, params):
+        """Sorted (name, value) pairs with blanks dropped and whitespace collapsed"""
+        normalized = []
+        for name in sorted(params.keys()):
+            clean = normalize_place if name in self.place_params else lambda value: ' '.join(value.split())
+            values = sorted(clean(value) for value in params.getlist(name))
+            values = [value for value in values if value]
+            if values:
+                normalized.append((name, values))
+        return normalized
+
+    def make_key(self, params, host=''):
+        payload = json.dumps([host, self.normalize(params)], separators=(',', ':'))
+        digest = hashlib.sha1(payload.encode()).hexdigest()
+        return f'{self.namespace}:{self._generation()}:{digest}'
+
+    def get(self, key):
+        data = self.backend.get(key)
+        with self._lock:
+            self._stats['hits' if data is not None else 'misses'] += 1
+        return data
+
+    def set(self, key, data):
+        self.backend.set(key, data, self.timeout)
+
+    def invalidate(self):
+        try:
+            self.backend.incr(self._generation_key())
+        except ValueError:
+            self.backend.set(self._generation_key(), time.time_ns(), None)
+        with self._lock:
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            for name in self._stats:
+                self._stats[name] = 0
+
+
+bus_search_cache = TransportSearchCache('buses')
+train_search_cache = TransportSearchCache('trains')
+
+
+class CachedSearchMixin:
+    """Serves list() responses for a ViewSet from a TransportSearchCache"""
+
+    search_cache = None
+
+    def list(self, request, *args, **kwargs):
+        key = self.search_cache.make_key(request.query_params, request.get_host())
+        data = self.search_cache.get(key)
+        if data is not None:
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            self.search_cache.set(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
@@ -0,0 +1,226 @@
+import re
+
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+# Relative column weights, in PostgreSQL's setweight labels
+WEIGHTS = {'A': 10.0, 'B': 5.0, 'C': 2.0, 'D': 1.0}
+
+
+class SearchIndex:
+    """Full-text index over a model's ``search_index_fields``.
+
+    The index lives in a side table keyed by the model's pk and is kept in
+    sync by signals; ``rebuild`` repopulates it after bulk writes. Matches
+    require every search word as a word prefix in at least one column, and
+    come back annotated with ``search_rank`` (higher is better).
+    """
+
+    def __init__(self, model, connection):
+        self.model = model
+        self.fields = model.search_index_fields
+        self.connection = connection
+        self.table = f'{model._meta.db_table}_search'
+
+    @classmethod
+    def is_supported(cls, connection):
+        return True
+
+    @staticmethod
+    def words(terms):
+        return re.findall(r'\w+', ' '.join(terms))
+
+    def q(self, name):
+        return self.connection.ops.quote_name(name)
+
+    def document(self, instance):
+        return [getattr(instance, field) or '' for field in self.fields]
+
+    @property
+    def pk_column(self):
+        return f'{self.q(self.model._meta.db_table)}.{self.q(self.model._meta.pk.column)}'
+
+    def columns(self):
+        return [self.q(self.model._meta.get_field(field).column) for field in self.fields]
+
+    def exists(self):
+        with self.connection.cursor() as cursor:
+            return self.table in self.connection.introspection.table_names(cursor)
+
+    def ensure(self):
+        """Create the index table if missing; returns True if it was created"""
+        if self.exists():
+            return False
+        with self.connection.cursor() as cursor:
+            for sql in self.create_sql():
+                cursor.execute(sql)
+        return True
+
+    def search(self, queryset, terms):
+        query = self.match_query(self.words(terms))
+        if not query:
+            return None
+        matches, rank = self.match_sql()
+        return (
+            queryset.filter(pk__in=RawSQL(matches, (query,)))
+            .annotate(search_rank=RawSQL(rank, (query,)))
+            .order_by('-search_rank', 'pk')
+        )
+
+
+class SQLiteSearchIndex(SearchIndex):
+    """FTS5 virtual table; bm25 ranks with the per-column weights"""
+
+    @classmethod
+    def is_supported(cls, connection):
+        if not hasattr(connection, '_fts5_supported'):
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)')
+                    cursor.execute('DROP TABLE temp.fts5_probe')
+                connection._fts5_supported = True
+            except OperationalError:
+                connection._fts5_supported = False
+        return connection._fts5_supported
+
+    def create_sql(self):
+        columns = ', '.join(self.q(field) for field in self.fields)
+        return [
+            f"CREATE VIRTUAL TABLE {self.q(self.table)} USING fts5({columns}, "
+            f"tokenize='unicode61 remove_diacritics 2')"
+        ]
+
+    def update(self, instance):
+        placeholders = ', '.join(['%s'] * (len(self.fields) + 1))
+        columns = ', '.join(self.q(field) for field in self.fields)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.q(self.table)} WHERE rowid = %s', [instance.pk])
+            cursor.execute(
+                f'INSERT INTO {self.q(self.table)} (rowid, {columns}) VALUES ({placeholders})',
+                [instance.pk] + self.document(instance),
+            )
+
+    def remove(self, pk):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.q(self.table)} WHERE rowid = %s', [pk])
+
+    def rebuild(self):
+        self.ensure()
+        columns = ', '.join(self.q(field) for field in self.fields)
+        source = ', '.join(f"COALESCE({column}, '')" for column in self.columns())
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.q(self.table)}')
+            cursor.execute(
+                f'INSERT INTO {self.q(self.table)} (rowid, {columns}) '
+                f'SELECT {self.q(self.model._meta.pk.column)}, {source} '
+                f'FROM {self.q(self.model._meta.db_table)}'
+            )
+
+    def match_query(self, words):
+        # Quote every word so user input is never parsed as FTS5 syntax
+        return ' '.join('"%s"*' % word for word in words)
+
+    def match_sql(self):
+        table = self.q(self.table)
+        weights = ', '.join(str(WEIGHTS[label]) for label in self.fields.values())
+        return (
+            f'SELECT rowid FROM {table} WHERE {table} MATCH %s',
+            f'SELECT -bm25({table}, {weights}) FROM {table} '
+            f'WHERE {table} MATCH %s AND rowid = {self.pk_column}',
+        )
+
+
+class PostgresSearchIndex(SearchIndex):
+    """Weighted tsvector column with a GIN index; ts_rank ranks"""
+
+    config = 'simple'
+
+    def create_sql(self):
+        table = self.q(self.table)
+        return [
+            f'CREATE TABLE {table} (rowid bigint PRIMARY KEY, document tsvector NOT NULL)',
+            f'CREATE INDEX {self.q(self.table + "_gin")} ON {table} USING GIN (document)',
+        ]
+
+    def document_sql(self, values):
+        return ' || '.join(
+            f"setweight(to_tsvector('{self.config}', {value}), '{label}')"
+            for value, label in zip(values, self.fields.values())
+        )
+
+    def update(self, instance):
+        document = self.document_sql(['%s'] * len(self.fields))
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.q(self.table)} (rowid, document) VALUES (%s, {document}) '
+                f'ON CONFLICT (rowid) DO UPDATE SET document = EXCLUDED.document',
+                [instance.pk] + self.document(instance),
+            )
+
+    def remove(self, pk):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.q(self.table)} WHERE rowid = %s', [pk])
+
+    def rebuild(self):
+        self.ensure()
+        document = self.document_sql([f"COALESCE({column}, '')" for column in self.columns()])
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {self.q(self.table)}')
+            cursor.execute(
+                f'INSERT INTO {self.q(self.table)} (rowid, document) '
+                f'SELECT {self.q(self.model._meta.pk.column)}, {document} '
+                f'FROM {self.q(self.model._meta.db_table)}'
+            )
+
+    def match_query(self, words):
+        return ' & '.join(f"'{word}':*" for word in words)
+
+    def match_sql(self):
+        table = self.q(self.table)
+        query = f"to_tsquery('{self.config}', %s)"
+        return (
+            f'SELECT rowid FROM {table} WHERE document @@ {query}',
+            f'SELECT ts_rank(document, {query}) FROM {table} WHERE rowid = {self.pk_column}',
+        )
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchIndex,
+    'postgresql': PostgresSearchIndex,
+}
+
+
+def search_index(model, using=DEFAULT_DB_ALIAS):
+    """The full-text index for model on this database, or None"""
+    connection = connections[using]
+    backend = BACKENDS.get(connection.vendor)
+    if not getattr(model, 'search_index_fields', None) or backend is None:
+        return None
+    if not backend.is_supported(connection):
+        return None
+    return backend(model, connection)
+
+
+def indexed_models():
+    from django.apps import apps
+    return [model for model in apps.get_app_config('myapp').get_models()
+            if getattr(model, 'search_index_fields', None)]
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """``search`` through the model's full-text index, ranked by relevance.
+
+    Falls back to SearchFilter's icontains lookups over ``search_fields``
+    on databases without an index backend. An explicit ``ordering`` param
+    still overrides the relevance order.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        index = search_index(queryset.model, queryset.db) if terms else None
+        if index is not None:
+            results = index.search(queryset, terms)
+            if results is not None:
+                return results
+        return super().filter_queryset(request, queryset, view)
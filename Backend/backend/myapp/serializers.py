@@ -2,7 +2,7 @@ from rest_framework import serializers
 from .models import *
 
 class PropertySerializer(serializers.ModelSerializer):
-    rating_count = serializers.IntegerField(source='reviews.count', read_only=True)
+    rating_count = serializers.SerializerMethodField()
     host_name = serializers.CharField(source='host.username', read_only=True)
     
     class Meta:
@@ -15,13 +15,55 @@ class PropertySerializer(serializers.ModelSerializer):
             'photo_count', 'host_name'
         ]
 
+    def get_rating_count(self, obj):
+        # Listings annotate the count via Property.objects.with_listing_data()
+        count = getattr(obj, 'rating_count', None)
+        if count is None:
+            count = obj.reviews.count()
+        return count
+
 class PropertyAvailabilitySerializer(serializers.ModelSerializer):
     class Meta:
         model = PropertyAvailability
         fields = ['date', 'is_available', 'base_price', 'minimum_stay']
 
+class CalendarRangeSerializer(serializers.Serializer):
+    """Nights [start, end) set to one availability, price and minimum stay"""
+    start = serializers.DateField()
+    end = serializers.DateField()
+    available = serializers.BooleanField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    minimum_stay = serializers.IntegerField(min_value=1, default=1)
+
+    def validate(self, data):
+        if data['end'] <= data['start']:
+            raise serializers.ValidationError('end must be after start')
+        return data
+
+class StayRequestSerializer(serializers.Serializer):
+    """Nights [check_in, check_out) asked for by a booking request"""
+    check_in = serializers.DateField()
+    check_out = serializers.DateField()
+    guests = serializers.IntegerField(min_value=1)
+    special_requests = serializers.CharField(required=False, allow_blank=True, default='')
+    house_rules_accepted = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, data):
+        if data['check_out'] <= data['check_in']:
+            raise serializers.ValidationError('check_out must be after check_in')
+        return data
+
+class PropertyBookingSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PropertyBooking
+        fields = [
+            'id', 'property', 'check_in', 'check_out', 'guests', 'total_price',
+            'status', 'special_requests', 'house_rules_accepted', 'created_at'
+        ]
+
 class PropertyReviewSerializer(serializers.ModelSerializer):
-    user_name = serializers.CharField(source='user.username', read_only=True)
+    # get_username() reads USERNAME_FIELD, so custom user models work too
+    user_name = serializers.CharField(source='user.get_username', read_only=True)
     
     class Meta:
         model = PropertyReview
@@ -44,13 +86,34 @@ class BusSerializer(serializers.ModelSerializer):
             'operator_name'
         ]
 
+class BusBookingSerializer(serializers.ModelSerializer):
+    seats = serializers.SlugRelatedField(slug_field='seat_number', many=True, read_only=True)
+
+    class Meta:
+        model = BusBooking
+        fields = [
+            'id', 'bus', 'seats', 'travel_date', 'total_fare', 'status',
+            'hold_expires_at', 'created_at'
+        ]
+
+class TrainClassSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TrainClass
+        fields = [
+            'class_type', 'price', 'available_seats', 'total_seats',
+            'has_tatkal', 'tatkal_charge'
+        ]
+
 class TrainSerializer(serializers.ModelSerializer):
+    # Prefetched by TrainViewSet; a class search lists only the matching classes
+    class_details = TrainClassSerializer(many=True, read_only=True)
+
     class Meta:
         model = Train
         fields = [
             'id', 'number', 'name', 'from_station', 'to_station',
             'departure_time', 'arrival_time', 'duration', 'distance',
-            'running_days', 'classes_available', 'base_fare'
+            'running_days', 'classes_available', 'base_fare', 'class_details'
         ]
 
 class HomestaySerializer(serializers.ModelSerializer):
@@ -64,6 +127,14 @@ class HomestaySerializer(serializers.ModelSerializer):
             'amenities', 'house_rules', 'photos', 'rating', 'host_name'
         ]
 
+class HomestayBookingSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Booking
+        fields = [
+            'id', 'homestay', 'check_in', 'check_out', 'guests', 'total_price',
+            'status', 'special_requests', 'created_at'
+        ]
+
 class BusOperatorSerializer(serializers.ModelSerializer):
     class Meta:
         model = BusOperator
@@ -0,0 +1,165 @@
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from .authentication import user_cache_key
+from .journeys import Leg, journey_graph
+from .models import (
+    Bus, BusOperator, BusSeat, Homestay, Property, PropertyReview, Review, Train, TrainClass, User
+)
+from .ratings import contribution, move_rating, stored_contribution
+from .realtime import SUBSCRIPTIONS_BY_MODEL, may_have_subscribers, publish_change, row_values, stored_values
+from .reviews import forget_review_summary
+from .search_cache import bus_search_cache, train_search_cache
+from .search_index import indexed_models, search_index
+
+
+@receiver([post_save, post_delete], sender=Bus)
+@receiver([post_save, post_delete], sender=BusSeat)
+@receiver([post_save, post_delete], sender=BusOperator)
+def invalidate_bus_searches(sender, **kwargs):
+    # After commit, or a search could cache the old rows under the new generation
+    transaction.on_commit(bus_search_cache.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Train)
+@receiver([post_save, post_delete], sender=TrainClass)
+def invalidate_train_searches(sender, **kwargs):
+    transaction.on_commit(train_search_cache.invalidate)
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    cache.delete(user_cache_key(instance.pk))
+
+
+@receiver(pre_save, sender=PropertyReview)
+@receiver(pre_save, sender=Review)
+@receiver(pre_save, sender=Bus)
+def remember_rating_contribution(sender, instance, raw=False, **kwargs):
+    adding = raw or instance._state.adding or instance.pk is None
+    instance._rating_before = None if adding else stored_contribution(instance)
+
+
+@receiver(post_save, sender=PropertyReview)
+@receiver(post_save, sender=Review)
+@receiver(post_save, sender=Bus)
+def update_rating_on_save(sender, instance, raw=False, **kwargs):
+    # Fixtures (raw) are left to reconcile_ratings
+    if not raw:
+        move_rating(sender, getattr(instance, '_rating_before', None), contribution(instance))
+
+
+@receiver(post_delete, sender=PropertyReview)
+@receiver(post_delete, sender=Review)
+@receiver(post_delete, sender=Bus)
+def update_rating_on_delete(sender, instance, **kwargs):
+    move_rating(sender, contribution(instance), None)
+
+
+@receiver([post_save, post_delete], sender=PropertyReview)
+def invalidate_review_summary(sender, instance, **kwargs):
+    # Again after commit, in case a read cached the old summary meanwhile
+    forget_review_summary(instance.property_id)
+    transaction.on_commit(partial(forget_review_summary, instance.property_id))
+
+
+@receiver(pre_save, sender=Property)
+@receiver(pre_save, sender=Bus)
+@receiver(pre_save, sender=Train)
+@receiver(pre_save, sender=Homestay)
+def set_place_keys_on_raw_save(sender, instance, raw=False, **kwargs):
+    # loaddata writes with save_base(), which skips PlaceKeyMixin.save()
+    if raw:
+        instance.set_place_keys()
+
+
+@receiver(pre_save, sender=Train)
+def set_running_days_mask_on_raw_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        instance.set_running_days_mask()
+
+
+@receiver(pre_save, sender=Property)
+@receiver(pre_save, sender=Bus)
+@receiver(pre_save, sender=Train)
+@receiver(pre_save, sender=Homestay)
+def remember_realtime_state(sender, instance, raw=False, **kwargs):
+    subscription = SUBSCRIPTIONS_BY_MODEL[sender]
+    # Only pay for the lookup when some socket may be watching this model
+    if raw or not may_have_subscribers(subscription):
+        instance._realtime_before = None
+        return
+    instance._realtime_before = stored_values(subscription, instance.pk)
+
+
+@receiver(post_save, sender=Property)
+@receiver(post_save, sender=Bus)
+@receiver(post_save, sender=Train)
+@receiver(post_save, sender=Homestay)
+def publish_realtime_save(sender, instance, raw=False, **kwargs):
+    subscription = SUBSCRIPTIONS_BY_MODEL[sender]
+    if raw or not may_have_subscribers(subscription):
+        return
+    before = getattr(instance, '_realtime_before', None)
+    after = row_values(subscription, instance)
+    transaction.on_commit(partial(publish_change, subscription, instance.pk, before, after))
+
+
+@receiver(post_delete, sender=Property)
+@receiver(post_delete, sender=Bus)
+@receiver(post_delete, sender=Train)
+@receiver(post_delete, sender=Homestay)
+def publish_realtime_delete(sender, instance, **kwargs):
+    subscription = SUBSCRIPTIONS_BY_MODEL[sender]
+    if not may_have_subscribers(subscription):
+        return
+    before = row_values(subscription, instance)
+    transaction.on_commit(partial(publish_change, subscription, instance.pk, before, None))
+
+
+@receiver(post_save, sender=Bus)
+def update_journey_bus(sender, instance, **kwargs):
+    transaction.on_commit(partial(journey_graph.put, Leg.from_bus(instance)))
+
+
+@receiver(post_save, sender=Train)
+def update_journey_train(sender, instance, **kwargs):
+    transaction.on_commit(partial(journey_graph.put, Leg.from_train(instance)))
+
+
+@receiver(post_delete, sender=Bus)
+@receiver(post_delete, sender=Train)
+def remove_journey_leg(sender, instance, **kwargs):
+    mode = 'bus' if sender is Bus else 'train'
+    transaction.on_commit(partial(journey_graph.discard, mode, instance.pk))
+
+
+@receiver(post_save, sender=Property)
+@receiver(post_save, sender=Homestay)
+def update_search_index(sender, instance, using, **kwargs):
+    index = search_index(sender, using)
+    if index is not None:
+        index.update(instance)
+
+
+@receiver(post_delete, sender=Property)
+@receiver(post_delete, sender=Homestay)
+def remove_from_search_index(sender, instance, using, **kwargs):
+    index = search_index(sender, using)
+    if index is not None:
+        index.remove(instance.pk)
+
+
+@receiver(post_migrate)
+def create_search_indexes(sender, using, **kwargs):
+    if sender.name != 'myapp':
+        return
+    for model in indexed_models():
+        index = search_index(model, using)
+        # A new index table starts empty: fill it from the existing rows
+        if index is not None and index.ensure():
+            index.rebuild()
@@ -0,0 +1,168 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Booking, Homestay, PropertyAvailability, PropertyBooking
+from .reservations import InvalidBookingState, ReservationError
+
+# Bookings that hold their nights (or a room for them)
+ACTIVE_STATUSES = ('pending', 'confirmed')
+
+
+class StayUnavailable(ReservationError):
+    pass
+
+
+def stay_nights(check_in, check_out):
+    return [check_in + timedelta(days=n) for n in range((check_out - check_in).days)]
+
+
+def overlapping_bookings(property_id, check_in, check_out):
+    """Active bookings of a property sharing a night with [check_in, check_out);
+    served by the (property, check_in, check_out) index"""
+    return PropertyBooking.objects.filter(
+        property_id=property_id, check_in__lt=check_out, check_out__gt=check_in, status__in=ACTIVE_STATUSES
+    )
+
+
+def book_property(property, user, check_in, check_out, guests, **details):
+    """Book every night of [check_in, check_out) and return a pending
+    PropertyBooking priced from the calendar's base_price.
+
+    The stay's calendar rows are locked in date order, so bookings that
+    share a night queue behind each other (without deadlocking on
+    PostgreSQL) while disjoint stays go ahead. The nights are then
+    claimed with a conditional UPDATE ... WHERE is_available, so of two
+    overlapping bookings exactly one gets them even where row locks are
+    not supported.
+    """
+    if check_out <= check_in:
+        raise ReservationError('check_out must be after check_in')
+    if guests < 1 or guests > property.max_guests:
+        raise ReservationError(f'This property takes 1 to {property.max_guests} guests')
+    nights = stay_nights(check_in, check_out)
+    with transaction.atomic():
+        calendar = list(
+            PropertyAvailability.objects.select_for_update()
+            .filter(property=property, date__gte=check_in, date__lt=check_out)
+            .order_by('date')
+            .values_list('pk', 'is_available', 'base_price', 'minimum_stay')
+        )
+        if len(calendar) != len(nights) or not all(available for _, available, _, _ in calendar):
+            raise StayUnavailable('Some nights are not available')
+        if max(minimum_stay for _, _, _, minimum_stay in calendar) > len(nights):
+            raise ReservationError('The stay is shorter than the minimum for these nights')
+        if overlapping_bookings(property.pk, check_in, check_out).exists():
+            raise StayUnavailable('Some nights are already booked')
+
+        row_ids = [pk for pk, _, _, _ in calendar]
+        claimed = PropertyAvailability.objects.filter(pk__in=row_ids, is_available=True).update(
+            is_available=False, updated_at=timezone.now()
+        )
+        if claimed != len(nights):
+            raise StayUnavailable('Some nights are not available')
+        return PropertyBooking.objects.create(
+            property=property, user=user, check_in=check_in, check_out=check_out, guests=guests,
+            total_price=sum(price for _, _, price, _ in calendar),
+            status='pending', cancellation_policy=details.get('cancellation_policy') or 'Standard',
+            special_requests=details.get('special_requests') or '',
+            house_rules_accepted=bool(details.get('house_rules_accepted')),
+        )
+
+
+def cancel_property_booking(booking_id, user=None):
+    """Cancel a pending or confirmed booking and reopen its nights"""
+    bookings = PropertyBooking.objects.select_for_update()
+    if user is not None:
+        bookings = bookings.filter(user=user)
+    with transaction.atomic():
+        booking = bookings.get(pk=booking_id)
+        if booking.status not in ACTIVE_STATUSES:
+            raise InvalidBookingState(f'Booking is {booking.status}')
+        PropertyAvailability.objects.filter(
+            property_id=booking.property_id, date__gte=booking.check_in, date__lt=booking.check_out
+        ).update(is_available=True, updated_at=timezone.now())
+        booking.status = 'cancelled'
+        booking.save(update_fields=['status', 'updated_at'])
+    return booking
+
+
+def overlapping_homestay_bookings(homestay_id, check_in, check_out):
+    """Active bookings of a homestay sharing a night with [check_in, check_out);
+    served by the (homestay, check_in, check_out) index"""
+    return Booking.objects.filter(
+        homestay_id=homestay_id, check_in__lt=check_out, check_out__gt=check_in, status__in=ACTIVE_STATUSES
+    )
+
+
+def peak_occupancy(stays, check_in, check_out):
+    """Most of the (check_in, check_out) stays that share one night of
+    [check_in, check_out)"""
+    changes = []
+    for start, end in stays:
+        changes += [(max(start, check_in), 1), (min(end, check_out), -1)]
+    # A room given back on a date is free for a stay starting that date
+    occupied = peak = 0
+    for _, change in sorted(changes):
+        occupied += change
+        peak = max(peak, occupied)
+    return peak
+
+
+def book_homestay(homestay, user, check_in, check_out, guests, special_requests=None):
+    """Book one of the homestay's rooms for [check_in, check_out) and
+    return a pending Booking.
+
+    Homestays have no nightly calendar: a stay fits while, on each of its
+    nights, fewer than total_rooms active bookings overlap it. Bookings
+    of one homestay queue behind an UPDATE of its row, so two requests
+    for the last room on a night are checked one after the other.
+    available_rooms is the host's listing field and is not changed.
+    """
+    if check_out <= check_in:
+        raise ReservationError('check_out must be after check_in')
+    if guests < 1:
+        raise ReservationError('At least one guest is required')
+    with transaction.atomic():
+        if not Homestay.objects.filter(pk=homestay.pk, is_active=True).update(updated_at=timezone.now()):
+            raise StayUnavailable('This homestay is not taking bookings')
+        stays = overlapping_homestay_bookings(homestay.pk, check_in, check_out).values_list('check_in', 'check_out')
+        if peak_occupancy(stays, check_in, check_out) >= homestay.total_rooms:
+            raise StayUnavailable('No rooms available')
+        return Booking.objects.create(
+            user=user, homestay=homestay, check_in=check_in, check_out=check_out, guests=guests,
+            total_price=homestay.price_per_night * len(stay_nights(check_in, check_out)),
+            status='pending', special_requests=special_requests,
+        )
+
+
+def release_homestay_booking(booking_id, status='cancelled'):
+    """Move an active booking to cancelled (or completed, at checkout),
+    which frees its room for its nights"""
+    with transaction.atomic():
+        booking = Booking.objects.select_for_update().get(pk=booking_id)
+        if booking.status not in ACTIVE_STATUSES:
+            raise InvalidBookingState(f'Booking is {booking.status}')
+        booking.status = status
+        booking.save(update_fields=['status', 'updated_at'])
+    return booking
+
+
+def end_homestay_stays(today=None):
+    """End the active bookings whose check_out has come: confirmed stays
+    are completed, unpaid ones cancelled.
+
+    Like expire_holds, bookings another transaction has locked are left
+    for the next run. Returns how many bookings were ended.
+    """
+    today = today or timezone.localdate()
+    now = timezone.now()
+    stays = Booking.objects.filter(status__in=ACTIVE_STATUSES, check_out__lte=today)
+    with transaction.atomic():
+        ended = list(stays.select_for_update(skip_locked=True).values_list('pk', 'status'))
+        for status, final in (('confirmed', 'completed'), ('pending', 'cancelled')):
+            Booking.objects.filter(pk__in=[pk for pk, current in ended if current == status]).update(
+                status=final, updated_at=now
+            )
+    return len(ended)
@@ -1,3 +1,2278 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import time as time_module
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.db import OperationalError, connection
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .ai_logs import AILogBuffer, latency_report
+from .authentication import BloomFilter, ClaimsUser, denylist
+from .availability import calendar_spans
+from .channel_layers import BrokerChannelLayer, start_broker
+from . import id_tokens, oauth_client
+from .consumers import RealTimeDataConsumer
+from .journeys import journey_graph
+from .models import (
+    User, AILatencyRollup, AILog, Booking, Bus, BusBooking, BusOperator, BusSeat, Homestay, OAuthProfile, Property, PropertyAvailability,
+    Payment, PropertyBooking, PropertyReview, ReconciliationRun, RetentionCursor, RetentionSummary, RevokedToken, Review,
+    Train, TrainClass, Transaction, TranslationsCache, WebhookEvent, running_days_mask
+)
+from .management.commands.bench_oauth_accounts import (
+    bench_record, delete_bench_accounts, run_duplicate_logins
+)
+from .management.commands.bench_oauth_logins import (
+    FakeProvider, fake_provider_config, run_login_benchmark
+)
+from .management.commands.bench_pagination import (
+    create_bench_properties, run_benchmark as run_pagination_benchmark
+)
+from .management.commands.bench_realtime_workers import run_harness
+from .management.commands.loadtest_property_bookings import (
+    check_consistency as check_stay_consistency, create_load_test_property, run_load_test as run_stay_load_test
+)
+from .management.commands.loadtest_seat_reservations import (
+    check_consistency, create_load_test_bus, run_load_test
+)
+from .oauth_accounts import AccountConflict, get_or_create_user_from_oauth, import_oauth_users
+from .oauth_views import OAUTH_CONFIG
+from .ratings import reconcile_ratings, rating_sources
+from .realtime import registry
+from .reconciliation import reconcile_settlements
+from .retention import POLICIES as RETENTION_POLICIES
+from .reservations import expire_holds, reserve_seats
+from .search_cache import bus_search_cache, train_search_cache
+from .stays import (
+    book_homestay, cancel_property_booking, end_homestay_stays, overlapping_bookings,
+    overlapping_homestay_bookings, peak_occupancy, release_homestay_booking
+)
+from .translations import evict_translations, translation_store
+from .webhooks import HANDLERS as WEBHOOK_HANDLERS, WebhookWorkerPool, process_batch
+
+
+def make_host(username='host'):
+    return get_user_model().objects.create(username=username)
+
+
+def make_property(host, **kwargs):
+    fields = {
+        'host': host,
+        'name': 'Pine Cabin',
+        'type': 'cabin',
+        'location': 'Manali, Himachal Pradesh',
+        'state': 'Himachal Pradesh',
+        'city': 'Manali',
+        'description': 'A cabin in the pines',
+        'max_guests': 4,
+        'bedrooms': 2,
+        'bathrooms': 1,
+        'price_per_night': Decimal('2500.00'),
+    }
+    fields.update(kwargs)
+    return Property.objects.create(**fields)
+
+
+def make_operator(name='UPSRTC'):
+    return BusOperator.objects.create(name=name, description='State transport')
+
+
+def make_bus(operator, **kwargs):
+    departure = timezone.now() + timedelta(days=1)
+    fields = {
+        'operator': operator,
+        'bus_number': 'UP32 1234',
+        'bus_type': 'AC Sleeper (2+1)',
+        'from_city': 'Lucknow',
+        'to_city': 'Varanasi',
+        'departure_time': departure,
+        'arrival_time': departure + timedelta(hours=6),
+        'duration': '06:00',
+        'seat_type': 'ac_sleeper',
+        'total_seats': 30,
+        'available_seats': 30,
+        'window_seats': 10,
+        'base_fare': Decimal('650.00'),
+    }
+    fields.update(kwargs)
+    return Bus.objects.create(**fields)
+
+
+def make_train(number='12001', **kwargs):
+    fields = {
+        'number': number,
+        'name': 'Shatabdi Express',
+        'from_station': 'New Delhi',
+        'to_station': 'Bhopal',
+        'departure_time': time(6, 0),
+        'arrival_time': time(14, 0),
+        'duration': '08:00',
+        'distance': 700,
+        'running_days': 'Mon,Tue,Wed,Thu,Fri,Sat,Sun',
+        'base_fare': Decimal('900.00'),
+    }
+    fields.update(kwargs)
+    return Train.objects.create(**fields)
+
+
+def make_homestay(host, **kwargs):
+    fields = {
+        'host': host,
+        'name': 'Riverside Homestay',
+        'description': 'Quiet rooms by the river',
+        'address': 'Rishikesh Road',
+        'city': 'Rishikesh',
+        'country': 'India',
+        'price_per_night': Decimal('1500.00'),
+        'total_rooms': 5,
+        'available_rooms': 5,
+    }
+    fields.update(kwargs)
+    return Homestay.objects.create(**fields)
+
+
+class QueryCountTests(TestCase):
+    """Listing endpoints must not issue per-row queries"""
+
+    def setUp(self):
+        self.client = APIClient()
+        caches['transport_search'].clear()
+
+    def count_queries(self, url):
+        # Writes invalidate searches only on commit, which a TestCase never reaches
+        caches['transport_search'].clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def assertConstantQueries(self, url, add_row, expected):
+        add_row(0)
+        single = self.count_queries(url)
+        for i in range(1, 6):
+            add_row(i)
+        self.assertEqual(self.count_queries(url), single)
+        self.assertEqual(single, expected)
+
+    def test_property_list(self):
+        reviewer = make_host('reviewer')
+
+        def add_row(i):
+            prop = make_property(make_host(f'host{i}'), name=f'Cabin {i}')
+            PropertyReview.objects.create(
+                property=prop, user=reviewer, rating=4.0, comment='Nice',
+                cleanliness_rating=4, location_rating=4, value_rating=4,
+                amenities_rating=4,
+            )
+
+        # COUNT(*) for the paginator plus one joined, annotated page query
+        self.assertConstantQueries('/api/properties/', add_row, 2)
+
+    def test_property_list_payload(self):
+        host = make_host()
+        prop = make_property(host)
+        for i in range(3):
+            PropertyReview.objects.create(
+                property=prop, user=make_host(f'reviewer{i}'), rating=5.0,
+                comment='Great', cleanliness_rating=5, location_rating=5,
+                value_rating=5, amenities_rating=5,
+            )
+        row = self.client.get('/api/properties/').data['results'][0]
+        self.assertEqual(row['rating_count'], 3)
+        self.assertEqual(row['host_name'], 'host')
+
+        detail = self.client.get(f'/api/properties/{prop.pk}/').data
+        self.assertEqual(detail['rating_count'], 3)
+
+    def test_property_reviews(self):
+        prop = make_property(make_host())
+
+        def add_row(i):
+            PropertyReview.objects.create(
+                property=prop, user=make_host(f'reviewer{i}'), rating=4.0,
+                comment='Nice', cleanliness_rating=4, location_rating=4,
+                value_rating=4, amenities_rating=4,
+            )
+
+        # The property, COUNT(*), the joined page and the (uncached) summary
+        self.assertConstantQueries(f'/api/properties/{prop.pk}/reviews/', add_row, 4)
+
+    def test_bus_list(self):
+        def add_row(i):
+            make_bus(make_operator(f'Operator {i}'), bus_number=f'UP32 {i}')
+
+        self.assertConstantQueries('/api/buses/', add_row, 2)
+
+    def test_train_list(self):
+        def add_row(i):
+            train = make_train(number=f'1200{i}')
+            TrainClass.objects.create(
+                train=train, class_type='3A', price=Decimal('1200.00'),
+                available_seats=40, total_seats=64, tatkal_charge=Decimal('300.00'),
+            )
+
+        # COUNT(*), the page and one prefetch of the class rows
+        self.assertConstantQueries('/api/trains/', add_row, 3)
+
+    def test_homestay_list(self):
+        def add_row(i):
+            make_homestay(make_host(f'host{i}'), name=f'Homestay {i}')
+
+        self.assertConstantQueries('/api/homestays/', add_row, 2)
+
+    def test_bus_operator_list(self):
+        def add_row(i):
+            make_bus(make_operator(f'Operator {i}'), bus_number=f'UP32 {i}')
+
+        self.assertConstantQueries('/api/bus-operators/', add_row, 2)
+
+    def test_consumer_properties_single_query(self):
+        for i in range(5):
+            make_property(make_host(f'host{i}'), name=f'Cabin {i}')
+        consumer = RealTimeDataConsumer()
+        with self.assertNumQueries(1):
+            data = async_to_sync(consumer.get_properties)({'city': 'manali'})
+        self.assertEqual(len(data), 5)
+
+
+class AvailabilitySearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.host = make_host()
+        self.start = date(2026, 12, 20)
+
+    def open_calendar(self, prop, nights=5, minimum_stay=1, closed=()):
+        PropertyAvailability.objects.bulk_create([
+            PropertyAvailability(
+                property=prop, date=self.start + timedelta(days=i),
+                is_available=i not in closed, base_price=Decimal('2500.00'),
+                minimum_stay=minimum_stay,
+            )
+            for i in range(nights)
+        ])
+
+    def search(self, **params):
+        response = self.client.get('/api/properties/', params)
+        self.assertEqual(response.status_code, 200)
+        return {row['name'] for row in response.data['results']}
+
+    def stay(self, nights=3, **params):
+        return self.search(
+            check_in=self.start.isoformat(),
+            check_out=(self.start + timedelta(days=nights)).isoformat(),
+            **params
+        )
+
+    def test_requires_every_night_open(self):
+        self.open_calendar(make_property(self.host, name='Open'))
+        self.open_calendar(make_property(self.host, name='Gap'), closed=(1,))
+        self.open_calendar(make_property(self.host, name='Short'), nights=2)
+        make_property(self.host, name='No calendar')
+        self.assertEqual(self.stay(), {'Open'})
+
+    def test_respects_minimum_stay(self):
+        self.open_calendar(make_property(self.host, name='Weekly'), minimum_stay=7)
+        self.open_calendar(make_property(self.host, name='Nightly'))
+        self.assertEqual(self.stay(), {'Nightly'})
+
+    def test_excludes_overlapping_confirmed_bookings(self):
+        booked = make_property(self.host, name='Booked')
+        pending = make_property(self.host, name='Pending')
+        adjacent = make_property(self.host, name='Adjacent')
+        for prop in (booked, pending, adjacent):
+            self.open_calendar(prop)
+        guest = make_host('guest')
+
+        def book(prop, offset, nights, status):
+            PropertyBooking.objects.create(
+                property=prop, user=guest, guests=2, total_price=Decimal('5000.00'),
+                check_in=self.start + timedelta(days=offset),
+                check_out=self.start + timedelta(days=offset + nights),
+                status=status, cancellation_policy='Flexible',
+            )
+
+        book(booked, 2, 2, 'confirmed')
+        book(pending, 0, 3, 'pending')
+        book(adjacent, 3, 2, 'confirmed')
+        self.assertEqual(self.stay(), {'Pending', 'Adjacent'})
+
+    def test_guests(self):
+        self.open_calendar(make_property(self.host, name='Small', max_guests=2))
+        self.open_calendar(make_property(self.host, name='Large', max_guests=6))
+        self.assertEqual(self.stay(guests=4), {'Large'})
+        self.assertEqual(self.search(guests=4), {'Large'})
+
+    def test_single_query(self):
+        for i in range(4):
+            self.open_calendar(make_property(self.host, name=f'Cabin {i}'))
+        with self.assertNumQueries(2):
+            self.stay(guests=2)
+
+    def test_invalid_ranges(self):
+        for params in (
+            {'check_in': '2026-12-20'},
+            {'check_in': '2026-12-20', 'check_out': '2026-12-20'},
+            {'check_in': '20-12-2026', 'check_out': '2026-12-22'},
+            {'check_in': '2026-12-20', 'check_out': '2026-12-22', 'guests': 'two'},
+        ):
+            response = self.client.get('/api/properties/', params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+class TransportSearchCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        caches['transport_search'].clear()
+        self.bus = make_bus(make_operator())
+        self.train = make_train()
+        bus_search_cache.reset_stats()
+        train_search_cache.reset_stats()
+
+    def test_repeat_search_is_served_from_cache(self):
+        url = '/api/buses/?from_city=Lucknow&to_city=Varanasi'
+        first = self.client.get(url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(bus_search_cache.stats()['hits'], 1)
+        self.assertEqual(bus_search_cache.stats()['misses'], 1)
+
+    def test_key_ignores_param_order_and_whitespace(self):
+        self.client.get('/api/buses/', {'from_city': 'Lucknow', 'to_city': 'Varanasi'})
+        response = self.client.get('/api/buses/', {'to_city': ' Varanasi ', 'from_city': 'Lucknow', 'date': ''})
+        self.assertEqual(response['X-Cache'], 'HIT')
+        response = self.client.get('/api/buses/', {'from_city': 'Lucknow', 'to_city': 'Agra'})
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_seat_write_invalidates_bus_searches(self):
+        self.client.get('/api/buses/')
+        with self.captureOnCommitCallbacks(execute=True):
+            BusSeat.objects.create(bus=self.bus, seat_number='1A', price=Decimal('650.00'))
+            # Nothing is invalidated before the write commits
+            self.assertEqual(self.client.get('/api/buses/')['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get('/api/buses/')['X-Cache'], 'MISS')
+
+        self.client.get('/api/trains/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bus.delete()
+        self.assertEqual(self.client.get('/api/buses/').data['count'], 0)
+        self.assertEqual(self.client.get('/api/trains/')['X-Cache'], 'HIT')
+
+    def test_fare_write_invalidates_train_searches(self):
+        self.client.get('/api/trains/')
+        with self.captureOnCommitCallbacks(execute=True):
+            train_class = TrainClass.objects.create(
+                train=self.train, class_type='SL', price=Decimal('400.00'),
+                available_seats=72, total_seats=72, tatkal_charge=Decimal('100.00'),
+            )
+        self.assertEqual(self.client.get('/api/trains/')['X-Cache'], 'MISS')
+        train_class.price = Decimal('450.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            train_class.save()
+        self.assertEqual(self.client.get('/api/trains/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/trains/')['X-Cache'], 'HIT')
+        self.assertEqual(train_search_cache.stats()['invalidations'], 2)
+
+    @override_settings(TRANSPORT_SEARCH_CACHE_TIMEOUT=30)
+    def test_entries_expire_after_ttl(self):
+        now = 1_000_000.0
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=now):
+            self.client.get('/api/buses/')
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=now + 29):
+            self.assertEqual(self.client.get('/api/buses/')['X-Cache'], 'HIT')
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=now + 31):
+            self.assertEqual(self.client.get('/api/buses/')['X-Cache'], 'MISS')
+
+    def test_stats_endpoint_requires_staff(self):
+        # Anonymous: 401 with a Bearer challenge from the JWT authentication
+        self.assertEqual(self.client.get('/api/search-cache/stats/').status_code, 401)
+        admin = get_user_model().objects.create(username='admin', is_staff=True)
+        self.client.force_authenticate(admin)
+        self.client.get('/api/buses/')
+        response = self.client.get('/api/search-cache/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['buses']['misses'], 1)
+
+
+class RouteLookupTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        caches['transport_search'].clear()
+        operator = make_operator()
+        make_bus(operator, from_city='Lucknow', to_city='Varanasi')
+        make_bus(operator, from_city='Lucknow', to_city='Agra')
+        make_bus(operator, from_city='Ludhiana', to_city='Amritsar')
+        make_train(number='12001', from_station='New Delhi', to_station='Bhopal')
+        make_train(number='12002', from_station='New  Jalpaiguri', to_station='Howrah')
+        make_homestay(make_host(), city='Leh', country='India')
+
+    def test_keys_are_normalized_on_save(self):
+        train = Train.objects.get(number='12002')
+        self.assertEqual(train.from_station_key, 'new jalpaiguri')
+        train.to_station = 'Sealdah'
+        train.save(update_fields=['to_station'])
+        train.refresh_from_db()
+        self.assertEqual(train.to_station_key, 'sealdah')
+
+    def test_keys_of_raw_and_bulk_writes(self):
+        # loaddata saves raw; bulk writes are left to backfill_search_keys
+        homestay = Homestay.objects.get()
+        homestay.pk, homestay.city, homestay.city_key = None, 'Kaza ', ''
+        homestay.save_base(raw=True)
+        self.assertEqual(Homestay.objects.get(pk=homestay.pk).city_key, 'kaza')
+
+        Bus.objects.update(from_city_key='', to_city_key='')
+        Train.objects.filter(number='12002').update(from_station_key='')
+        self.assertEqual(self.client.get('/api/buses/', {'from_city': 'lucknow'}).data['count'], 0)
+        out = StringIO()
+        call_command('backfill_search_keys', '--batch-size', '2', stdout=out)
+        self.assertIn('Bus: 3 row(s) backfilled', out.getvalue())
+        self.assertIn('Train: 1 row(s) backfilled', out.getvalue())
+        self.assertIn('Homestay: 0 row(s) backfilled', out.getvalue())
+        self.assertEqual(self.client.get('/api/buses/', {'from_city': 'lucknow'}).data['count'], 2)
+        self.assertEqual(Train.objects.get(number='12002').from_station_key, 'new jalpaiguri')
+
+    def test_bus_search_is_exact_and_case_insensitive(self):
+        response = self.client.get('/api/buses/', {'from_city': ' lucknow', 'to_city': 'VARANASI'})
+        self.assertEqual([row['to_city'] for row in response.data['results']], ['Varanasi'])
+        response = self.client.get('/api/buses/', {'from_city': 'Luck'})
+        self.assertEqual(response.data['count'], 0)
+
+    def test_train_and_homestay_search(self):
+        response = self.client.get('/api/trains/', {'from_station': 'new jalpaiguri'})
+        self.assertEqual([row['number'] for row in response.data['results']], ['12002'])
+        response = self.client.get('/api/homestays/', {'city': 'LEH', 'country': 'india'})
+        self.assertEqual(response.data['count'], 1)
+
+    def test_cache_key_folds_place_case(self):
+        self.client.get('/api/buses/', {'from_city': 'Lucknow'})
+        self.assertEqual(self.client.get('/api/buses/', {'from_city': 'LUCKNOW'})['X-Cache'], 'HIT')
+
+    def test_consumer_filters_use_keys(self):
+        consumer = RealTimeDataConsumer()
+        buses = async_to_sync(consumer.get_buses)({'from_city': 'LUCKNOW'})
+        self.assertEqual(len(buses), 2)
+        trains = async_to_sync(consumer.get_trains)({'to_station': 'bhopal'})
+        self.assertEqual(len(trains), 1)
+
+    def test_autocomplete(self):
+        response = self.client.get('/api/places/autocomplete/', {'q': 'lu'})
+        self.assertEqual(response.data['results'], ['Lucknow', 'Ludhiana'])
+        response = self.client.get('/api/places/autocomplete/', {'q': 'NEW ', 'kind': 'train'})
+        self.assertEqual(response.data['results'], ['New Delhi', 'New  Jalpaiguri'])
+        response = self.client.get('/api/places/autocomplete/', {'q': 'l', 'kind': 'stay'})
+        self.assertEqual(response.data['results'], ['Leh'])
+        response = self.client.get('/api/places/autocomplete/', {'q': 'a', 'limit': 1})
+        self.assertEqual(response.data['results'], ['Agra'])
+
+    def test_autocomplete_single_query(self):
+        with self.assertNumQueries(1):
+            self.client.get('/api/places/autocomplete/', {'q': 'a'})
+        response = self.client.get('/api/places/autocomplete/', {'q': 'a', 'kind': 'plane'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SeatReservationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        caches['transport_search'].clear()
+        self.bus = create_load_test_bus(4)
+        self.user = make_host('traveller')
+        self.client.force_authenticate(self.user)
+
+    def reserve(self, *seats, client=None):
+        return (client or self.client).post(
+            f'/api/buses/{self.bus.pk}/reserve/', {'seats': list(seats)}, format='json'
+        )
+
+    def test_reserve_confirm(self):
+        response = self.reserve('1', '2')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sorted(response.data['seats']), ['1', '2'])
+        self.assertEqual(response.data['total_fare'], '1000.00')
+        self.bus.refresh_from_db()
+        self.assertEqual(self.bus.available_seats, 2)
+
+        response = self.client.post(
+            f'/api/buses/{self.bus.pk}/confirm/', {'booking_id': response.data['id']}, format='json'
+        )
+        self.assertEqual(response.data['status'], 'confirmed')
+        self.assertEqual(
+            set(BusSeat.objects.filter(bus=self.bus, status='booked').values_list('seat_number', flat=True)),
+            {'1', '2'},
+        )
+        self.assertEqual(check_consistency(self.bus), [])
+
+    def test_conflicting_hold_is_rejected(self):
+        self.reserve('1', '2')
+        other = APIClient()
+        other.force_authenticate(make_host('other'))
+        response = self.reserve('2', '3', client=other)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['unavailable_seats'], ['2'])
+        self.assertEqual(BusSeat.objects.get(bus=self.bus, seat_number='3').status, 'available')
+        self.assertEqual(self.reserve('9').status_code, 409)
+        self.assertEqual(check_consistency(self.bus), [])
+
+    def test_release_returns_seats(self):
+        booking_id = self.reserve('1').data['id']
+        response = self.client.post(f'/api/buses/{self.bus.pk}/release/', {'booking_id': booking_id}, format='json')
+        self.assertEqual(response.data['status'], 'cancelled')
+        self.bus.refresh_from_db()
+        self.assertEqual(self.bus.available_seats, 4)
+        self.assertEqual(self.reserve('1').status_code, 201)
+
+    def test_expired_holds_are_released(self):
+        booking_id = self.reserve('1', '2').data['id']
+        BusBooking.objects.filter(pk=booking_id).update(hold_expires_at=timezone.now() - timedelta(seconds=1))
+
+        response = self.client.post(f'/api/buses/{self.bus.pk}/confirm/', {'booking_id': booking_id}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(BusBooking.objects.get(pk=booking_id).status, 'cancelled')
+        self.assertEqual(check_consistency(self.bus), [])
+
+        booking_id = self.reserve('3').data['id']
+        later = timezone.now() + timedelta(hours=1)
+        self.assertEqual(expire_holds(now=later), 1)
+        self.assertEqual(BusBooking.objects.get(pk=booking_id).status, 'cancelled')
+        self.bus.refresh_from_db()
+        self.assertEqual(self.bus.available_seats, 4)
+
+    def test_requires_authentication(self):
+        self.assertEqual(self.reserve('1', client=APIClient()).status_code, 401)
+        self.assertEqual(
+            self.client.post(f'/api/buses/{self.bus.pk}/confirm/', {'booking_id': 999}, format='json').status_code,
+            404,
+        )
+
+    def test_reservation_invalidates_search_cache(self):
+        self.client.get('/api/buses/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reserve('1')
+        response = self.client.get('/api/buses/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['available_seats'], 3)
+
+
+class StayBookingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = make_host('traveller')
+        self.client.force_authenticate(self.user)
+        self.property = make_property(make_host())
+        PropertyAvailability.objects.bulk_create([
+            PropertyAvailability(property=self.property, date=date(2030, 1, day), base_price=Decimal(1000 + 100 * day))
+            for day in range(1, 8)
+        ])
+
+    def book(self, check_in, check_out, guests=2, client=None):
+        return (client or self.client).post(
+            f'/api/properties/{self.property.pk}/book/',
+            {'check_in': check_in, 'check_out': check_out, 'guests': guests}, format='json',
+        )
+
+    def open_nights(self):
+        return list(
+            PropertyAvailability.objects.filter(property=self.property, is_available=True)
+            .order_by('date').values_list('date__day', flat=True)
+        )
+
+    def test_books_nights_at_calendar_prices(self):
+        response = self.book('2030-01-02', '2030-01-05')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['status'], response.data['total_price']), ('pending', '3900.00'))
+        self.assertEqual(self.open_nights(), [1, 5, 6, 7])
+
+        other = APIClient()
+        other.force_authenticate(make_host('other'))
+        self.assertEqual(self.book('2030-01-04', '2030-01-06', client=other).status_code, 409)
+        self.assertEqual(self.book('2030-01-01', '2030-01-02', client=other).status_code, 201)
+        self.assertEqual(self.book('2030-01-05', '2030-01-07', client=other).status_code, 201)
+        self.assertEqual(self.open_nights(), [7])
+        self.assertEqual(check_stay_consistency(self.property), [])
+
+    def test_rejects_unbookable_stays(self):
+        self.assertEqual(self.book('2030-01-06', '2030-01-09').status_code, 409)  # no calendar for the 8th
+        self.assertEqual(self.book('2030-01-02', '2030-01-03', guests=9).status_code, 400)
+        self.assertEqual(self.book('2030-01-03', '2030-01-02').status_code, 400)
+        PropertyAvailability.objects.filter(property=self.property, date=date(2030, 1, 3)).update(minimum_stay=2)
+        self.assertEqual(self.book('2030-01-03', '2030-01-04').status_code, 400)
+        self.assertEqual(self.book('2030-01-03', '2030-01-05').status_code, 201)
+        self.assertEqual(self.book('2030-01-01', '2030-01-02', client=APIClient()).status_code, 401)
+        self.assertEqual(PropertyBooking.objects.count(), 1)
+
+    def test_cancelling_reopens_nights(self):
+        booking_id = self.book('2030-01-02', '2030-01-04').data['id']
+        booking = cancel_property_booking(booking_id, self.user)
+        self.assertEqual(booking.status, 'cancelled')
+        self.assertEqual(self.open_nights(), list(range(1, 8)))
+        self.assertEqual(self.book('2030-01-03', '2030-01-05').status_code, 201)
+        self.assertEqual(check_stay_consistency(self.property), [])
+
+    def test_overlap_query_uses_the_composite_index(self):
+        plan = overlapping_bookings(self.property.pk, date(2030, 1, 1), date(2030, 1, 3)).explain()
+        index = next(index.name for index in PropertyBooking._meta.indexes if index.fields[0] == 'property')
+        self.assertIn(index, plan)
+
+    def test_homestay_rooms_are_counted_per_night(self):
+        homestay = make_homestay(make_host('host2'), total_rooms=2, available_rooms=2)
+        url = f'/api/homestays/{homestay.pk}/book/'
+
+        def book(check_in, check_out):
+            stay = {'check_in': f'2030-01-{check_in:02}', 'check_out': f'2030-01-{check_out:02}', 'guests': 2}
+            return self.client.post(url, stay, format='json')
+
+        response = book(1, 3)
+        self.assertEqual((response.status_code, response.data['total_price']), (201, '3000.00'))
+        self.assertEqual(book(2, 5).status_code, 201)
+        self.assertEqual(book(2, 3).status_code, 409)  # both rooms taken on the 2nd
+        self.assertEqual(book(3, 4).status_code, 201)  # the first room is free from check_out
+        self.assertEqual(book(1, 5).status_code, 409)
+        self.assertEqual(book(5, 8).status_code, 201)
+        homestay.refresh_from_db()
+        self.assertEqual(homestay.available_rooms, 2)
+
+        release_homestay_booking(response.data['id'])
+        self.assertEqual(Booking.objects.get(pk=response.data['id']).status, 'cancelled')
+        self.assertEqual(book(1, 3).status_code, 201)
+
+    def test_peak_occupancy(self):
+        stays = [(date(2030, 1, 1), date(2030, 1, 3)), (date(2030, 1, 3), date(2030, 1, 5))]
+        self.assertEqual(peak_occupancy(stays, date(2030, 1, 1), date(2030, 1, 5)), 1)
+        stays.append((date(2029, 12, 30), date(2030, 1, 2)))
+        self.assertEqual(peak_occupancy(stays, date(2030, 1, 1), date(2030, 1, 5)), 2)
+        self.assertEqual(peak_occupancy(stays, date(2030, 1, 2), date(2030, 1, 5)), 1)
+
+    def test_stays_end_after_checkout(self):
+        homestay = make_homestay(make_host('host2'), total_rooms=3, available_rooms=3)
+        stays = [
+            book_homestay(homestay, self.user, date(2030, 1, 1), date(2030, 1, check_out), 1)
+            for check_out in (3, 3, 5)
+        ]
+        Booking.objects.filter(pk=stays[0].pk).update(status='confirmed')
+        self.assertEqual(end_homestay_stays(date(2030, 1, 2)), 0)
+        self.assertEqual(end_homestay_stays(date(2030, 1, 3)), 2)
+        self.assertEqual(
+            list(Booking.objects.order_by('pk').values_list('status', flat=True)), ['completed', 'cancelled', 'pending']
+        )
+        out = StringIO()
+        with mock.patch('myapp.stays.timezone.localdate', return_value=date(2030, 1, 5)):
+            call_command('end_homestay_stays', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Ended 1 homestay stay(s)')
+        self.assertFalse(overlapping_homestay_bookings(homestay.pk, date(2030, 1, 1), date(2030, 1, 5)).exists())
+
+
+class ConcurrentStayBookingTests(TransactionTestCase):
+    def test_no_overlapping_stays_under_contention(self):
+        property = create_load_test_property(10)
+        report = run_stay_load_test(property, workers=6, attempts=15, max_nights=3, seed=7)
+        self.assertEqual(report['problems'], [])
+        self.assertEqual(report['attempts'], 90)
+        self.assertGreater(report['booked'], 0)
+        self.assertLessEqual(report['booked'], 10)
+        self.assertGreater(report['conflicts'], 0)
+
+
+class ConcurrentSeatReservationTests(TransactionTestCase):
+    def test_no_double_booking_under_contention(self):
+        bus = create_load_test_bus(12)
+        report = run_load_test(bus, workers=6, attempts=15, seats_per_booking=2, hot_seats=6, seed=7)
+        self.assertEqual(report['problems'], [])
+        self.assertEqual(report['attempts'], 90)
+        self.assertGreater(report['reserved'], 0)
+        self.assertLessEqual(report['reserved'], 3)
+        self.assertGreater(report['conflicts'], 0)
+        self.assertGreater(report['throughput'], 0)
+
+
+class RealTimeDiffTests(TransactionTestCase):
+    def setUp(self):
+        registry.clear()
+        self.host = make_host()
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(RealTimeDataConsumer.as_asgi(), '/ws/realtime/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def subscribe(self, communicator, filters):
+        await communicator.send_json_to({'type': 'subscribe_properties', 'filters': filters})
+        return await communicator.receive_json_from()
+
+    async def test_snapshot_then_diffs(self):
+        await database_sync_to_async(make_property)(self.host, name='Existing', price_per_night=Decimal('2000'))
+        cheap = await self.connect()
+        snapshot = await self.subscribe(cheap, {'city': 'Manali', 'max_price': '3000'})
+        self.assertEqual(snapshot['type'], 'properties_update')
+        self.assertEqual(snapshot['version'], 0)
+        self.assertEqual([row['name'] for row in snapshot['data']], ['Existing'])
+
+        pricey = await self.connect()
+        await self.subscribe(pricey, {'city': 'manali', 'min_price': '5000'})
+
+        prop = await database_sync_to_async(make_property)(self.host, name='New', price_per_night=Decimal('2500'))
+        diff = await cheap.receive_json_from()
+        self.assertEqual(diff['type'], 'properties_diff')
+        self.assertEqual(diff['version'], 1)
+        self.assertEqual([row['name'] for row in diff['added']], ['New'])
+        self.assertEqual(diff['added'][0]['host_name'], 'host')
+        self.assertTrue(await pricey.receive_nothing())
+
+        prop.name = 'Renamed'
+        await database_sync_to_async(prop.save)()
+        diff = await cheap.receive_json_from()
+        self.assertEqual((diff['version'], diff['changed'][0]['name']), (2, 'Renamed'))
+
+        prop.price_per_night = Decimal('6000')
+        await database_sync_to_async(prop.save)()
+        diff = await cheap.receive_json_from()
+        self.assertEqual((diff['version'], diff['removed']), (3, [prop.pk]))
+        diff = await pricey.receive_json_from()
+        self.assertEqual((diff['version'], [row['name'] for row in diff['added']]), (1, ['Renamed']))
+
+        pk = prop.pk
+        await database_sync_to_async(prop.delete)()
+        diff = await pricey.receive_json_from()
+        self.assertEqual(diff['removed'], [pk])
+        self.assertTrue(await cheap.receive_nothing())
+
+        await cheap.send_json_to({'type': 'resync', 'kind': 'properties'})
+        snapshot = await cheap.receive_json_from()
+        self.assertEqual((snapshot['version'], len(snapshot['data'])), (3, 1))
+
+        await cheap.disconnect()
+        await pricey.disconnect()
+        self.assertEqual(registry.groups('properties'), [])
+
+    async def test_equal_filters_share_a_group(self):
+        first = await self.connect()
+        second = await self.connect()
+        await self.subscribe(first, {'city': 'Manali ', 'type': 'cabin', 'state': ''})
+        await self.subscribe(second, {'type': 'cabin', 'city': 'MANALI'})
+        self.assertEqual(len(registry.groups('properties')), 1)
+
+        await database_sync_to_async(make_property)(self.host)
+        self.assertEqual(len((await first.receive_json_from())['added']), 1)
+        self.assertEqual(len((await second.receive_json_from())['added']), 1)
+
+        await first.send_json_to({'type': 'unsubscribe', 'kind': 'properties'})
+        self.assertEqual((await first.receive_json_from())['type'], 'unsubscribed')
+        await database_sync_to_async(make_property)(self.host, name='Another')
+        self.assertTrue(await first.receive_nothing())
+        self.assertEqual(len((await second.receive_json_from())['added']), 1)
+        await first.disconnect()
+        await second.disconnect()
+
+    async def test_invalid_filters(self):
+        communicator = await self.connect()
+        response = await self.subscribe(communicator, {'min_price': 'cheap'})
+        self.assertEqual(response['type'], 'error')
+        self.assertEqual(registry.groups('properties'), [])
+        await communicator.disconnect()
+
+
+class BrokerChannelLayerTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.broker = start_broker(authkey='test')
+        host, port = cls.broker.address
+        cls.address = f'{host}:{port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.broker.shutdown()
+        super().tearDownClass()
+
+    async def test_group_send_reaches_every_worker(self):
+        first = BrokerChannelLayer(self.address, authkey='test')
+        second = BrokerChannelLayer(self.address, authkey='test')
+        try:
+            a = await first.new_channel()
+            b = await second.new_channel()
+            await first.group_add('rt.properties.changes', a)
+            await second.group_add('rt.properties.changes', b)
+            await first.group_send('rt.properties.changes', {'type': 'realtime.change', 'pk': 1})
+            self.assertEqual((await first.receive(a))['pk'], 1)
+            self.assertEqual((await second.receive(b))['pk'], 1)
+
+            await second.send(a, {'type': 'direct'})
+            self.assertEqual((await first.receive(a))['type'], 'direct')
+        finally:
+            await first.flush()
+            await first.close()
+            await second.close()
+
+    def test_multi_worker_harness(self):
+        report = run_harness(workers=2, sockets=2, messages=5, timeout=5)
+        self.assertEqual(report['delivered'], report['expected'])
+        self.assertEqual(report['expected'], 20)
+        self.assertGreater(report['messages_per_second'], 0)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        caches['transport_search'].clear()
+        host = make_host()
+        # Repeated prices so pages split inside runs of equal values
+        for i in range(45):
+            make_property(host, name=f'Cabin {i}', price_per_night=Decimal(1000 + (i % 4) * 500))
+        self.expected = list(
+            Property.objects.order_by('-price_per_night', '-pk').values_list('pk', flat=True)
+        )
+
+    def walk(self, url, link='next'):
+        seen = []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(ctx.captured_queries), 1)
+            self.assertNotIn('count', response.data)
+            seen.append([row['id'] for row in response.data['results']])
+            url = response.data[link]
+        return seen
+
+    def test_walk_forward_and_back(self):
+        pages = self.walk('/api/properties/?paginate=cursor&ordering=-price_per_night')
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+        self.assertEqual(sum(pages, []), self.expected)
+
+        last = self.client.get('/api/properties/?paginate=cursor&ordering=-price_per_night')
+        for _ in range(2):
+            last = self.client.get(last.data['next'])
+        back = self.walk(last.data['previous'], link='previous')
+        self.assertEqual(back, pages[1::-1])
+
+    def test_default_and_other_orderings(self):
+        pages = self.walk('/api/properties/?paginate=cursor')
+        self.assertEqual(sum(pages, []), sorted(self.expected))
+
+        pages = self.walk('/api/properties/?paginate=cursor&ordering=rating&min_price=1500')
+        self.assertEqual(len(sum(pages, [])), 33)
+
+    def test_page_numbers_remain_the_default(self):
+        response = self.client.get('/api/properties/?page=3')
+        self.assertEqual(response.data['count'], 45)
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_bus_departure_cursor(self):
+        operator = make_operator()
+        start = timezone.now()
+        for i in range(25):
+            make_bus(operator, bus_number=f'UP32 {i}', departure_time=start + timedelta(minutes=i % 3))
+        pages = self.walk('/api/buses/?paginate=cursor&ordering=departure_time')
+        self.assertEqual(
+            sum(pages, []),
+            list(Bus.objects.order_by('departure_time', 'pk').values_list('pk', flat=True)),
+        )
+
+    def test_rejects_unindexed_ordering_and_bad_cursor(self):
+        response = self.client.get('/api/properties/?paginate=cursor&ordering=created_at')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/properties/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_benchmark(self):
+        create_bench_properties(300)
+        results = run_pagination_benchmark(300, [1, 5, 16], repeat=1)
+        self.assertEqual([result['page'] for result in results], [1, 5])
+        self.assertTrue(all(result['keyset_queries'] == 1 for result in results))
+        self.assertTrue(all(result['page_number_queries'] == 2 for result in results))
+
+
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.host = make_host()
+        self.named = make_property(self.host, name='Lakeside Cabin', description='Quiet and green')
+        self.described = make_property(
+            self.host, name='Pine Retreat', description='A wooden cabin near the lakeside'
+        )
+        self.other = make_property(self.host, name='Desert Camp', description='Dunes and stars',
+                                   location='Jaisalmer, Rajasthan')
+
+    def search(self, query, url='/api/properties/'):
+        response = self.client.get(url, {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']]
+
+    def test_ranks_name_matches_first(self):
+        self.assertEqual(self.search('lakeside'), [self.named.pk, self.described.pk])
+        self.assertEqual(self.search('cabin lakeside'), [self.named.pk, self.described.pk])
+        self.assertEqual(self.search('rajasthan dunes'), [self.other.pk])
+
+    def test_prefixes_accents_and_syntax(self):
+        self.assertEqual(self.search('lakesi'), [self.named.pk, self.described.pk])
+        make_property(self.host, name='Café Chalet', description='Coffee on the ridge')
+        self.assertEqual(len(self.search('cafe')), 1)
+        self.assertEqual(self.search('"cabin OR* (NEAR'), [])
+        self.assertEqual(self.search('lakeside -'), [self.named.pk, self.described.pk])
+
+    def test_ordering_param_overrides_rank(self):
+        self.described.price_per_night = Decimal('900.00')
+        self.described.save()
+        response = self.client.get('/api/properties/', {'search': 'lakeside', 'ordering': 'price_per_night'})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.described.pk, self.named.pk])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.named.name = 'Hilltop Cottage'
+        self.named.save()
+        self.assertEqual(self.search('hilltop'), [self.named.pk])
+        self.assertEqual(self.search('lakeside'), [self.described.pk])
+        self.described.delete()
+        self.assertEqual(self.search('lakeside'), [])
+
+    def test_homestays(self):
+        homestay = make_homestay(self.host, address='12 Ganga Ghat Lane')
+        make_homestay(self.host, name='Hill View')
+        self.assertEqual(self.search('ganga', url='/api/homestays/'), [homestay.pk])
+
+    def test_rebuild_after_bulk_create(self):
+        Property.objects.bulk_create([
+            Property(host=self.host, name='Bulk Houseboat', type='houseboat', location='Alleppey',
+                     state='Kerala', city='Alleppey', description='', max_guests=2, bedrooms=1,
+                     bathrooms=1, price_per_night=Decimal('3000.00'))
+        ])
+        self.assertEqual(self.search('houseboat'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self.search('houseboat')), 1)
+
+    def test_single_query_page(self):
+        with self.assertNumQueries(2):
+            self.search('lakeside')
+
+    def test_falls_back_to_icontains(self):
+        with mock.patch.dict('myapp.search_index.BACKENDS', clear=True):
+            self.assertEqual(sorted(self.search('akesid')), sorted([self.named.pk, self.described.pk]))
+
+
+class AsyncOAuthTests(TestCase):
+    def callback(self, code='code-1', **extra):
+        return self.async_client.post('/api/auth/oauth/callback/', {
+            'provider': 'github', 'code': code, 'redirect_uri': 'http://localhost/callback', **extra,
+        }, content_type='application/json')
+
+    async def login_against(self, provider, *codes):
+        responses = []
+        with mock.patch.dict(OAUTH_CONFIG, {'github': fake_provider_config(provider)}):
+            try:
+                for code in codes:
+                    responses.append(await self.callback(code))
+            finally:
+                await oauth_client.close_client()
+        return responses
+
+    async def test_code_flow_reuses_provider_connection(self):
+        with FakeProvider(latency=0) as provider:
+            first, second = await self.login_against(provider, 'code-7', 'code-7')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()['user']['email'], 'bench-7@example.com')
+        self.assertTrue(first.json()['is_new_user'])
+        self.assertFalse(second.json()['is_new_user'])
+        self.assertEqual((provider.requests, provider.connections), (4, 1))
+
+    @mock.patch.object(oauth_client, 'BACKOFF_BASE', 0.001)
+    async def test_retries_transient_failures(self):
+        with FakeProvider(latency=0, failures=2) as provider:
+            response, = await self.login_against(provider, 'code-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(provider.requests, 4)
+
+        with FakeProvider(latency=0, failures=10) as provider:
+            response, = await self.login_against(provider, 'code-2')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(provider.requests, 3)
+
+    @mock.patch.object(oauth_client, 'BACKOFF_BASE', 0.001)
+    async def test_unreachable_provider(self):
+        provider = FakeProvider()
+        config = fake_provider_config(provider)
+        provider.server_close()
+        with mock.patch.dict(OAUTH_CONFIG, {'github': config}):
+            try:
+                response = await self.callback()
+            finally:
+                await oauth_client.close_client()
+        self.assertEqual(response.status_code, 500)
+
+    async def test_validation(self):
+        response = await self.async_client.post(
+            '/api/auth/oauth/callback/', {'provider': 'github'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        response = await self.callback(provider='myspace')
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.get('/api/auth/oauth/callback/')
+        self.assertEqual(response.status_code, 405)
+
+    async def test_facebook_access_token(self):
+        with FakeProvider(latency=0) as provider:
+            with mock.patch.dict(OAUTH_CONFIG, {'facebook': fake_provider_config(provider)}):
+                try:
+                    response = await self.async_client.post(
+                        '/api/auth/facebook/', {'access_token': 'token-3'}, content_type='application/json'
+                    )
+                finally:
+                    await oauth_client.close_client()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['name'], 'Bench User 3')
+
+    def test_login_benchmark(self):
+        report = run_login_benchmark(logins=20, concurrency=5, latency=0)
+        self.assertEqual(report['succeeded'], 20)
+        self.assertEqual(report['provider_requests'], 40)
+        self.assertLessEqual(report['provider_connections'], 5)
+
+
+class GoogleIdTokenTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.jwks_path = os.path.join(cls.tmp.name, 'jwks.json')
+        cls.jwks = {'keys': [cls.jwk(cls.private_key, 'key-1')]}
+        with open(cls.jwks_path, 'w') as f:
+            json.dump(cls.jwks, f)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    @staticmethod
+    def jwk(private_key, kid):
+        jwk = jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+        return {**jwk, 'kid': kid, 'use': 'sig', 'alg': 'RS256'}
+
+    def setUp(self):
+        caches['oauth_keys'].clear()
+        id_tokens._key_sets.clear()
+        settings = override_settings(GOOGLE_JWKS_FILE=self.jwks_path, GOOGLE_CLIENT_ID='test-client')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def credential(self, key=None, kid='key-1', **claims):
+        now = int(time_module.time())
+        payload = {
+            'iss': 'https://accounts.google.com', 'aud': 'test-client', 'sub': '1234',
+            'email': 'asha@example.com', 'email_verified': True, 'name': 'Asha',
+            'iat': now, 'exp': now + 600, **claims,
+        }
+        return jwt.encode(payload, key or self.private_key, algorithm='RS256', headers={'kid': kid})
+
+    def login(self, credential):
+        return APIClient().post('/api/auth/google/', {'credential': credential}, format='json')
+
+    def test_verified_login(self):
+        response = self.login(self.credential())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user']['email'], 'asha@example.com')
+        self.assertTrue(response.data['is_new_user'])
+        self.assertFalse(self.login(self.credential()).data['is_new_user'])
+
+    def test_rejects_bad_tokens(self):
+        forger = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        for credential in [
+            self.credential(key=forger),
+            self.credential(aud='someone-else'),
+            self.credential(iss='https://evil.example.com'),
+            self.credential(exp=int(time_module.time()) - 60),
+            self.credential(kid='key-2'),
+            'not-a-jwt',
+        ]:
+            response = self.login(credential)
+            self.assertEqual(response.status_code, 400, credential)
+            self.assertEqual(response.data, {'error': 'Invalid credential'})
+
+    def test_unverified_email_is_not_linked(self):
+        User.objects.create(email='asha@example.com', name='Asha', preference='traveller')
+        response = self.login(self.credential(email_verified=False))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['user']['email'])
+        self.assertTrue(response.data['is_new_user'])
+
+    def test_keys_fetched_once_across_workers(self):
+        workers = [id_tokens.JWKSCache('unused', self.jwks_path) for _ in range(3)]
+        with mock.patch.object(id_tokens.JWKSCache, 'fetch', autospec=True,
+                               side_effect=id_tokens.JWKSCache.fetch) as fetch:
+            for worker in workers * 5:
+                self.assertIsNotNone(worker.get_key('key-1'))
+        self.assertEqual(fetch.call_count, 1)
+
+    def test_background_refresh_keeps_serving(self):
+        key_set = id_tokens.JWKSCache('unused', self.jwks_path)
+        key_set.get_key('key-1')
+        # Most of max-age has passed, for this worker and the shared copy
+        stale = {**key_set._document, 'fetched_at': time_module.time() - 0.9 * id_tokens.DEFAULT_MAX_AGE}
+        key_set.install(stale)
+        caches['oauth_keys'].set(key_set.cache_key, stale)
+        with mock.patch.object(id_tokens.JWKSCache, 'fetch', autospec=True,
+                               side_effect=id_tokens.JWKSCache.fetch) as fetch:
+            self.assertIsNotNone(key_set.get_key('key-1'))
+            for _ in range(100):
+                if not key_set._refreshing:
+                    break
+                time_module.sleep(0.01)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertGreater(key_set._refresh_at, time_module.time())
+
+    def test_rotated_key_is_fetched(self):
+        key_set = id_tokens.JWKSCache('unused', self.jwks_path)
+        key_set.get_key('key-1')
+        rotated = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        with open(self.jwks_path, 'w') as f:
+            json.dump({'keys': self.jwks['keys'] + [self.jwk(rotated, 'key-2')]}, f)
+        try:
+            self.assertIsNotNone(key_set.get_key('key-2'))
+            with self.assertRaises(jwt.InvalidTokenError):
+                key_set.get_key('key-3')
+        finally:
+            with open(self.jwks_path, 'w') as f:
+                json.dump(self.jwks, f)
+
+    def test_remote_keys_honor_max_age(self):
+        self.assertEqual(id_tokens.parse_max_age('public, max-age=19876, must-revalidate'), 19876)
+        self.assertEqual(id_tokens.parse_max_age(None), id_tokens.DEFAULT_MAX_AGE)
+        url = 'https://keys.example.com/certs'
+        response = httpx.Response(
+            200, json=self.jwks, headers={'Cache-Control': 'public, max-age=120'},
+            request=httpx.Request('GET', url),
+        )
+        with mock.patch('myapp.id_tokens.httpx.get', return_value=response) as get:
+            key_set = id_tokens.JWKSCache(url)
+            key_set.get_key('key-1')
+            key_set.get_key('key-1')
+        get.assert_called_once()
+        self.assertAlmostEqual(key_set._expires_at - time_module.time(), 120, delta=5)
+
+
+class OAuthAccountTests(TestCase):
+    def record(self, n, with_email=True, **extra):
+        return {**bench_record(n, with_email), **extra}
+
+    def test_cold_then_warm_login(self):
+        user, is_new = get_or_create_user_from_oauth('google', self.record(1))
+        self.assertTrue(is_new)
+        self.assertEqual(user.oauth_profile.provider_user_id, 'acct-bench-1')
+        with self.assertNumQueries(1):
+            again, is_new = get_or_create_user_from_oauth('google', self.record(1))
+        self.assertEqual((again.pk, is_new), (user.pk, False))
+
+    def test_links_existing_email(self):
+        existing = User.objects.create(email='acct-bench-2@example.com', preference='traveller')
+        user, is_new = get_or_create_user_from_oauth('github', self.record(2))
+        self.assertEqual((user.pk, is_new), (existing.pk, False))
+        self.assertEqual(OAuthProfile.objects.get(user=existing).provider, 'github')
+
+        # The user already has a profile, from another provider account
+        with self.assertRaisesMessage(AccountConflict, 'acct-bench-2@example.com is already signed in with GitHub'):
+            get_or_create_user_from_oauth('google', self.record(3, email='acct-bench-2@example.com'))
+        self.assertEqual(OAuthProfile.objects.get(user=existing).provider_user_id, 'acct-bench-2')
+
+    def test_without_email(self):
+        first, _ = get_or_create_user_from_oauth('facebook', self.record(4, with_email=False))
+        second, _ = get_or_create_user_from_oauth('facebook', self.record(5, with_email=False))
+        self.assertNotEqual(first.pk, second.pk)
+        self.assertIsNone(first.email)
+        self.assertEqual(get_or_create_user_from_oauth('facebook', self.record(4, with_email=False))[0], first)
+
+    def test_providers_sharing_an_id_are_different_accounts(self):
+        github, _ = get_or_create_user_from_oauth('github', self.record(6, id='12345'))
+        facebook, is_new = get_or_create_user_from_oauth('facebook', self.record(7, id='12345'))
+        self.assertTrue(is_new)
+        anonymous, is_new = get_or_create_user_from_oauth('google', self.record(8, with_email=False, id='12345'))
+        self.assertTrue(is_new)
+        self.assertEqual(len({github.pk, facebook.pk, anonymous.pk}), 3)
+        self.assertEqual(get_or_create_user_from_oauth('github', self.record(6, id='12345')), (github, False))
+
+        counts = import_oauth_users('facebook', [self.record(7, id='12345'), self.record(9, id='67890')])
+        self.assertEqual(counts, {'created': 1, 'linked': 0, 'existing': 1})
+        counts = import_oauth_users('github', [self.record(10, id='67890')])
+        self.assertEqual(counts, {'created': 1, 'linked': 0, 'existing': 0})
+        self.assertEqual(OAuthProfile.objects.filter(provider_user_id='67890').count(), 2)
+
+    def test_batch_import(self):
+        get_or_create_user_from_oauth('google', self.record(0))
+        linked = User.objects.create(email='acct-bench-1@example.com', preference='traveller')
+        records = [self.record(n, with_email=n % 3 != 2) for n in range(12)] + [self.record(5)]
+        counts = import_oauth_users('google', records, batch_size=5)
+        self.assertEqual(counts, {'created': 10, 'linked': 1, 'existing': 1})
+        self.assertEqual(OAuthProfile.objects.get(user=linked).provider_user_id, 'acct-bench-1')
+        self.assertEqual(OAuthProfile.objects.count(), 12)
+        self.assertEqual(import_oauth_users('google', records), {'created': 0, 'linked': 0, 'existing': 12})
+
+    def test_batch_import_query_count_is_per_batch(self):
+        def queries(start, size):
+            with CaptureQueriesContext(connection) as ctx:
+                import_oauth_users('google', [self.record(n) for n in range(start, start + size)])
+            return len(ctx.captured_queries)
+
+        # Small enough that SQLite doesn't split the inserts on its variable limit
+        self.assertEqual(queries(0, 5), queries(100, 40))
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            for n in range(3):
+                f.write(json.dumps(self.record(n)) + '\n')
+        self.addCleanup(os.unlink, f.name)
+        out = StringIO()
+        call_command('import_oauth_users', 'github', f.name, stdout=out)
+        self.assertIn('3 created', out.getvalue())
+
+
+class ConcurrentOAuthLoginTests(TransactionTestCase):
+    def test_duplicate_first_logins_share_one_user(self):
+        for email in (True, False):
+            report = run_duplicate_logins(accounts=10, threads=4, email=email)
+            self.assertEqual(report['outcomes'].get('ok'), 40, report)
+            self.assertEqual(
+                (report['split_accounts'], report['missing_profiles'], report['orphan_users']), (0, 0, 0)
+            )
+            delete_bench_accounts()
+
+
+class StatelessJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        denylist.clear()
+        cache.clear()
+        self.client = APIClient()
+        response = self.client.post('/api/auth/register/', {
+            'name': 'Asha', 'email': 'asha@example.com', 'password': 'secret',
+        }, format='json')
+        self.tokens = response.json()
+        self.user = User.objects.get(email='asha@example.com')
+
+    def bearer(self, token=None):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {token or self.tokens['token']}")
+        return client
+
+    def test_authenticated_reads_cost_no_auth_query(self):
+        client = self.bearer()
+        client.get('/api/buses/')  # First call syncs the denylist
+        with CaptureQueriesContext(connection) as anonymous:
+            APIClient().get('/api/buses/')
+        with CaptureQueriesContext(connection) as authenticated:
+            response = client.get('/api/buses/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(authenticated.captured_queries), len(anonymous.captured_queries))
+        self.assertEqual(int(response.wsgi_request.user.id), self.user.pk)
+        self.assertEqual(response.wsgi_request.user.preference, 'traveller')
+
+    def test_bad_token_is_rejected(self):
+        self.assertEqual(self.bearer('not-a-token').get('/api/buses/').status_code, 401)
+        self.assertEqual(self.bearer(self.tokens['refresh']).get('/api/buses/').status_code, 401)
+
+    def test_logout_revokes_access_and_refresh_tokens(self):
+        client = self.bearer()
+        response = client.post('/api/auth/logout/', {'refresh': self.tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(RevokedToken.objects.count(), 2)
+        self.assertEqual(client.get('/api/buses/').status_code, 401)
+        response = APIClient().post('/api/auth/refresh/', {'refresh': self.tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_issues_working_access_token(self):
+        response = APIClient().post('/api/auth/refresh/', {'refresh': self.tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.bearer(response.json()['token']).get('/api/buses/').status_code, 200)
+
+    def test_revocations_from_other_processes_apply_after_sync(self):
+        client = self.bearer()
+        self.assertEqual(client.get('/api/buses/').status_code, 200)
+        claims = jwt.decode(self.tokens['token'], options={'verify_signature': False})
+        RevokedToken.objects.create(
+            jti=claims['jti'], expires_at=timezone.now() + timedelta(minutes=5)
+        )
+        self.assertEqual(client.get('/api/buses/').status_code, 200)
+        with override_settings(JWT_DENYLIST_SYNC_SECONDS=0):
+            self.assertEqual(client.get('/api/buses/').status_code, 401)
+
+    def test_account_is_cached_until_the_user_changes(self):
+        user = self.bearer().get('/api/buses/').wsgi_request.user
+        with self.assertNumQueries(1):
+            self.assertEqual(user.account, self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(ClaimsUser(user.token).account.name, 'Asha')
+        self.user.name = 'Asha R'
+        self.user.save()
+        self.assertEqual(ClaimsUser(user.token).account.name, 'Asha R')
+
+    def test_bookings_need_an_account_user(self):
+        bus = make_bus(make_operator())
+        response = self.bearer().post(f'/api/buses/{bus.pk}/reserve/', {'seats': ['1']}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000)
+        for n in range(1000):
+            bloom.add(f'jti-{n}')
+        self.assertTrue(all(f'jti-{n}' in bloom for n in range(1000)))
+        false_positives = sum(f'other-{n}' in bloom for n in range(10000))
+        self.assertLess(false_positives, 50)
+        self.assertLess(len(bloom.bits), 2000)
+
+
+def fake_translator(texts, source_language, target_language):
+    fake_translator.calls.append(list(texts))
+    return [f'[{target_language}] {text}' for text in texts]
+
+
+class TranslationStoreTests(TestCase):
+    def setUp(self):
+        translation_store.clear()
+        fake_translator.calls = []
+
+    def cache_rows(self, count, target='hi'):
+        for n in range(count):
+            TranslationsCache.objects.create(
+                source_text=f'Text {n}', source_language='en', target_language=target,
+                translated_text=f'Translated {n}',
+            )
+
+    def test_key_is_fixed_size(self):
+        row = TranslationsCache.objects.create(
+            source_text='x' * 10000, source_language='en', target_language='hi', translated_text='y'
+        )
+        self.assertEqual(len(row.key), 32)
+
+    def test_page_resolves_in_one_query_then_from_memory(self):
+        self.cache_rows(20)
+        texts = [f'Text {n}' for n in range(20)]
+        with self.assertNumQueries(1):
+            result = translation_store.translate_many(texts, 'en', 'hi')
+        self.assertEqual(result, [f'Translated {n}' for n in range(20)])
+        with self.assertNumQueries(0):
+            self.assertEqual(translation_store.translate_many(texts, 'en', 'hi'), result)
+        self.assertEqual(translation_store.translate_many(texts[:1], 'en', 'mr'), [None])
+
+    def test_translator_only_sees_misses(self):
+        self.cache_rows(1)
+        result = translation_store.translate_many(['Text 0', 'New', 'New'], 'en', 'hi', fake_translator)
+        self.assertEqual(result, ['Translated 0', '[hi] New', '[hi] New'])
+        self.assertEqual(fake_translator.calls, [['New']])
+        translation_store.clear()
+        self.assertEqual(translation_store.translate('New', 'en', 'hi', fake_translator), '[hi] New')
+        self.assertEqual(len(fake_translator.calls), 1)
+
+    def test_usage_is_written_back_in_batches(self):
+        self.cache_rows(3)
+        for _ in range(2):
+            translation_store.translate_many(['Text 0', 'Text 1'], 'en', 'hi')
+        translation_store.translate_many(['Text 2'], 'en', 'hi')
+        with self.assertNumQueries(2):  # One UPDATE per distinct count
+            translation_store.flush_usage()
+        counts = dict(TranslationsCache.objects.values_list('source_text', 'use_count'))
+        self.assertEqual(counts, {'Text 0': 3, 'Text 1': 3, 'Text 2': 2})
+
+    def test_eviction_keeps_recent_and_frequent_rows(self):
+        self.cache_rows(6)
+        now = timezone.now()
+        for n, row in enumerate(TranslationsCache.objects.order_by('id')):
+            TranslationsCache.objects.filter(pk=row.pk).update(
+                last_used=now - timedelta(days=n // 2), use_count=n % 2
+            )
+        self.assertEqual(evict_translations(3, batch_size=1), 3)
+        self.assertEqual(
+            sorted(TranslationsCache.objects.values_list('source_text', flat=True)),
+            ['Text 0', 'Text 1', 'Text 3'],
+        )
+        out = StringIO()
+        call_command('evict_translations', '--max-rows', '0', stdout=out)
+        self.assertIn('Evicted 3', out.getvalue())
+
+    def test_listing_descriptions_follow_lang(self):
+        host = make_host()
+        make_property(host, name='Cabin', description='Text 0')
+        self.cache_rows(1)
+        item = self.client.get('/api/properties/', {'lang': 'hi'}).json()['results'][0]
+        self.assertEqual(item['description'], 'Translated 0')
+        item = self.client.get('/api/properties/', {'lang': 'mr'}).json()['results'][0]
+        self.assertEqual(item['description'], 'Text 0')
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.host = make_host()
+
+    def review(self, prop, rating, username):
+        return PropertyReview.objects.create(
+            property=prop, user=make_host(username), rating=rating, comment='',
+            cleanliness_rating=4, location_rating=4, value_rating=4, amenities_rating=4,
+        )
+
+    def homestay_review(self, homestay, rating, username):
+        guest = make_host(username)
+        booking = Booking.objects.create(
+            user=guest, homestay=homestay, check_in=date(2025, 1, 1), check_out=date(2025, 1, 2),
+            guests=1, total_price=Decimal('1500.00'),
+        )
+        return Review.objects.create(
+            user=guest, homestay=homestay, booking=booking, rating=rating, comment='',
+            cleanliness_rating=4, communication_rating=4, value_rating=4, location_rating=4,
+        )
+
+    def assertRating(self, obj, rating, count):
+        obj.refresh_from_db()
+        self.assertAlmostEqual(obj.rating, rating)
+        self.assertEqual(obj.total_ratings, count)
+
+    def test_property_reviews_update_the_aggregate(self):
+        cabin, lodge = make_property(self.host), make_property(self.host, name='Lodge')
+        first = self.review(cabin, 4.0, 'a')
+        self.review(cabin, 5.0, 'b')
+        self.assertRating(cabin, 4.5, 2)
+
+        first.rating = 2.0
+        first.save()
+        self.assertRating(cabin, 3.5, 2)
+
+        first.property = lodge
+        first.save()
+        self.assertRating(cabin, 5.0, 1)
+        self.assertRating(lodge, 2.0, 1)
+
+        first.delete()
+        self.assertRating(lodge, 0.0, 0)
+        get_user_model().objects.filter(username='b').delete()  # Cascades to the review
+        self.assertRating(cabin, 0.0, 0)
+
+    def test_homestay_reviews_update_the_aggregate(self):
+        homestay = make_homestay(self.host)
+        self.homestay_review(homestay, 3, 'a')
+        review = self.homestay_review(homestay, 4, 'b')
+        self.assertRating(homestay, 3.5, 2)
+        review.delete()
+        self.assertRating(homestay, 3.0, 1)
+
+    def test_buses_update_their_operator(self):
+        operator, other = make_operator(), make_operator('KSRTC')
+        make_bus(operator, rating=4.0, total_ratings=10)
+        bus = make_bus(operator, rating=5.0, total_ratings=30)
+        self.assertRating(operator, 4.75, 40)
+        self.assertEqual(operator.total_buses, 2)
+
+        bus.available_seats = 10
+        # Savepoint, lookup, save, release: an unchanged rating costs no UPDATE
+        with self.assertNumQueries(4):
+            bus.save()
+        bus.operator = other
+        bus.save()
+        self.assertRating(operator, 4.0, 10)
+        self.assertEqual((operator.total_buses, BusOperator.objects.get(pk=other.pk).total_buses), (1, 1))
+
+    def test_reconcile_rebuilds_from_sources(self):
+        cabin = make_property(self.host)
+        self.review(cabin, 4.0, 'a')
+        PropertyReview.objects.bulk_create([
+            PropertyReview(property=cabin, user=make_host(f'bulk{n}'), rating=1.0, comment='',
+                           cleanliness_rating=1, location_rating=1, value_rating=1, amenities_rating=1)
+            for n in range(3)
+        ])
+        empty = make_property(self.host, name='Empty')
+        Property.objects.filter(pk=empty.pk).update(rating=4.9, rating_sum=49, total_ratings=10)
+        operator = make_operator()
+        make_bus(operator, rating=3.0, total_ratings=4)
+        BusOperator.objects.update(total_buses=0, rating=0)
+
+        with self.assertNumQueries(2 * len(rating_sources())):
+            reconcile_ratings()
+        self.assertRating(cabin, 1.75, 4)
+        self.assertRating(empty, 0.0, 0)
+        self.assertRating(operator, 3.0, 4)
+        self.assertEqual(operator.total_buses, 1)
+        self.assertEqual(Property.objects.with_listing_data().get(pk=cabin.pk).rating_count, 4)
+
+    def test_rating_order_uses_an_index(self):
+        for model in (Property, Homestay, BusOperator):
+            plan = model.objects.order_by('-rating')[:10].explain()
+            self.assertIn('INDEX', plan.upper(), model.__name__)
+
+
+def ai_log_fields(seconds, **kwargs):
+    return {'session_id': 's1', 'query': 'q', 'response': 'r', 'processing_time': seconds, **kwargs}
+
+
+class AILogBufferTests(TestCase):
+    def test_flush_writes_in_batches(self):
+        buffer = AILogBuffer(batch_size=10, autostart=False)
+        logged_at = timezone.now() - timedelta(minutes=5)
+        for n in range(25):
+            self.assertTrue(buffer.log(**ai_log_fields(0.1, created_at=logged_at)))
+        self.assertEqual(AILog.objects.count(), 0)
+        buffer.flush()
+        self.assertEqual(AILog.objects.filter(created_at=logged_at).count(), 25)
+        self.assertEqual(AILatencyRollup.objects.get().count, 25)
+        self.assertEqual(buffer.stats(), {
+            'queued': 25, 'written': 25, 'dropped': 0, 'failed': 0, 'batches': 3, 'pending': 0,
+        })
+
+    def test_full_queue_drops_and_counts(self):
+        buffer = AILogBuffer(max_size=3, put_timeout=0, autostart=False)
+        results = [buffer.log(**ai_log_fields(0.1)) for _ in range(5)]
+        self.assertEqual(results, [True, True, True, False, False])
+        self.assertEqual(buffer.stats()['dropped'], 2)
+
+    def test_percentiles_from_rollups(self):
+        buffer = AILogBuffer(batch_size=300, autostart=False)
+        now = timezone.now()
+        for n in range(1, 1001):
+            buffer.log(**ai_log_fields(n / 1000))
+        buffer.log(**ai_log_fields(60.0, created_at=now - timedelta(hours=30)))
+        buffer.flush()
+        with self.assertNumQueries(1):
+            report = latency_report(24, now=now)
+        self.assertEqual(report['count'], 1000)
+        self.assertAlmostEqual(report['p50'], 0.5, delta=0.01)
+        self.assertAlmostEqual(report['p99'], 0.99, delta=0.02)
+        self.assertAlmostEqual(report['max'], 1.0)
+        self.assertEqual(latency_report(48, now=now)['max'], 60.0)
+        out = StringIO()
+        call_command('ai_latency_report', stdout=out)
+        self.assertIn('1000 interactions', out.getvalue())
+
+    def test_latency_endpoint_is_staff_only(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/ai/latency/').status_code, 401)
+        client.force_authenticate(get_user_model().objects.create(username='admin', is_staff=True))
+        response = client.get('/api/ai/latency/', {'hours': 1})
+        self.assertEqual(response.json()['latency']['count'], 0)
+        self.assertIn('dropped', response.json()['buffer'])
+
+
+class AILogWriterThreadTests(TransactionTestCase):
+    def test_background_writer_and_close(self):
+        buffer = AILogBuffer(batch_size=20, flush_interval=0.05)
+        for _ in range(50):
+            buffer.log(**ai_log_fields(0.2))
+        deadline = time_module.monotonic() + 5
+        # Poll the counters: reads of the in-memory test database would lock the writer out
+        while buffer.stats()['written'] < 50 and time_module.monotonic() < deadline:
+            time_module.sleep(0.02)
+        buffer.close()
+        self.assertEqual(AILog.objects.count(), 50)
+        buffer.log(**ai_log_fields(0.2))  # Queued after close: no new writer
+        self.assertFalse(buffer._thread.is_alive())
+        buffer.close()
+        self.assertEqual(AILog.objects.count(), 51)
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        archive_root = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_root.cleanup)
+        self.settings_override = override_settings(ARCHIVE_ROOT=archive_root.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.policy = RETENTION_POLICIES['ailog']
+        self.now = timezone.now()
+
+    def log_on(self, days_ago, count, seconds=0.5):
+        created_at = self.now - timedelta(days=days_ago)
+        AILog.objects.bulk_create([
+            AILog(session_id='s', query='q', response='r', context={'turn': n},
+                  processing_time=seconds, created_at=created_at, feedback=n % 2)
+            for n in range(count)
+        ])
+
+    def archived_lines(self, days_ago):
+        path = self.policy.archive_path(timezone.localdate(self.now - timedelta(days=days_ago)))
+        with gzip.open(path, 'rt') as f:
+            return [json.loads(line) for line in f]
+
+    def test_archives_old_days_in_chunks(self):
+        self.log_on(100, 5)
+        self.log_on(95, 2, seconds=2.0)
+        self.log_on(10, 3)
+        result = self.policy.archive(days=90, chunk_size=2, now=self.now)
+        self.assertEqual(result, {'rows': 7, 'days': 2, 'chunks': 4})
+        self.assertEqual(AILog.objects.count(), 3)
+        self.assertEqual(len(self.archived_lines(100)), 5)
+        summary = RetentionSummary.objects.get(day=timezone.localdate(self.now - timedelta(days=95)))
+        self.assertEqual(summary.row_count, 2)
+        self.assertEqual(summary.data, {
+            'processing_time_total': 4.0, 'processing_time_max': 2.0, 'feedback_count': 2, 'feedback_total': 1,
+        })
+        self.assertEqual(self.policy.archive(days=90, now=self.now)['rows'], 0)
+
+    def test_resumes_without_losing_or_duplicating_rows(self):
+        self.log_on(100, 6)
+        self.policy.archive(days=90, chunk_size=2, max_chunks=1, now=self.now)
+        # A write the interrupted run never committed, then a crash before a DELETE
+        path = self.policy.archive_path(RetentionCursor.objects.get().day)
+        with open(path, 'ab') as f:
+            f.write(gzip.compress(b'{"partial": true}\n'))
+        with mock.patch.object(type(self.policy), 'delete_rows', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.policy.archive(days=90, chunk_size=2, now=self.now)
+        self.assertEqual(AILog.objects.count(), 4)
+
+        self.policy.archive(days=90, chunk_size=2, now=self.now)
+        lines = self.archived_lines(100)
+        self.assertEqual([line['fields']['context']['turn'] for line in lines], list(range(6)))
+        self.assertEqual(RetentionSummary.objects.get().row_count, 6)
+        self.assertEqual(AILog.objects.count(), 0)
+
+        call_command('loaddata', str(path), verbosity=0)
+        self.assertEqual(AILog.objects.count(), 6)
+
+    def test_transaction_summaries_keep_exact_amounts(self):
+        homestay = make_homestay(make_host())
+        booking = Booking.objects.create(
+            user=homestay.host, homestay=homestay, check_in=date(2020, 1, 1), check_out=date(2020, 1, 2),
+            guests=1, total_price=Decimal('100.10'),
+        )
+        payment = Payment.objects.create(
+            booking=booking, amount=Decimal('100.10'), payment_method='card', status='completed'
+        )
+        for amount in ('0.10', '0.20', '100.10'):
+            Transaction.objects.create(
+                payment=payment, transaction_type='payment', amount=Decimal(amount),
+                currency='INR', provider_transaction_id='t', metadata={'raw': 'x' * 100},
+            )
+        Transaction.objects.update(created_at=self.now - timedelta(days=800))
+        out = StringIO()
+        call_command('archive_old_rows', 'transaction', '--chunk-size', '2', stdout=out)
+        self.assertIn('archived 3 row(s)', out.getvalue())
+        summary = RetentionSummary.objects.get(policy='transaction')
+        self.assertEqual(summary.data, {'payment_INR_count': 3, 'payment_INR_amount': '100.40'})
+        self.assertFalse(Transaction.objects.exists())
+
+
+class AvailabilityCalendarTests(TestCase):
+    def setUp(self):
+        self.prop = make_property(make_host())
+        self.start = date(2030, 1, 1)
+        PropertyAvailability.objects.bulk_create([
+            PropertyAvailability(
+                property=self.prop, date=self.start + timedelta(days=n),
+                is_available=not 10 <= n < 12, base_price=Decimal('3000.00' if n >= 300 else '2500.00'),
+            )
+            for n in range(400) if n != 20
+        ])
+        self.url = f'/api/properties/{self.prop.pk}/calendar/'
+
+    def get_calendar(self, **headers):
+        return self.client.get(self.url, {'start': '2030-01-01', 'end': '2031-02-05'}, **headers)
+
+    def test_spans_break_on_changes_and_gaps(self):
+        rows = [
+            (date(2030, 1, 1), True, Decimal('1'), 1),
+            (date(2030, 1, 2), True, Decimal('1'), 1),
+            (date(2030, 1, 4), True, Decimal('1'), 1),
+            (date(2030, 1, 5), True, Decimal('2'), 1),
+        ]
+        self.assertEqual(
+            [(span['start'].day, span['nights']) for span in calendar_spans(rows)], [(1, 2), (4, 1), (5, 1)]
+        )
+
+    def test_streams_run_length_encoded_calendar(self):
+        with self.assertNumQueries(3):  # Property check, ETag aggregate, rows
+            response = self.get_calendar()
+            self.assertTrue(response.streaming)
+            data = json.loads(b''.join(response.streaming_content))
+        spans = [(span['start'], span['nights'], span['available'], span['price']) for span in data['spans']]
+        self.assertEqual(spans, [
+            ('2030-01-01', 10, True, '2500.00'),
+            ('2030-01-11', 2, False, '2500.00'),
+            ('2030-01-13', 8, True, '2500.00'),
+            ('2030-01-22', 279, True, '2500.00'),
+            ('2030-10-28', 100, True, '3000.00'),
+        ])
+
+    def test_etag_changes_with_the_calendar(self):
+        etag = self.get_calendar()['ETag']
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get_calendar(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.get_calendar(HTTP_IF_NONE_MATCH=f'W/{etag}').status_code, 304)
+
+        row = PropertyAvailability.objects.get(property=self.prop, date=self.start)
+        row.base_price = Decimal('2600.00')
+        row.save()
+        changed = self.get_calendar(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        PropertyAvailability.objects.filter(property=self.prop, date=self.start + timedelta(days=5)).delete()
+        self.assertEqual(self.get_calendar(HTTP_IF_NONE_MATCH=changed['ETag']).status_code, 200)
+
+    def test_range_is_validated(self):
+        self.assertEqual(self.client.get(self.url, {'start': '2030-02-01', 'end': '2030-01-01'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'start': '2030-01-01', 'end': '2033-01-01'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/properties/999999/calendar/').status_code, 404)
+        legacy = self.client.get(
+            f'/api/properties/{self.prop.pk}/availability/', {'start': '2030-01-01', 'end': '2030-01-08'}
+        )
+        self.assertEqual(len(legacy.json()), 7)
+
+
+class CalendarUpsertTests(TestCase):
+    def setUp(self):
+        self.host = make_host()
+        self.prop = make_property(self.host)
+        self.url = f'/api/properties/{self.prop.pk}/calendar/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.host)
+
+    def post(self, *ranges, client=None):
+        return (client or self.client).post(self.url, {'ranges': [
+            {'start': start, 'end': end, 'available': available, 'price': price}
+            for start, end, available, price in ranges
+        ]}, format='json')
+
+    def test_year_sync_is_one_request_and_reports_a_diff(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post(('2030-01-01', '2031-01-01', True, '2500.00'))
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(ctx.captured_queries), 8)
+        self.assertEqual(response.json(), {
+            'created': [{'start': '2030-01-01', 'nights': 365, 'available': True, 'price': '2500.00', 'minimum_stay': 1}],
+            'updated': [],
+            'unchanged': 0,
+        })
+        self.assertEqual(PropertyAvailability.objects.filter(property=self.prop).count(), 365)
+
+        response = self.post(
+            ('2030-01-01', '2031-01-01', True, '2500.00'),
+            ('2030-03-01', '2030-03-04', False, '2500.00'),  # Later ranges win
+        )
+        self.assertEqual(response.json()['updated'], [
+            {'start': '2030-03-01', 'nights': 3, 'available': False, 'price': '2500.00', 'minimum_stay': 1},
+        ])
+        self.assertEqual(response.json()['unchanged'], 362)
+        self.assertFalse(PropertyAvailability.objects.get(property=self.prop, date=date(2030, 3, 2)).is_available)
+
+    def test_upsert_changes_the_calendar_etag(self):
+        self.post(('2030-01-01', '2030-02-01', True, '2500.00'))
+        params = {'start': '2030-01-01', 'end': '2030-02-01'}
+        etag = self.client.get(self.url, params)['ETag']
+        self.post(('2030-01-10', '2030-01-12', True, '2800.00'))
+        self.assertEqual(self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_only_hosts_and_staff_may_write(self):
+        ranges = ('2030-01-01', '2030-01-05', True, '2500.00')
+        self.assertEqual(self.post(ranges, client=APIClient()).status_code, 401)
+        other = APIClient()
+        other.force_authenticate(make_host('other'))
+        self.assertEqual(self.post(ranges, client=other).status_code, 403)
+        staff = APIClient()
+        staff.force_authenticate(get_user_model().objects.create(username='staff', is_staff=True))
+        self.assertEqual(self.post(ranges, client=staff).status_code, 200)
+
+    def test_invalid_ranges(self):
+        self.assertEqual(self.post(('2030-01-05', '2030-01-01', True, '2500.00')).status_code, 400)
+        self.assertEqual(self.post(('2030-01-01', '2033-01-01', True, '2500.00')).status_code, 400)
+        self.assertEqual(self.client.post(self.url, {'ranges': []}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(self.url, [], format='json').status_code, 400)
+
+
+class ReviewSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.prop = make_property(make_host())
+        self.url = f'/api/properties/{self.prop.pk}/reviews/'
+
+    def review(self, username, rating, cleanliness=4, prop=None):
+        return PropertyReview.objects.create(
+            property=prop or self.prop, user=make_host(username), rating=rating, comment='',
+            cleanliness_rating=cleanliness, location_rating=5, value_rating=3, amenities_rating=4,
+        )
+
+    def test_pages_and_summary(self):
+        for i in range(12):
+            self.review(f'guest{i}', 5.0 if i % 3 else 2.5, cleanliness=1 + i % 5)
+        self.review('elsewhere', 1.0, prop=make_property(make_host('host2'), name='Other'))
+        data = self.client.get(self.url, {'page_size': 5}).data
+        self.assertEqual(data['count'], 12)
+        self.assertEqual(len(data['results']), 5)
+        self.assertEqual(data['results'][0]['user_name'], 'guest11')
+        self.assertIsNotNone(data['next'])
+        summary = data['summary']
+        self.assertEqual(summary['count'], 12)
+        self.assertEqual(summary['rating']['average'], 4.17)
+        # 2.5 rounds half up into the 3-star bucket
+        self.assertEqual(summary['rating']['histogram'], {'1': 0, '2': 0, '3': 4, '4': 0, '5': 8})
+        self.assertEqual(summary['cleanliness_rating']['histogram'], {'1': 3, '2': 3, '3': 2, '4': 2, '5': 2})
+        self.assertEqual(summary['location_rating']['average'], 5.0)
+        self.assertEqual(summary['value_rating']['histogram']['3'], 12)
+
+    def test_summary_cached_until_next_review_write(self):
+        review = self.review('guest', 4.0)
+        self.client.get(self.url)
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get(self.url).data['summary']['rating']['average'], 4.0)
+        review.rating = 2.0
+        review.save()
+        self.assertEqual(self.client.get(self.url).data['summary']['rating']['average'], 2.0)
+        review.delete()
+        summary = self.client.get(self.url).data['summary']
+        self.assertEqual(summary['count'], 0)
+        self.assertIsNone(summary['rating']['average'])
+        self.assertEqual(summary['rating']['histogram']['2'], 0)
+
+
+class TrainClassSearchTests(TestCase):
+    def setUp(self):
+        caches['transport_search'].clear()
+        self.client = APIClient()
+        self.weekdays = make_train('12001', running_days='Mon,Wed,Fri')
+        self.weekends = make_train('12002', running_days='Sat, Sun')
+        for train, seats in ((self.weekdays, 0), (self.weekends, 30)):
+            self.add_class(train, '3A', seats, '1200.00')
+            self.add_class(train, 'SL', 80, '450.00')
+
+    def add_class(self, train, class_type, seats, price):
+        return TrainClass.objects.create(
+            train=train, class_type=class_type, price=Decimal(price), available_seats=seats,
+            total_seats=max(seats, 64), tatkal_charge=Decimal('150.00'),
+        )
+
+    def numbers(self, **params):
+        response = self.client.get('/api/trains/', params)
+        self.assertEqual(response.status_code, 200)
+        return [row['number'] for row in response.data['results']]
+
+    def test_running_days_mask(self):
+        self.assertEqual(running_days_mask('Mon,Wed,Fri'), 0b0010101)
+        self.assertEqual(running_days_mask('saturday sunday'), 0b1100000)
+        self.assertEqual(running_days_mask('Daily'), 0b1111111)
+        self.assertEqual(self.weekends.running_days_mask, 0b1100000)
+        self.weekends.running_days = 'Tue'
+        self.weekends.save(update_fields=['running_days'])
+        self.weekends.refresh_from_db()
+        self.assertEqual(self.weekends.running_days_mask, 0b0000010)
+
+    def test_filters_by_running_day(self):
+        self.assertEqual(self.numbers(date='2030-01-02'), ['12001'])  # a Wednesday
+        self.assertEqual(self.numbers(date='2030-01-05'), ['12002'])  # a Saturday
+        self.assertEqual(self.numbers(date='2030-01-01'), [])
+        self.assertEqual(self.client.get('/api/trains/', {'date': 'soon'}).status_code, 400)
+
+    def test_backfills_running_days_of_raw_and_bulk_writes(self):
+        Train.objects.update(running_days_mask=0)
+        self.assertEqual(self.numbers(date='2030-01-02'), [])
+        out = StringIO()
+        call_command('backfill_search_keys', stdout=out)
+        self.assertIn('Train running days: 2 row(s) backfilled', out.getvalue())
+        self.assertEqual(self.numbers(date='2030-01-02'), ['12001'])
+
+        train = Train.objects.get(number='12002')
+        train.pk, train.number, train.running_days_mask = None, '12003', 0
+        train.save_base(raw=True)
+        self.assertEqual(Train.objects.get(number='12003').running_days_mask, 0b1100000)
+
+    def test_classes_inline(self):
+        row = self.client.get('/api/trains/', {'date': '2030-01-02'}).data['results'][0]
+        self.assertEqual([c['class_type'] for c in row['class_details']], ['SL', '3A'])
+        self.assertEqual(row['class_details'][1]['available_seats'], 0)
+        self.assertEqual(row['class_details'][1]['tatkal_charge'], '150.00')
+
+    def test_filters_by_class_and_seats(self):
+        self.assertEqual(self.numbers(class_type='3A', min_seats=1), ['12002'])
+        self.assertEqual(self.numbers(min_seats=50), ['12001', '12002'])
+        row = self.client.get('/api/trains/', {'class_type': '3A'}).data['results'][0]
+        self.assertEqual([c['class_type'] for c in row['class_details']], ['3A'])
+        self.assertEqual(self.client.get('/api/trains/', {'min_seats': 'many'}).status_code, 400)
+
+
+class JourneyPlannerTests(TestCase):
+    def setUp(self):
+        journey_graph.clear()
+        self.client = APIClient()
+        self.train = make_train(from_station='New Delhi', to_station='Bhopal', base_fare=Decimal('900.00'))
+        self.operator = make_operator()
+        self.tight = self.bus('14:10', '18:10', '300.00')
+        self.evening = self.bus('15:00', '19:30', '400.00')
+        self.late = self.bus('17:00', '21:00', '250.00')
+        self.direct = self.bus('05:00', '23:00', '1500.00', from_city='New Delhi')
+
+    def bus(self, departs, arrives, fare, from_city='Bhopal', to_city='Pachmarhi'):
+        day = date(2030, 1, 2)
+        return make_bus(
+            self.operator, from_city=from_city, to_city=to_city, base_fare=Decimal(fare),
+            departure_time=timezone.make_aware(datetime.combine(day, time.fromisoformat(departs))),
+            arrival_time=timezone.make_aware(datetime.combine(day, time.fromisoformat(arrives))),
+        )
+
+    def plan(self, **params):
+        response = self.client.get('/api/journeys/', {'from': 'new delhi', 'to': 'Pachmarhi', 'date': '2030-01-02', **params})
+        self.assertEqual(response.status_code, 200)
+        return [
+            (tuple(leg['id'] for leg in itinerary['legs']), itinerary['fare'])
+            for itinerary in response.data['itineraries']
+        ]
+
+    def test_best_by_arrival_with_connection_time(self):
+        self.assertEqual(self.plan(), [
+            ((self.train.pk, self.evening.pk), '1300.00'),
+            ((self.train.pk, self.late.pk), '1150.00'),
+            ((self.direct.pk,), '1500.00'),
+        ])
+        self.assertEqual(self.plan(min_connection=5, k=1), [((self.train.pk, self.tight.pk), '1200.00')])
+
+    def test_best_by_fare(self):
+        self.assertEqual(self.plan(sort='fare', k=2), [
+            ((self.train.pk, self.late.pk), '1150.00'),
+            ((self.train.pk, self.evening.pk), '1300.00'),
+        ])
+        self.assertEqual(self.plan(max_legs=1), [((self.direct.pk,), '1500.00')])
+
+    def test_train_runs_only_on_its_days(self):
+        self.train.running_days = 'Sat,Sun'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.train.save()
+        self.assertEqual(self.plan(), [((self.direct.pk,), '1500.00')])
+
+    def test_graph_updated_incrementally(self):
+        self.plan()
+        with self.captureOnCommitCallbacks(execute=True):
+            faster = self.bus('14:45', '17:00', '500.00')
+            self.evening.delete()
+        with mock.patch.object(journey_graph, 'read_legs') as read_legs:
+            self.assertEqual(self.plan(k=2), [
+                ((self.train.pk, faster.pk), '1400.00'),
+                ((self.train.pk, self.late.pk), '1150.00'),
+            ])
+        read_legs.assert_not_called()
+        self.assertEqual(journey_graph.stats()['legs'], 5)
+
+    def test_updates_replace_the_lists_a_search_may_hold(self):
+        self.plan()
+        timetable = journey_graph._timetable
+        held = timetable.departures[('bus', 'bhopal')]
+        snapshot = (list(held[0]), list(held[1]))
+        with self.captureOnCommitCallbacks(execute=True):
+            faster = self.bus('14:45', '17:00', '500.00')
+            self.evening.delete()
+        self.assertIs(journey_graph._timetable, timetable)
+        self.assertEqual((list(held[0]), list(held[1])), snapshot)
+        self.assertEqual(
+            [leg.pk for leg in timetable.departures[('bus', 'bhopal')][1]], [self.tight.pk, faster.pk, self.late.pk]
+        )
+
+    def test_response_and_validation(self):
+        leg = self.client.get('/api/journeys/', {'from': 'New Delhi', 'to': 'Bhopal', 'date': '2030-01-02'}).data['itineraries'][0]['legs'][0]
+        self.assertEqual((leg['mode'], leg['number'], leg['from'], leg['to']), ('train', '12001', 'New Delhi', 'Bhopal'))
+        self.assertEqual(leg['departure'], timezone.make_aware(datetime(2030, 1, 2, 6, 0)))
+        self.assertEqual(self.client.get('/api/journeys/', {'from': 'New Delhi'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/journeys/', {'from': 'a', 'to': 'b', 'sort': 'speed'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/journeys/', {'from': 'a', 'to': 'b', 'date': 'soon'}).status_code, 400)
+
+
+class ReconciliationTests(TestCase):
+    def setUp(self):
+        self.homestay = make_homestay(make_host())
+
+    def payment(self, transaction_id, amount, status):
+        booking = Booking.objects.create(
+            user=self.homestay.host, homestay=self.homestay, check_in=date(2030, 1, 1),
+            check_out=date(2030, 1, 2), guests=1, total_price=Decimal(amount),
+        )
+        return Payment.objects.create(
+            booking=booking, amount=Decimal(amount), currency='INR', payment_method='card',
+            status=status, transaction_id=transaction_id,
+        )
+
+    def export(self, *lines):
+        return StringIO('entity_id,type,amount,currency,settlement_id\n' + ''.join(f'{line}\n' for line in lines))
+
+    def test_reconciles_and_reports(self):
+        pending = self.payment('pay_1', '500.00', 'pending')
+        refunded = self.payment('pay_2', '800.00', 'completed')
+        refund = Transaction.objects.create(
+            payment=refunded, transaction_type='refund', amount=Decimal('200.00'),
+            currency='INR', provider_transaction_id='rfnd_2',
+        )
+        self.payment('pay_3', '300.00', 'failed')
+        self.payment('pay_4', '100.00', 'refunded')
+        export = self.export(
+            'pay_1,payment,500.00,INR,setl_1', 'rfnd_2,refund,200,INR,setl_1', 'pay_3,payment,250.00,INR,setl_1',
+            'pay_x,payment,10.00,INR,setl_1', 'pay_1,payment,500.00,INR,setl_1', 'adj_1,adjustment,5.00,INR,setl_1',
+            'pay_5,payment,abc,INR,setl_1', 'pay_4,payment,100.00,INR,setl_1', 'pay_2,payment,800.00,USD,setl_1',
+        )
+        run = reconcile_settlements(export, source='test.csv', chunk_size=4)
+        self.assertEqual(
+            (run.lines, run.matched, run.updated, run.skipped, run.mismatched), (9, 2, 1, 1, 6)
+        )
+        self.assertEqual(
+            sorted(run.mismatches.values_list('line', 'entity_id', 'kind', 'ours', 'theirs')),
+            [
+                (4, 'pay_3', 'amount', '300.00', '250.00'), (5, 'pay_x', 'missing', '', 'payment'),
+                (6, 'pay_1', 'duplicate', '', ''), (8, 'pay_5', 'invalid', '', ''),
+                (9, 'pay_4', 'status', 'refunded', 'payment'), (10, 'pay_2', 'currency', 'INR', 'USD'),
+            ],
+        )
+        # 200 of 800 refunded: the payment stays completed
+        statuses = dict(Payment.objects.values_list('transaction_id', 'status'))
+        self.assertEqual(statuses, {'pay_1': 'completed', 'pay_2': 'completed', 'pay_3': 'failed', 'pay_4': 'refunded'})
+        refund.refresh_from_db()
+        self.assertEqual(refund.settlement_id, 'setl_1')
+
+        export.seek(0)
+        again = reconcile_settlements(export, chunk_size=4)
+        self.assertEqual((again.matched, again.updated, again.mismatched), (2, 0, 6))
+        self.assertEqual(ReconciliationRun.objects.count(), 2)
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, 'completed')
+
+    def test_refunds_settle_a_payment_once_they_cover_it(self):
+        payment = self.payment('pay_1', '800.00', 'completed')
+        for n, amount in enumerate(['200.00', '600.00'], 1):
+            Transaction.objects.create(
+                payment=payment, transaction_type='refund', amount=Decimal(amount),
+                currency='INR', provider_transaction_id=f'rfnd_{n}',
+            )
+        run = reconcile_settlements(self.export('rfnd_1,refund,200.00,INR,setl_1'))
+        payment.refresh_from_db()
+        self.assertEqual((run.matched, run.updated, payment.status), (1, 0, 'completed'))
+
+        run = reconcile_settlements(self.export('rfnd_2,refund,600.00,INR,setl_2'))
+        payment.refresh_from_db()
+        self.assertEqual((run.matched, run.updated, payment.status), (1, 1, 'refunded'))
+
+    def test_queries_per_chunk_not_per_line(self):
+        for n in range(40):
+            self.payment(f'pay_{n}', '100.00', 'pending')
+
+        def count(lines):
+            with CaptureQueriesContext(connection) as queries:
+                reconcile_settlements(self.export(*lines), chunk_size=100)
+            return len(queries)
+
+        few = count([f'pay_{n},payment,100.00,INR,' for n in range(5)])
+        self.assertEqual(count([f'pay_{n},payment,100.00,INR,' for n in range(5, 40)]), few)
+        self.assertEqual(Payment.objects.filter(status='completed').count(), 40)
+
+    def test_jsonl_in_subunits_and_command(self):
+        self.payment('pay_1', '499.99', 'pending')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'settlements.jsonl')
+            with open(path, 'w') as f:
+                f.write('{"entity_id": "pay_1", "type": "payment", "amount": 49999, "currency": "inr"}\n')
+                f.write('not json\n')
+            out = StringIO()
+            call_command('reconcile_settlements', path, '--subunits', stdout=out)
+        self.assertIn('2 line(s), 1 matched, 1 payment(s) updated, 0 skipped, 1 mismatched', out.getvalue())
+        self.assertIn('line 2: invalid', out.getvalue())
+        self.assertEqual(Payment.objects.get().status, 'completed')
+
+
+WEBHOOK_SECRET = 'whsec_test'
+
+
+def webhook_body(event, payment_id='pay_1', amount=150000, notes=None, refund=None, **payment):
+    payload = {'payment': {'entity': {
+        'id': payment_id, 'amount': amount, 'currency': 'INR', 'method': 'upi', 'notes': notes or {}, **payment,
+    }}}
+    if refund:
+        payload['refund'] = {'entity': {'payment_id': payment_id, 'currency': 'INR', **refund}}
+    return json.dumps({'event': event, 'payload': payload}).encode()
+
+
+def post_webhook(client, body, event_id, secret=WEBHOOK_SECRET):
+    signature = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return client.post(
+        '/api/webhooks/razorpay/', body, content_type='application/json',
+        HTTP_X_RAZORPAY_SIGNATURE=signature, HTTP_X_RAZORPAY_EVENT_ID=event_id,
+    )
+
+
+@override_settings(RAZORPAY_WEBHOOK_SECRET=WEBHOOK_SECRET, WEBHOOK_PARTITIONS=4)
+class WebhookInboxTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.guest = make_host('guest')
+
+    def drain(self, now=None):
+        return process_batch(range(4), now=now)
+
+    def homestay_booking(self):
+        return Booking.objects.create(
+            user=self.guest, homestay=make_homestay(make_host()), check_in=date(2030, 1, 1),
+            check_out=date(2030, 1, 3), guests=2, total_price=Decimal('1500.00'),
+        )
+
+    def test_verifies_acknowledges_and_dedupes(self):
+        body = webhook_body('payment.failed')
+        self.assertEqual(post_webhook(self.client, body, 'evt_1', secret='wrong').status_code, 400)
+        self.assertEqual(post_webhook(self.client, body, 'evt_1').data, {'status': 'received'})
+        self.assertEqual(post_webhook(self.client, body, 'evt_1').status_code, 200)
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.event_id, event.status, event.ordering_key), ('evt_1', 'pending', 'payment:pay_1'))
+        self.assertEqual(event.body, body.decode())
+        with override_settings(RAZORPAY_WEBHOOK_SECRET=None):
+            self.assertEqual(post_webhook(self.client, body, 'evt_2').status_code, 503)
+
+    def test_homestay_payment_and_refund(self):
+        booking = self.homestay_booking()
+        notes = {'booking_type': 'homestay', 'booking_id': booking.pk}
+        post_webhook(self.client, webhook_body('payment.captured', notes=notes), 'evt_1')
+        self.assertEqual(self.drain(), 1)
+        payment = Payment.objects.get(transaction_id='pay_1')
+        self.assertEqual((payment.status, payment.amount, payment.booking_id), ('completed', Decimal('1500.00'), booking.pk))
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'confirmed')
+
+        # A partial refund is recorded; the full one cancels the booking
+        post_webhook(self.client, webhook_body(
+            'refund.processed', notes=notes, amount_refunded=50000, refund={'id': 'rfnd_1', 'amount': 50000}
+        ), 'evt_2')
+        post_webhook(self.client, webhook_body(
+            'refund.processed', notes=notes, amount_refunded=150000, refund={'id': 'rfnd_2', 'amount': 100000}
+        ), 'evt_3')
+        self.assertEqual(self.drain(), 2)
+        payment.refresh_from_db()
+        booking.refresh_from_db()
+        self.assertEqual((payment.status, booking.status), ('refunded', 'cancelled'))
+        self.assertEqual(
+            sorted(payment.transactions.values_list('transaction_type', 'provider_transaction_id')),
+            [('payment', 'pay_1'), ('refund', 'rfnd_1'), ('refund', 'rfnd_2')],
+        )
+        self.assertEqual(set(WebhookEvent.objects.values_list('status', flat=True)), {'done'})
+
+    def test_property_and_bus_bookings(self):
+        prop = make_property(make_host('host2'))
+        property_booking = PropertyBooking.objects.create(
+            property=prop, user=self.guest, guests=2, total_price=Decimal('5000.00'),
+            check_in=date(2030, 1, 1), check_out=date(2030, 1, 3), cancellation_policy='Flexible',
+        )
+        bus = create_load_test_bus(4)
+        bus_booking = reserve_seats(bus, ['1', '2'], self.guest)
+        post_webhook(self.client, webhook_body(
+            'payment.captured', 'pay_p', notes={'booking_type': 'property', 'booking_id': property_booking.pk}
+        ), 'evt_p')
+        post_webhook(self.client, webhook_body(
+            'payment.captured', 'pay_b', notes={'booking_type': 'bus', 'booking_id': bus_booking.pk}
+        ), 'evt_b')
+        self.assertEqual(self.drain(), 2)
+        property_booking.refresh_from_db()
+        bus_booking.refresh_from_db()
+        self.assertEqual((property_booking.status, bus_booking.status), ('confirmed', 'confirmed'))
+        self.assertEqual(sorted(bus.seats.values_list('status', flat=True)), ['available', 'available', 'booked', 'booked'])
+
+        post_webhook(self.client, webhook_body(
+            'refund.processed', 'pay_b', notes={'booking_type': 'bus', 'booking_id': bus_booking.pk},
+            amount_refunded=150000, refund={'id': 'rfnd_b', 'amount': 150000},
+        ), 'evt_r')
+        self.drain()
+        bus.refresh_from_db()
+        bus_booking.refresh_from_db()
+        self.assertEqual((bus_booking.status, bus.available_seats), ('cancelled', 4))
+        self.assertEqual(set(bus.seats.values_list('status', flat=True)), {'available'})
+
+    def test_retries_with_backoff_in_order_per_booking(self):
+        booking = self.homestay_booking()
+        notes = {'booking_type': 'homestay', 'booking_id': booking.pk}
+        post_webhook(self.client, webhook_body('payment.captured', notes=notes), 'evt_1')
+        post_webhook(self.client, webhook_body(
+            'refund.processed', notes=notes, amount_refunded=150000, refund={'id': 'rfnd_1', 'amount': 150000}
+        ), 'evt_2')
+        post_webhook(self.client, webhook_body('payment.failed', 'pay_other'), 'evt_3')
+
+        broken = mock.Mock(side_effect=OperationalError('database is locked'))
+        with mock.patch.dict(WEBHOOK_HANDLERS, {'payment.captured': broken}):
+            self.assertEqual(self.drain(), 2)  # evt_2 waits behind evt_1
+        first = WebhookEvent.objects.get(event_id='evt_1')
+        self.assertEqual((first.status, first.attempts), ('pending', 1))
+        self.assertIn('database is locked', first.last_error)
+        self.assertEqual(WebhookEvent.objects.get(event_id='evt_2').attempts, 0)
+        self.assertEqual(WebhookEvent.objects.get(event_id='evt_3').status, 'done')
+
+        # Nothing for the booking is due until the backoff has passed
+        self.assertEqual(self.drain(), 0)
+        self.assertEqual(self.drain(now=first.next_attempt_at), 2)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'cancelled')
+        self.assertEqual(Payment.objects.get().status, 'refunded')
+
+    def test_captured_payment_is_kept_when_the_booking_cannot_follow(self):
+        booking = self.homestay_booking()
+        Booking.objects.filter(pk=booking.pk).update(status='cancelled')
+        post_webhook(self.client, webhook_body(
+            'payment.captured', notes={'booking_type': 'homestay', 'booking_id': booking.pk}
+        ), 'evt_1')
+        bus = create_load_test_bus(4)
+        bus_booking = reserve_seats(bus, ['1'], self.guest)
+        BusBooking.objects.filter(pk=bus_booking.pk).update(hold_expires_at=timezone.now() - timedelta(seconds=1))
+        post_webhook(self.client, webhook_body(
+            'payment.captured', 'pay_b', notes={'booking_type': 'bus', 'booking_id': bus_booking.pk}
+        ), 'evt_b')
+        post_webhook(self.client, webhook_body('payment.captured', 'pay_x', notes={'booking_type': 'bus', 'booking_id': 999}), 'evt_x')
+        self.assertEqual(self.drain(), 3)
+
+        payment = Payment.objects.get(transaction_id='pay_1')
+        self.assertEqual(payment.status, 'completed')
+        self.assertEqual(list(payment.transactions.values_list('transaction_type', flat=True)), ['payment'])
+        events = dict(WebhookEvent.objects.values_list('event_id', 'last_error'))
+        self.assertEqual(set(WebhookEvent.objects.values_list('status', flat=True)), {'review'})
+        self.assertEqual(events['evt_1'], f'Payment pay_1 captured for cancelled homestay booking {booking.pk}')
+        self.assertEqual(events['evt_b'], 'Payment pay_b captured, but Seat hold has expired')
+        self.assertEqual(events['evt_x'], 'Payment pay_x captured, but No bus booking 999')
+        # The lapsed hold still gives its seat back
+        bus.refresh_from_db()
+        self.assertEqual((BusBooking.objects.get().status, bus.available_seats), ('cancelled', 4))
+
+    @override_settings(WEBHOOK_MAX_ATTEMPTS=2, WEBHOOK_RETRY_BASE_SECONDS=0)
+    def test_rejected_and_exhausted_events_fail(self):
+        post_webhook(self.client, webhook_body('refund.processed', refund={'amount': 100}), 'evt_1')
+        self.drain()
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.status, event.last_error), ('failed', 'No refund in payload'))
+
+        post_webhook(self.client, webhook_body('payment.failed', 'pay_2'), 'evt_2')
+        with mock.patch.dict(WEBHOOK_HANDLERS, {'payment.failed': mock.Mock(side_effect=KeyError('x'))}):
+            self.drain()
+            self.drain()
+        self.assertEqual(WebhookEvent.objects.get(event_id='evt_2').status, 'failed')
+
+
+@override_settings(RAZORPAY_WEBHOOK_SECRET=WEBHOOK_SECRET, WEBHOOK_PARTITIONS=8)
+class WebhookWorkerPoolTests(TransactionTestCase):
+    def test_workers_own_disjoint_partitions(self):
+        pool = WebhookWorkerPool(workers=3)
+        owned = [pool.partitions(n) for n in range(3)]
+        self.assertEqual(sorted(sum(owned, [])), list(range(8)))
+        self.assertEqual(WebhookWorkerPool(workers=20).workers, 8)
+
+    def test_pool_drains_the_inbox(self):
+        # One worker: threads sharing the in-memory test database lock its tables
+        guest = make_host('guest')
+        homestay = make_homestay(make_host())
+        client = APIClient()
+        bookings = []
+        for n in range(6):
+            booking = Booking.objects.create(
+                user=guest, homestay=homestay, check_in=date(2030, 1, 1), check_out=date(2030, 1, 2),
+                guests=1, total_price=Decimal('1500.00'),
+            )
+            bookings.append(booking.pk)
+            post_webhook(client, webhook_body(
+                'payment.captured', f'pay_{n}', notes={'booking_type': 'homestay', 'booking_id': booking.pk}
+            ), f'evt_{n}')
+        self.assertEqual(WebhookWorkerPool(workers=1).run(drain=True), 6)
+        self.assertEqual(set(Booking.objects.values_list('status', flat=True)), {'confirmed'})
+        self.assertEqual(set(WebhookEvent.objects.values_list('status', flat=True)), {'done'})
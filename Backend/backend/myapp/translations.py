@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import TranslationsCache, translation_key
+
+# Usage counts are written back once this many keys are pending, or this
+# many seconds after the last write
+USAGE_FLUSH_SIZE = 1000
+USAGE_FLUSH_SECONDS = 30
+
+
+def get_translator():
+    """The TRANSLATION_BACKEND callable, or None"""
+    return import_string(settings.TRANSLATION_BACKEND) if settings.TRANSLATION_BACKEND else None
+
+
+class TranslationStore:
+    """Two-tier translation cache: a process LRU in front of TranslationsCache.
+
+    Lookups take what they can from the LRU and fetch the rest from the
+    table in one query. Hits in either tier are counted in memory and
+    written back as batched F('use_count') updates, which is what
+    evict_translations ranks rows by. Translations never change once
+    stored, so LRU entries need no invalidation.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._lru = OrderedDict()
+        self._usage = Counter()
+        self._flushed_at = time.monotonic()
+
+    def _remember(self, key, text):
+        self._lru[key] = text
+        self._lru.move_to_end(key)
+        while len(self._lru) > settings.TRANSLATIONS_LRU_SIZE:
+            self._lru.popitem(last=False)
+
+    def translate_many(self, texts, source_language, target_language, translator=None):
+        """Translations of texts in order; None where none is cached or made.
+
+        ``translator(texts, source_language, target_language)`` is called
+        once with the texts found in neither tier, and its results stored.
+        """
+        if source_language == target_language:
+            return list(texts)
+        keys = [translation_key(text, source_language, target_language) for text in texts]
+        found = {}
+        with self._lock:
+            for key in set(keys):
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    found[key] = self._lru[key]
+
+        missing = set(keys) - found.keys()
+        if missing:
+            rows = TranslationsCache.objects.filter(key__in=missing).values_list('key', 'translated_text')
+            found.update(rows)
+        untranslated = {key: text for key, text in zip(keys, texts) if key not in found}
+
+        with self._lock:
+            self._usage.update(found.keys())
+            for key in missing.intersection(found):
+                self._remember(key, found[key])
+
+        if untranslated and translator is not None:
+            results = translator(list(untranslated.values()), source_language, target_language)
+            created = dict(zip(untranslated, results))
+            TranslationsCache.objects.bulk_create([
+                TranslationsCache(
+                    key=key, source_text=untranslated[key], translated_text=translated,
+                    source_language=source_language, target_language=target_language,
+                )
+                for key, translated in created.items()
+            ], ignore_conflicts=True)
+            found.update(created)
+            with self._lock:
+                for key, translated in created.items():
+                    self._remember(key, translated)
+
+        self.flush_usage(force=False)
+        return [found.get(key) for key in keys]
+
+    def translate(self, text, source_language, target_language, translator=None):
+        return self.translate_many([text], source_language, target_language, translator)[0]
+
+    def flush_usage(self, force=True):
+        """Write pending use counts: one UPDATE per distinct count"""
+        with self._lock:
+            due = len(self._usage) >= USAGE_FLUSH_SIZE or time.monotonic() - self._flushed_at >= USAGE_FLUSH_SECONDS
+            if not self._usage or not (force or due):
+                return
+            usage, self._usage = self._usage, Counter()
+            self._flushed_at = time.monotonic()
+        keys_by_count = defaultdict(list)
+        for key, count in usage.items():
+            keys_by_count[count].append(key)
+        now = timezone.now()
+        for count, keys in keys_by_count.items():
+            TranslationsCache.objects.filter(key__in=keys).update(
+                use_count=F('use_count') + count, last_used=now
+            )
+
+
+translation_store = TranslationStore()
+
+
+def evict_translations(max_rows, batch_size=1000):
+    """Trim TranslationsCache to max_rows, dropping the least recently used
+    rows first and, among those, the least used. Returns rows deleted."""
+    ordered = TranslationsCache.objects.order_by('-last_used', '-use_count', '-id')
+    boundary = list(ordered.values('last_used', 'use_count', 'id')[max_rows:max_rows + 1])
+    if not boundary:
+        return 0
+    last_used, use_count, pk = boundary[0]['last_used'], boundary[0]['use_count'], boundary[0]['id']
+    evicted = TranslationsCache.objects.filter(
+        Q(last_used__lt=last_used)
+        | Q(last_used=last_used, use_count__lt=use_count)
+        | Q(last_used=last_used, use_count=use_count, id__lte=pk)
+    )
+    deleted = 0
+    while True:
+        ids = list(evicted.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += TranslationsCache.objects.filter(id__in=ids).delete()[0]
+
+
+class TranslatedListingsMixin:
+    """``?lang=`` on list(): translates the page's ``translated_fields``
+    with one cache lookup per field, keeping the original where no
+    translation is available"""
+
+    translated_fields = ['description']
+    source_language = 'en'
+
+    def get_paginated_response(self, data):
+        language = self.request.query_params.get('lang')
+        if language and language != self.source_language:
+            translator = get_translator()
+            for field in self.translated_fields:
+                items = [item for item in data if item.get(field)]
+                translations = translation_store.translate_many(
+                    [item[field] for item in items], self.source_language, language, translator
+                )
+                for item, translated in zip(items, translations):
+                    if translated is not None:
+                        item[field] = translated
+        return super().get_paginated_response(data)
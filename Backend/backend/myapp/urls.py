@@ -1,18 +1,25 @@
-from django.urls import path, include
+from django.urls import path
 from rest_framework.routers import DefaultRouter
 from .views import (
     PropertyViewSet, 
     BusViewSet, 
     TrainViewSet, 
     HomestayViewSet, 
-    BusOperatorViewSet
+    BusOperatorViewSet,
+    search_cache_stats,
+    place_autocomplete,
+    ai_latency,
+    plan_journeys,
+    razorpay_webhook
 )
 from .oauth_views import (
     google_oauth,
     facebook_oauth,
     oauth_callback,
     traditional_login,
-    traditional_register
+    traditional_register,
+    refresh_access_token,
+    logout
 )
 
 router = DefaultRouter()
@@ -29,6 +36,14 @@ auth_urlpatterns = [
     path('auth/oauth/callback/', oauth_callback, name='oauth_callback'),
     path('auth/login/', traditional_login, name='traditional_login'),
     path('auth/register/', traditional_register, name='traditional_register'),
+    path('auth/refresh/', refresh_access_token, name='refresh_access_token'),
+    path('auth/logout/', logout, name='logout'),
 ]
 
-urlpatterns = router.urls + auth_urlpatterns
\ No newline at end of file
+urlpatterns = router.urls + auth_urlpatterns + [
+    path('search-cache/stats/', search_cache_stats, name='search_cache_stats'),
+    path('places/autocomplete/', place_autocomplete, name='place_autocomplete'),
+    path('ai/latency/', ai_latency, name='ai_latency'),
+    path('journeys/', plan_journeys, name='plan_journeys'),
+    path('webhooks/razorpay/', razorpay_webhook, name='razorpay_webhook'),
+]
@@ -1,25 +1,84 @@
+from datetime import date, datetime
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Prefetch
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from rest_framework import viewsets, filters, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Property, PropertyAvailability, PropertyReview, Bus, Train, Homestay, BusOperator
+from .models import Property, PropertyAvailability, PropertyReview, Bus, Train, TrainClass, Homestay, BusOperator, normalize_place
 from .serializers import *
+from .ai_logs import ai_log_buffer, latency_report
+from .availability import MAX_DAYS as MAX_CALENDAR_DAYS, calendar_response, parse_calendar_range, upsert_calendar
+from .authentication import IsAccountUser
+from .journeys import SORTS as JOURNEY_SORTS, journey_graph
+from .pagination import ListingPagination
+from .reviews import ReviewPagination, review_summary
+from .search_cache import CachedSearchMixin, bus_search_cache, train_search_cache
+from .search_index import FullTextSearchFilter
+from .stays import StayUnavailable, book_homestay, book_property
+from .translations import TranslatedListingsMixin
+from .webhooks import InvalidSignature, receive_webhook
+from .reservations import (
+    ReservationError, SeatUnavailable, confirm_booking, release_booking, reserve_seats
+)
 
 
-class PropertyViewSet(viewsets.ModelViewSet):
+def parse_stay_dates(check_in, check_out):
+    """Validate a check_in/check_out query param pair"""
+    if not check_in or not check_out:
+        raise ValidationError({'detail': 'check_in and check_out must be given together'})
+    try:
+        check_in = date.fromisoformat(check_in)
+        check_out = date.fromisoformat(check_out)
+    except ValueError:
+        raise ValidationError({'detail': 'Dates must be in YYYY-MM-DD format'})
+    if check_out <= check_in:
+        raise ValidationError({'detail': 'check_out must be after check_in'})
+    return check_in, check_out
+
+
+def parse_guests(guests):
+    if not guests:
+        return None
+    try:
+        guests = int(guests)
+    except ValueError:
+        raise ValidationError({'guests': 'Must be a whole number'})
+    if guests < 1:
+        raise ValidationError({'guests': 'Must be at least 1'})
+    return guests
+
+
+class PropertyViewSet(TranslatedListingsMixin, viewsets.ModelViewSet):
     queryset = Property.objects.all()
     serializer_class = PropertySerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     filterset_fields = ['city', 'state', 'type', 'max_guests', 'instant_book']
     search_fields = ['name', 'location', 'description']
     ordering_fields = ['price_per_night', 'rating', 'created_at']
+    pagination_class = ListingPagination
+    keyset_ordering_fields = ['price_per_night', 'rating']
 
     def get_queryset(self):
-        queryset = Property.objects.filter(is_active=True)
+        queryset = Property.objects.filter(is_active=True).with_listing_data()
         min_price = self.request.query_params.get('min_price', None)
         max_price = self.request.query_params.get('max_price', None)
         min_rating = self.request.query_params.get('min_rating', None)
+        check_in = self.request.query_params.get('check_in', None)
+        check_out = self.request.query_params.get('check_out', None)
+        guests = self.request.query_params.get('guests', None)
 
+        if check_in or check_out:
+            check_in, check_out = parse_stay_dates(check_in, check_out)
+            queryset = queryset.available_between(check_in, check_out, parse_guests(guests))
+        elif guests:
+            queryset = queryset.filter(max_guests__gte=parse_guests(guests))
         if min_price:
             queryset = queryset.filter(price_per_night__gte=min_price)
         if max_price:
@@ -32,45 +91,146 @@ class PropertyViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def availability(self, request, pk=None):
         property = self.get_object()
-        availabilities = PropertyAvailability.objects.filter(property=property)
+        availabilities = PropertyAvailability.objects.filter(property=property).order_by('date')
+        # Optional bounds; see calendar for the compact, bounded form
+        start = request.query_params.get('start')
+        end = request.query_params.get('end')
+        if start or end:
+            start, end = parse_calendar_range(start, end)
+            availabilities = availabilities.filter(date__gte=start, date__lt=end)
         serializer = PropertyAvailabilitySerializer(availabilities, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def calendar(self, request, pk=None):
+        """Availability for [start, end) as spans of equal nights, streamed"""
+        start, end = parse_calendar_range(
+            request.query_params.get('start'), request.query_params.get('end')
+        )
+        # Only the id is needed: skip get_object()'s listing annotations
+        if not str(pk).isdigit() or not Property.objects.filter(pk=pk, is_active=True).exists():
+            raise Http404
+        return calendar_response(request, int(pk), start, end)
+
+    @calendar.mapping.post
+    def update_calendar(self, request, pk=None):
+        """Upsert ``ranges`` of nights in one transaction; hosts and staff only"""
+        for permission in (IsAuthenticated(), IsAccountUser()):
+            if not permission.has_permission(request, self):
+                self.permission_denied(request)
+        ranges = request.data.get('ranges') if isinstance(request.data, dict) else None
+        serializer = CalendarRangeSerializer(data=ranges, many=True, allow_empty=False)
+        serializer.is_valid(raise_exception=True)
+        ranges = serializer.validated_data
+        if (max(span['end'] for span in ranges) - min(span['start'] for span in ranges)).days > MAX_CALENDAR_DAYS:
+            raise ValidationError({'detail': f'An update spans at most {MAX_CALENDAR_DAYS} days'})
+        with transaction.atomic():
+            # Locking the property serializes concurrent updates to its calendar
+            property = get_object_or_404(Property.objects.select_for_update(), pk=pk, is_active=True)
+            if property.host_id != request.user.pk and not request.user.is_staff:
+                self.permission_denied(request, 'Only the host can change this calendar')
+            changes = upsert_calendar(property.pk, ranges)
+        return Response(changes)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsAccountUser])
+    def book(self, request, pk=None):
+        """Book [check_in, check_out) at the calendar's nightly prices"""
+        property = self.get_object()
+        serializer = StayRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        stay = serializer.validated_data
+        try:
+            booking = book_property(
+                property, request.user, stay['check_in'], stay['check_out'], stay['guests'],
+                special_requests=stay['special_requests'], house_rules_accepted=stay['house_rules_accepted'],
+            )
+        except StayUnavailable as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        except ReservationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(PropertyBookingSerializer(booking).data, status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['get'])
     def reviews(self, request, pk=None):
         property = self.get_object()
-        reviews = PropertyReview.objects.filter(property=property)
-        serializer = PropertyReviewSerializer(reviews, many=True)
-        return Response(serializer.data)
+        reviews = (
+            PropertyReview.objects.filter(property=property)
+            .select_related('user').order_by('-created_at', '-pk')
+        )
+        paginator = ReviewPagination()
+        page = paginator.paginate_queryset(reviews, request, view=self)
+        response = paginator.get_paginated_response(PropertyReviewSerializer(page, many=True).data)
+        response.data['summary'] = review_summary(property.pk)
+        return response
 
-class BusViewSet(viewsets.ModelViewSet):
+class BusViewSet(CachedSearchMixin, viewsets.ModelViewSet):
     queryset = Bus.objects.all()
     serializer_class = BusSerializer
+    search_cache = bus_search_cache
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['from_city', 'to_city', 'seat_type', 'operator']
+    filterset_fields = ['seat_type', 'operator']
     search_fields = ['bus_number', 'bus_type']
     ordering_fields = ['departure_time', 'base_fare', 'rating']
+    pagination_class = ListingPagination
+    keyset_ordering_fields = ['departure_time']
 
     def get_queryset(self):
-        queryset = Bus.objects.all()
+        queryset = Bus.objects.select_related('operator')
         from_city = self.request.query_params.get('from_city', None)
         to_city = self.request.query_params.get('to_city', None)
         date = self.request.query_params.get('date', None)
 
         if from_city:
-            queryset = queryset.filter(from_city__icontains=from_city)
+            queryset = queryset.filter(from_city_key=normalize_place(from_city))
         if to_city:
-            queryset = queryset.filter(to_city__icontains=to_city)
+            queryset = queryset.filter(to_city_key=normalize_place(to_city))
         if date:
             queryset = queryset.filter(departure_time__date=date)
 
         return queryset
 
-class TrainViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsAccountUser])
+    def reserve(self, request, pk=None):
+        bus = self.get_object()
+        seats = request.data.get('seats')
+        if not isinstance(seats, list) or not all(isinstance(seat, str) for seat in seats):
+            return Response({'error': 'seats must be a list of seat numbers'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            booking = reserve_seats(bus, seats, request.user)
+        except SeatUnavailable as e:
+            return Response({'error': str(e), 'unavailable_seats': e.seat_numbers}, status=status.HTTP_409_CONFLICT)
+        except ReservationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(BusBookingSerializer(booking).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsAccountUser])
+    def confirm(self, request, pk=None):
+        return self._change_hold(request, confirm_booking)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsAccountUser])
+    def release(self, request, pk=None):
+        return self._change_hold(request, release_booking)
+
+    def _change_hold(self, request, operation):
+        bus = self.get_object()
+        try:
+            booking_id = int(request.data.get('booking_id'))
+        except (TypeError, ValueError):
+            return Response({'error': 'booking_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if not bus.bookings.filter(pk=booking_id, user=request.user).exists():
+            return Response({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            booking = operation(booking_id, request.user)
+        except ReservationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response(BusBookingSerializer(booking).data)
+
+class TrainViewSet(CachedSearchMixin, viewsets.ModelViewSet):
     queryset = Train.objects.all()
     serializer_class = TrainSerializer
+    search_cache = train_search_cache
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['from_station', 'to_station', 'classes_available']
+    filterset_fields = ['classes_available']
     search_fields = ['number', 'name']
     ordering_fields = ['departure_time', 'base_fare']
 
@@ -78,34 +238,55 @@ class TrainViewSet(viewsets.ModelViewSet):
         queryset = Train.objects.all()
         from_station = self.request.query_params.get('from_station', None)
         to_station = self.request.query_params.get('to_station', None)
-        date = self.request.query_params.get('date', None)
+        travel_date = self.request.query_params.get('date', None)
+        class_type = self.request.query_params.get('class_type', None)
+        min_seats = self.request.query_params.get('min_seats', None)
 
         if from_station:
-            queryset = queryset.filter(from_station__icontains=from_station)
+            queryset = queryset.filter(from_station_key=normalize_place(from_station))
         if to_station:
-            queryset = queryset.filter(to_station__icontains=to_station)
+            queryset = queryset.filter(to_station_key=normalize_place(to_station))
+        if travel_date:
+            try:
+                weekday = 1 << date.fromisoformat(travel_date).weekday()
+            except ValueError:
+                raise ValidationError({'detail': 'date must be in YYYY-MM-DD format'})
+            queryset = queryset.alias(runs=F('running_days_mask').bitand(weekday)).filter(runs=weekday)
 
-        return queryset
+        classes = TrainClass.objects.all()
+        if class_type:
+            classes = classes.filter(class_type=class_type)
+        if min_seats:
+            try:
+                classes = classes.filter(available_seats__gte=int(min_seats))
+            except ValueError:
+                raise ValidationError({'detail': 'min_seats must be a number'})
+        if class_type or min_seats:
+            queryset = queryset.filter(Exists(classes.filter(train=OuterRef('pk'))))
+
+        return queryset.prefetch_related(Prefetch('class_details', queryset=classes.order_by('price')))
 
-class HomestayViewSet(viewsets.ModelViewSet):
+class HomestayViewSet(TranslatedListingsMixin, viewsets.ModelViewSet):
     queryset = Homestay.objects.filter(is_active=True)
     serializer_class = HomestaySerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['city', 'country', 'host']
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
+    filterset_fields = ['host']
     search_fields = ['name', 'description', 'address']
     ordering_fields = ['price_per_night', 'rating', 'created_at']
+    pagination_class = ListingPagination
+    keyset_ordering_fields = ['price_per_night', 'rating']
 
     def get_queryset(self):
-        queryset = Homestay.objects.filter(is_active=True)
+        queryset = Homestay.objects.filter(is_active=True).select_related('host')
         city = self.request.query_params.get('city', None)
         country = self.request.query_params.get('country', None)
         min_price = self.request.query_params.get('min_price', None)
         max_price = self.request.query_params.get('max_price', None)
 
         if city:
-            queryset = queryset.filter(city__icontains=city)
+            queryset = queryset.filter(city_key=normalize_place(city))
         if country:
-            queryset = queryset.filter(country__icontains=country)
+            queryset = queryset.filter(country_key=normalize_place(country))
         if min_price:
             queryset = queryset.filter(price_per_night__gte=min_price)
         if max_price:
@@ -113,9 +294,153 @@ class HomestayViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsAccountUser])
+    def book(self, request, pk=None):
+        homestay = self.get_object()
+        serializer = StayRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        stay = serializer.validated_data
+        try:
+            booking = book_homestay(
+                homestay, request.user, stay['check_in'], stay['check_out'], stay['guests'],
+                special_requests=stay['special_requests'] or None,
+            )
+        except StayUnavailable as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        except ReservationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(HomestayBookingSerializer(booking).data, status=status.HTTP_201_CREATED)
+
 class BusOperatorViewSet(viewsets.ModelViewSet):
     queryset = BusOperator.objects.all()
     serializer_class = BusOperatorSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'description']
-    ordering_fields = ['rating', 'total_buses']
\ No newline at end of file
+    ordering_fields = ['rating', 'total_buses']
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def search_cache_stats(request):
+    """Hit/miss counters for the transport search caches in this process"""
+    return Response({
+        'buses': bus_search_cache.stats(),
+        'trains': train_search_cache.stats(),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def ai_latency(request):
+    """AI processing time percentiles over ?hours= (default 24), and this
+    process's log buffer counters"""
+    try:
+        hours = int(request.query_params.get('hours', 24))
+    except ValueError:
+        return Response({'error': 'hours must be a whole number'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'latency': latency_report(hours), 'buffer': ai_log_buffer.stats()})
+
+
+@api_view(['GET'])
+def plan_journeys(request):
+    """Best ?k= (default 3) bus and train itineraries from ?from= to ?to=,
+    leaving from ?departs_after= (ISO datetime) or ?date=, by ?sort=arrival
+    or fare, with ?min_connection= minutes between legs"""
+    params = request.query_params
+    origin, destination = params.get('from'), params.get('to')
+    if not origin or not destination:
+        return Response({'error': 'from and to are required'}, status=status.HTTP_400_BAD_REQUEST)
+    sort = params.get('sort', 'arrival')
+    if sort not in JOURNEY_SORTS:
+        return Response({'error': f"sort must be one of {', '.join(JOURNEY_SORTS)}"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        if params.get('departs_after'):
+            departs_after = datetime.fromisoformat(params['departs_after'])
+            if timezone.is_naive(departs_after):
+                departs_after = timezone.make_aware(departs_after)
+        elif params.get('date'):
+            departs_after = timezone.make_aware(datetime.combine(date.fromisoformat(params['date']), datetime.min.time()))
+        else:
+            departs_after = timezone.now()
+    except ValueError:
+        return Response({'error': 'Dates must be in ISO 8601 format'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        k = min(int(params.get('k', 3)), 10)
+        max_legs = min(int(params.get('max_legs', settings.JOURNEY_MAX_LEGS)), 4)
+        min_connection = params.get('min_connection')
+        min_connection = int(min_connection) if min_connection is not None else None
+    except ValueError:
+        return Response({'error': 'k, max_legs and min_connection must be whole numbers'}, status=status.HTTP_400_BAD_REQUEST)
+    if k < 1 or max_legs < 1 or (min_connection is not None and min_connection < 0):
+        return Response({'error': 'k and max_legs must be positive, min_connection not negative'}, status=status.HTTP_400_BAD_REQUEST)
+
+    itineraries = journey_graph.plan(
+        origin, destination, departs_after, k=k, sort=sort, min_connection=min_connection, max_legs=max_legs
+    )
+    return Response({'from': origin, 'to': destination, 'sort': sort, 'itineraries': itineraries})
+
+
+@api_view(['POST'])
+@authentication_classes([])
+def razorpay_webhook(request):
+    """Store a signed provider callback for the inbox workers and acknowledge it"""
+    if not settings.RAZORPAY_WEBHOOK_SECRET:
+        return Response({'error': 'Webhooks are not configured'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    try:
+        receive_webhook(
+            request.body, request.headers.get('X-Razorpay-Signature'), request.headers.get('X-Razorpay-Event-Id')
+        )
+    except InvalidSignature as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except ValueError:
+        return Response({'error': 'Body must be a JSON object'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'status': 'received'})
+
+
+# (model, key column, display column) sources for place autocomplete
+PLACE_SOURCES = {
+    'bus': [
+        (Bus, 'from_city_key', 'from_city'),
+        (Bus, 'to_city_key', 'to_city'),
+    ],
+    'train': [
+        (Train, 'from_station_key', 'from_station'),
+        (Train, 'to_station_key', 'to_station'),
+    ],
+    'stay': [
+        (Homestay, 'city_key', 'city'),
+        (Property, 'city_key', 'city'),
+    ],
+}
+
+
+@api_view(['GET'])
+def place_autocomplete(request):
+    """Prefix typeahead over the normalized city and station columns"""
+    prefix = normalize_place(request.query_params.get('q', ''))
+    kind = request.query_params.get('kind')
+    if kind and kind not in PLACE_SOURCES:
+        raise ValidationError({'kind': f"Must be one of {', '.join(PLACE_SOURCES)}"})
+    try:
+        limit = min(int(request.query_params.get('limit', 10)), 25)
+    except ValueError:
+        raise ValidationError({'limit': 'Must be a whole number'})
+    if not prefix or limit < 1:
+        return Response({'results': []})
+
+    sources = PLACE_SOURCES[kind] if kind else [s for group in PLACE_SOURCES.values() for s in group]
+    # A key range instead of LIKE so every backend can seek the key index
+    lookups = [
+        model.objects
+        .filter(**{f'{key}__gte': prefix, f'{key}__lt': prefix + '\uffff'})
+        .values_list(key, name)
+        .order_by()
+        .distinct()
+        for model, key, name in sources
+    ]
+    rows = lookups[0].union(*lookups[1:]).order_by(sources[0][1])[:limit * len(sources)]
+
+    names = {}
+    for key, name in rows:
+        names.setdefault(key, name)
+    return Response({'results': list(names.values())[:limit]})
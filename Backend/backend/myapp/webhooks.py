@@ -0,0 +1,331 @@
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import zlib
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connections, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Booking, BusBooking, Payment, PropertyBooking, Transaction, WebhookEvent
+from .reservations import ReservationError, cancel_booking, confirm_booking
+from .stays import cancel_property_booking, release_homestay_booking
+
+logger = logging.getLogger(__name__)
+
+# notes.booking_type on the provider's payment -> booking model
+BOOKING_MODELS = {'homestay': Booking, 'property': PropertyBooking, 'bus': BusBooking}
+# Longest wait between retries of a failing event
+MAX_RETRY_DELAY = 3600
+
+
+class InvalidSignature(Exception):
+    pass
+
+
+class WebhookRejected(Exception):
+    """An event that can never apply; it is failed without retries"""
+
+
+class NeedsReview(Exception):
+    """Money moved but its booking cannot follow; the event is kept for a refund or manual review"""
+
+
+def verify_signature(body, signature, secret):
+    """Razorpay signs the raw body: hex HMAC-SHA256 with the webhook secret"""
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    if not signature or not hmac.compare_digest(expected, signature):
+        raise InvalidSignature('Invalid signature')
+
+
+def payment_entity(payload):
+    return (payload.get('payment') or {}).get('entity') or {}
+
+
+def refund_entity(payload):
+    return (payload.get('refund') or {}).get('entity') or {}
+
+
+def booking_ref(entity):
+    """(booking type, id) from the notes the checkout put on the payment, or None"""
+    notes = entity.get('notes') or {}
+    if not isinstance(notes, dict) or notes.get('booking_type') not in BOOKING_MODELS:
+        return None
+    try:
+        return notes['booking_type'], int(notes.get('booking_id'))
+    except (TypeError, ValueError):
+        return None
+
+
+def ordering_key(data, event_id):
+    """Events of one booking (or, without one, one payment) apply in order"""
+    payload = data.get('payload') or {}
+    entity = payment_entity(payload)
+    ref = booking_ref(entity)
+    if ref:
+        return f'{ref[0]}:{ref[1]}'
+    payment_id = entity.get('id') or refund_entity(payload).get('payment_id')
+    return f'payment:{payment_id}' if payment_id else f'event:{event_id}'
+
+
+def receive_webhook(body, signature, event_id=None):
+    """Verify and store one callback; a repeated event id is ignored.
+
+    Raises InvalidSignature, or ValueError for a body that is not a JSON
+    object. Nothing is applied here: the inbox workers do that.
+    """
+    verify_signature(body, signature, settings.RAZORPAY_WEBHOOK_SECRET)
+    data = json.loads(body)
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+    event_id = (event_id or hashlib.sha256(body).hexdigest())[:100]
+    key = ordering_key(data, event_id)[:100]
+    WebhookEvent.objects.bulk_create([
+        WebhookEvent(
+            event_id=event_id, event_type=str(data.get('event', ''))[:100], body=body.decode(),
+            ordering_key=key, partition=zlib.crc32(key.encode()) % settings.WEBHOOK_PARTITIONS,
+        )
+    ], ignore_conflicts=True)
+
+
+def money(entity, field='amount'):
+    """Provider amounts are in paise/cents"""
+    try:
+        return Decimal(entity[field]) / 100
+    except (KeyError, TypeError, InvalidOperation):
+        raise WebhookRejected(f'Missing {field}')
+
+
+def record_transaction(payment, transaction_type, provider_id, amount, currency, event):
+    Transaction.objects.get_or_create(
+        provider_transaction_id=provider_id, transaction_type=transaction_type,
+        defaults={'payment': payment, 'amount': amount, 'currency': currency, 'metadata': {'event': event.event_id}},
+    )
+
+
+# Booking type -> how a cancellation gives back what the booking held
+CANCELLATIONS = {
+    'homestay': release_homestay_booking,
+    'property': cancel_property_booking,
+    'bus': cancel_booking,
+}
+
+
+def set_booking_status(ref, status, sources):
+    """Move a booking in one of sources to status; returns its status before"""
+    kind, pk = ref
+    booking = BOOKING_MODELS[kind].objects.filter(pk=pk).first()
+    if booking is None:
+        raise WebhookRejected(f'No {kind} booking {pk}')
+    if booking.status not in sources:
+        return booking.status
+    if status == 'confirmed' and kind != 'bus':
+        BOOKING_MODELS[kind].objects.filter(pk=pk, status__in=sources).update(status=status, updated_at=timezone.now())
+        return booking.status
+    try:
+        if status == 'confirmed':
+            confirm_booking(pk, booking.user)
+        else:
+            CANCELLATIONS[kind](pk)
+    except ReservationError as e:
+        raise WebhookRejected(str(e))
+    return booking.status
+
+
+def payment_captured(event, payload):
+    entity = payment_entity(payload)
+    if not entity.get('id'):
+        raise WebhookRejected('No payment in payload')
+    amount, currency = money(entity), entity.get('currency', 'INR')
+    ref = booking_ref(entity)
+    payment = Payment.objects.filter(transaction_id=entity['id']).first()
+    if payment is None and ref and ref[0] == 'homestay':
+        try:
+            with transaction.atomic():
+                payment = Payment.objects.create(
+                    booking_id=ref[1], amount=amount, currency=currency,
+                    payment_method=entity.get('method', ''), status='pending', transaction_id=entity['id'],
+                )
+        except IntegrityError:
+            raise NeedsReview(f'Payment {entity["id"]} captured, but booking {ref[1]} is missing or already has a payment')
+    if payment is not None:
+        Payment.objects.filter(pk=payment.pk, status__in=['pending', 'failed']).update(
+            status='completed', updated_at=timezone.now()
+        )
+        record_transaction(payment, 'payment', entity['id'], amount, currency, event)
+        ref = ref or ('homestay', payment.booking_id)
+    if ref is None:
+        raise NeedsReview(f'Payment {entity["id"]} captured, but it has no booking')
+    # The payment stays recorded when the booking cannot be confirmed
+    try:
+        previous = set_booking_status(ref, 'confirmed', ['pending'])
+    except WebhookRejected as e:
+        raise NeedsReview(f'Payment {entity["id"]} captured, but {e}')
+    if previous not in ('pending', 'confirmed'):
+        raise NeedsReview(f'Payment {entity["id"]} captured for {previous} {ref[0]} booking {ref[1]}')
+
+
+def payment_failed(event, payload):
+    entity = payment_entity(payload)
+    # The booking stays open for another attempt; bus holds lapse on their own
+    Payment.objects.filter(transaction_id=entity.get('id'), status='pending').update(
+        status='failed', updated_at=timezone.now()
+    )
+
+
+def refund_processed(event, payload):
+    refund, entity = refund_entity(payload), payment_entity(payload)
+    if not refund.get('id') or not refund.get('payment_id'):
+        raise WebhookRejected('No refund in payload')
+    amount = money(refund)
+    payment = Payment.objects.filter(transaction_id=refund['payment_id']).first()
+    if payment is not None:
+        record_transaction(payment, 'refund', refund['id'], amount, refund.get('currency', payment.currency), event)
+    if 'amount_refunded' in entity:
+        full = money(entity, 'amount_refunded') >= money(entity)
+    elif payment is not None:
+        full = amount >= payment.amount
+    else:
+        full = False
+    if not full:
+        return
+    if payment is not None:
+        Payment.objects.filter(pk=payment.pk, status='completed').update(status='refunded', updated_at=timezone.now())
+    ref = booking_ref(entity) or (('homestay', payment.booking_id) if payment is not None else None)
+    if ref is not None:
+        set_booking_status(ref, 'cancelled', ['pending', 'confirmed'])
+
+
+HANDLERS = {
+    'payment.captured': payment_captured,
+    'payment.failed': payment_failed,
+    'refund.processed': refund_processed,
+}
+
+
+def retry_delay(attempts):
+    return min(settings.WEBHOOK_RETRY_BASE_SECONDS * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def handle_event(event, now=None):
+    """Apply one event; False if it will be retried, which holds back the
+    later events of its ordering key.
+
+    An event that needs review is committed with what it could apply and
+    marked 'review'; one that can never apply, or runs out of attempts,
+    is marked 'failed'. Neither is retried.
+    """
+    now = now or timezone.now()
+    event.attempts += 1
+    try:
+        with transaction.atomic():
+            handler = HANDLERS.get(event.event_type)
+            event.status, event.processed_at, event.last_error = 'done', now, ''
+            try:
+                if handler is not None:
+                    handler(event, json.loads(event.body).get('payload') or {})
+            except NeedsReview as e:
+                logger.warning('Webhook event %s needs review: %s', event.event_id, e)
+                event.status, event.last_error = 'review', str(e)
+            event.save(update_fields=['status', 'processed_at', 'last_error', 'attempts'])
+        return True
+    except WebhookRejected as e:
+        event.status, event.last_error = 'failed', str(e)
+    except Exception as e:
+        logger.exception('Webhook event %s failed', event.event_id)
+        event.status, event.processed_at = 'pending', None
+        event.last_error = f'{type(e).__name__}: {e}'
+        if event.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+            event.status = 'failed'
+        else:
+            event.next_attempt_at = now + timedelta(seconds=retry_delay(event.attempts))
+    event.save(update_fields=['status', 'processed_at', 'next_attempt_at', 'last_error', 'attempts'])
+    return event.status != 'pending'
+
+
+def process_batch(partitions, batch_size=100, now=None):
+    """Apply up to batch_size due events of the given partitions, oldest
+    first; returns how many were tried.
+
+    Events behind an earlier one of their ordering key that is waiting
+    out a retry are not picked, and a key's remaining events are skipped
+    for this batch once one fails.
+    """
+    now = now or timezone.now()
+    held = WebhookEvent.objects.filter(
+        status='pending', ordering_key=OuterRef('ordering_key'), pk__lt=OuterRef('pk'), next_attempt_at__gt=now
+    )
+    events = (
+        WebhookEvent.objects.filter(status='pending', partition__in=partitions, next_attempt_at__lte=now)
+        .exclude(Exists(held)).order_by('pk')[:batch_size]
+    )
+    blocked, tried = set(), 0
+    for event in events:
+        if event.ordering_key in blocked:
+            continue
+        tried += 1
+        if not handle_event(event, now):
+            blocked.add(event.ordering_key)
+    return tried
+
+
+class WebhookWorkerPool:
+    """Threads draining the webhook inbox.
+
+    Worker n of the pool owns the partitions p with p % workers == n, so
+    all events of a booking are applied by one thread, in order. Run one
+    pool per deployment: two pools would apply events of a key
+    concurrently (each transition is conditional, so not twice).
+    """
+
+    def __init__(self, workers=4, batch_size=100, poll_interval=1.0):
+        self.workers = max(1, min(workers, settings.WEBHOOK_PARTITIONS))
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.stopping = threading.Event()
+        self._lock = threading.Lock()
+        self.tried = 0
+
+    def partitions(self, index):
+        return [p for p in range(settings.WEBHOOK_PARTITIONS) if p % self.workers == index]
+
+    def run(self, drain=False):
+        """Work until stop(), or with ``drain`` until nothing is due"""
+        threads = [
+            threading.Thread(target=self._work, args=(n, drain), name=f'webhook-worker-{n}', daemon=True)
+            for n in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stop()
+            for thread in threads:
+                thread.join()
+        return self.tried
+
+    def stop(self):
+        self.stopping.set()
+
+    def _work(self, index, drain):
+        partitions = self.partitions(index)
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                tried = process_batch(partitions, self.batch_size)
+                with self._lock:
+                    self.tried += tried
+                if not tried:
+                    if drain:
+                        break
+                    self.stopping.wait(self.poll_interval)
+        finally:
+            connections.close_all()